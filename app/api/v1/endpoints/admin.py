@@ -1,10 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.db.database import get_db
-from app.db.models import Config, Order, OrderStatus, User
+from fastapi import APIRouter, Depends, HTTPException, File, Form, UploadFile
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import get_async_db
+from app.db.models import Campaign, CampaignStatus, Config, MessageLog, Order, OrderStatus, ShopifySyncState, User
 from app.api.v1.endpoints.auth import get_current_user
+from app.services.analytics import confirmation_latency, daily_series, status_counts
+from app.core.config import settings
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
+from datetime import datetime, timezone
+import asyncio
+import os
+import shutil
 
 router = APIRouter()
 
@@ -13,6 +20,13 @@ class ConfigUpdate(BaseModel):
     value: str
     description: str = None
 
+class WebhookSecretUpdate(BaseModel):
+    secret: Optional[str] = None
+
+class ShopifyConnectionUpdate(BaseModel):
+    shop_domain: str
+    access_token: str
+
 class OrderSchema(BaseModel):
     id: int
     order_number: str
@@ -24,14 +38,14 @@ class OrderSchema(BaseModel):
         orm_mode = True
 
 @router.get("/analytics")
-def get_analytics(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    # Filter by user
-    query = db.query(Order).filter(Order.user_id == current_user.id)
+async def get_analytics(db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    # Served from the per-day rollup (and cached), not a scan of orders
+    by_status = await status_counts(db, current_user.id)
     
-    total_orders = query.count()
-    confirmed_orders = query.filter(Order.status == OrderStatus.CONFIRMED).count()
-    cancelled_orders = query.filter(Order.status == OrderStatus.CANCELLED).count()
-    delivered_orders = query.filter(Order.status == OrderStatus.DELIVERED).count()
+    total_orders = sum(by_status.values())
+    confirmed_orders = by_status.get(OrderStatus.CONFIRMED, 0)
+    cancelled_orders = by_status.get(OrderStatus.CANCELLED, 0)
+    delivered_orders = by_status.get(OrderStatus.DELIVERED, 0)
     
     return {
         "total_orders": total_orders,
@@ -40,6 +54,28 @@ def get_analytics(db: Session = Depends(get_db), current_user: User = Depends(ge
         "delivery_success_rate": (delivered_orders / total_orders * 100) if total_orders > 0 else 0
     }
 
+def _check_days(days: int):
+    if not 1 <= days <= settings.ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"days must be between 1 and {settings.ANALYTICS_MAX_DAYS}")
+
+@router.get("/analytics/daily")
+async def get_daily_analytics(days: int = 30, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    """
+    Orders created, confirmed, cancelled and delivered per day (UTC) over
+    the last `days`, read from the daily aggregates.
+    """
+    _check_days(days)
+    return {"days": days, "series": await daily_series(db, current_user.id, days)}
+
+@router.get("/analytics/confirmation-latency")
+async def get_confirmation_latency(days: int = 30, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    """
+    Seconds from order creation to confirmation (p50/p90/p99) for orders
+    confirmed in the last `days`, from the latency histograms.
+    """
+    _check_days(days)
+    return {"days": days, **await confirmation_latency(db, current_user.id, days)}
+
 from fastapi import BackgroundTasks
 
 @router.post("/whatsapp/link")
@@ -58,13 +94,94 @@ def link_whatsapp_device(background_tasks: BackgroundTasks, current_user: User =
     background_tasks.add_task(run_linking)
     return {"status": "initiated", "message": "Browser opening... Please scan QR code."}
 
+@router.get("/whatsapp/queue")
+def get_whatsapp_queue(current_user: User = Depends(get_current_user)):
+    """
+    Backlog and send latency of this user's Selenium send queue
+    (as seen by the current process).
+    """
+    from app.services.send_queue import send_queue
+    from app.services.browser_pool import browser_pool
+
+    return {
+        "queue": send_queue.stats().get(current_user.id, {"depth": 0}),
+        "browser_pool": browser_pool.stats()
+    }
+
+@router.get("/metrics")
+def get_metrics(current_user: User = Depends(get_current_user)):
+    """
+    Runtime gauges and counters of this process.
+    """
+    from app.services.http_client import http_clients
+    from app.services.rate_limit import rate_limiter
+    from app.services.resilience import resilience
+    from app.services.ingest import journal_flusher
+    from app.services.user_cache import webhook_users
+    from app.services.shopify import shopify_throttle
+    from app.services.websocket import manager
+    from app.services.events import event_bus
+
+    return {
+        "http_client": http_clients.stats(),
+        "whatsapp_rate_limit": rate_limiter.stats(),
+        "circuit_breakers": resilience.stats(),
+        "webhook_journal": journal_flusher.stats(),
+        "webhook_user_cache": webhook_users.stats(),
+        "shopify_throttle": shopify_throttle.stats(),
+        "websockets": manager.stats(),
+        "event_bus": event_bus.stats()
+    }
+
+@router.put("/shopify/webhook-secret")
+async def set_shopify_webhook_secret(update: WebhookSecretUpdate, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    """
+    Stores the secret Shopify signs this user's webhooks with. Cached
+    copies are dropped on commit.
+    """
+    current_user.shopify_webhook_secret = update.secret or None
+    await db.commit()
+    return {"status": "updated"}
+
+@router.put("/shopify/connection")
+async def set_shopify_connection(update: ShopifyConnectionUpdate, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    """Admin API credentials used to backfill and reconcile this user's orders."""
+    current_user.shopify_shop_domain = update.shop_domain
+    current_user.shopify_access_token = update.access_token
+    await db.commit()
+    return {"status": "updated"}
+
+@router.post("/shopify/sync")
+async def start_shopify_sync(current_user: User = Depends(get_current_user)):
+    from app.worker.tasks import sync_shopify_orders
+    if not current_user.shopify_shop_domain or not current_user.shopify_access_token:
+        raise HTTPException(status_code=400, detail="Shopify is not connected")
+    sync_shopify_orders.delay(current_user.id)
+    return {"status": "queued"}
+
+@router.get("/shopify/sync")
+async def get_shopify_sync(db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    state = await db.get(ShopifySyncState, current_user.id)
+    if state is None:
+        return {"status": "never_run"}
+    return {
+        "status": state.status,
+        "since_id": state.since_id,
+        "updated_at_min": state.updated_at_min,
+        "orders_imported": state.orders_imported,
+        "orders_updated": state.orders_updated,
+        "last_error": state.last_error,
+        "started_at": state.started_at,
+        "finished_at": state.finished_at,
+    }
+
 @router.get("/configs")
-def get_configs(db: Session = Depends(get_db)):
-    return db.query(Config).all()
+async def get_configs(db: AsyncSession = Depends(get_async_db)):
+    return (await db.execute(select(Config))).scalars().all()
 
 @router.post("/configs")
-def update_config(config: ConfigUpdate, db: Session = Depends(get_db)):
-    db_config = db.query(Config).filter(Config.key == config.key).first()
+async def update_config(config: ConfigUpdate, db: AsyncSession = Depends(get_async_db)):
+    db_config = (await db.execute(select(Config).where(Config.key == config.key))).scalars().first()
     if db_config:
         db_config.value = config.value
         if config.description:
@@ -72,11 +189,136 @@ def update_config(config: ConfigUpdate, db: Session = Depends(get_db)):
     else:
         db_config = Config(key=config.key, value=config.value, description=config.description)
         db.add(db_config)
-    db.commit()
+    await db.commit()
     return {"status": "updated"}
 
 @router.get("/orders", response_model=List[OrderSchema])
-def get_orders(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def get_orders(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     # Filter by user
-    orders = db.query(Order).filter(Order.user_id == current_user.id).order_by(Order.created_at.desc()).offset(skip).limit(limit).all()
-    return orders
+    orders = await db.execute(
+        select(Order).where(Order.user_id == current_user.id).order_by(Order.created_at.desc()).offset(skip).limit(limit)
+    )
+    return orders.scalars().all()
+
+def _campaign_summary(campaign: Campaign):
+    done = (campaign.sent or 0) + (campaign.failed or 0)
+    throughput = 0
+    if campaign.started_at:
+        started = campaign.started_at if campaign.started_at.tzinfo else campaign.started_at.replace(tzinfo=timezone.utc)
+        finished = campaign.finished_at or datetime.now(timezone.utc)
+        if finished.tzinfo is None:
+            finished = finished.replace(tzinfo=timezone.utc)
+        elapsed = (finished - started).total_seconds()
+        throughput = round(done / elapsed, 2) if elapsed > 0 else 0
+    return {
+        "id": campaign.id,
+        "template_name": campaign.template_name,
+        "source": campaign.source,
+        "status": campaign.status.value,
+        "sent": campaign.sent or 0,
+        "failed": campaign.failed or 0,
+        "checkpoint": campaign.checkpoint or 0,
+        "messages_per_second": throughput,
+        "started_at": campaign.started_at,
+        "finished_at": campaign.finished_at
+    }
+
+@router.post("/campaigns")
+async def create_campaign(
+    template_name: str = Form(...),
+    language_code: str = Form("en"),
+    statuses: Optional[str] = Form(None),
+    file: Optional[UploadFile] = File(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Sends a template to every recipient of an uploaded CSV (first column =
+    phone), or to the customers of this user's orders (optionally filtered
+    by comma-separated statuses).
+    """
+    source_filter = None
+    if statuses:
+        try:
+            source_filter = {"statuses": [OrderStatus(s.strip()).value for s in statuses.split(",") if s.strip()]}
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Unknown order status")
+
+    campaign = Campaign(
+        user_id=current_user.id,
+        template_name=template_name,
+        language_code=language_code,
+        source="upload" if file else "orders",
+        source_filter=source_filter
+    )
+    db.add(campaign)
+    await db.commit()
+
+    if file:
+        campaign.upload_path = os.path.join(settings.CAMPAIGN_UPLOAD_DIR, f"{campaign.id}.csv")
+        await asyncio.to_thread(_save_upload, file.file, campaign.upload_path)
+        await db.commit()
+
+    from app.worker.tasks import run_campaign
+    run_campaign.apply_async(args=[campaign.id])
+
+    return _campaign_summary(campaign)
+
+def _save_upload(source, path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as out:
+        shutil.copyfileobj(source, out)
+
+# Campaigns a resume may restart; running ones already have a runner
+RESUMABLE_CAMPAIGNS = (CampaignStatus.FAILED,)
+
+async def _get_user_campaign(campaign_id: int, db: AsyncSession, current_user: User):
+    campaign = (await db.execute(
+        select(Campaign).where(Campaign.id == campaign_id, Campaign.user_id == current_user.id)
+    )).scalars().first()
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return campaign
+
+@router.get("/campaigns/{campaign_id}")
+async def get_campaign(campaign_id: int, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    return _campaign_summary(await _get_user_campaign(campaign_id, db, current_user))
+
+@router.post("/campaigns/{campaign_id}/resume")
+async def resume_campaign(campaign_id: int, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    campaign = await _get_user_campaign(campaign_id, db, current_user)
+    # Claimed in one statement, so two clicks can't start two runners
+    # sending to the same recipients
+    claimed = await db.execute(
+        update(Campaign)
+        .where(Campaign.id == campaign.id, Campaign.status.in_(RESUMABLE_CAMPAIGNS))
+        .values(status=CampaignStatus.PENDING, finished_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    if claimed.rowcount != 1:
+        raise HTTPException(status_code=409, detail=f"Campaign is {campaign.status.value}; only failed campaigns can be resumed")
+    await db.commit()
+    await db.refresh(campaign)
+
+    from app.worker.tasks import run_campaign
+    run_campaign.apply_async(args=[campaign.id])
+    return _campaign_summary(campaign)
+
+@router.get("/campaigns/{campaign_id}/results")
+async def get_campaign_results(campaign_id: int, status: Optional[str] = None, skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    await _get_user_campaign(campaign_id, db, current_user)
+    query = select(MessageLog).where(MessageLog.campaign_id == campaign_id)
+    if status:
+        query = query.where(MessageLog.status == status)
+    logs = await db.execute(query.order_by(MessageLog.id).offset(skip).limit(limit))
+    return [
+        {
+            "recipient": log.recipient,
+            "status": log.status,
+            "whatsapp_message_id": log.whatsapp_message_id,
+            "error": log.content,
+            "latency_ms": log.latency_ms,
+            "sent_at": log.sent_at
+        }
+        for log in logs.scalars()
+    ]
@@ -1,11 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
-from app.db.database import get_db
+from app.db.database import get_async_db
 from app.db.models import User
 from app.core.security import get_password_hash, verify_password, create_access_token
 from datetime import timedelta
+import asyncio
 import logging
 
 # Configure logging
@@ -25,17 +27,17 @@ class Token(BaseModel):
     token_type: str
 
 @router.post("/signup", response_model=Token)
-def signup(user: UserCreate, db: Session = Depends(get_db)):
+async def signup(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     try:
-        db_user = db.query(User).filter(User.email == user.email).first()
+        db_user = (await db.execute(select(User).where(User.email == user.email))).scalars().first()
         if db_user:
             raise HTTPException(status_code=400, detail="Email already registered")
         
-        hashed_password = get_password_hash(user.password)
+        # Argon2 is deliberately slow; keep it off the event loop
+        hashed_password = await asyncio.to_thread(get_password_hash, user.password)
         new_user = User(email=user.email, hashed_password=hashed_password)
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
         
         access_token = create_access_token(data={"sub": str(new_user.id)})
         return {"access_token": access_token, "token_type": "bearer"}
@@ -45,9 +47,9 @@ def signup(user: UserCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = (await db.execute(select(User).where(User.email == form_data.username))).scalars().first()
+    if not user or not await asyncio.to_thread(verify_password, form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -61,7 +63,7 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
 from jose import JWTError, jwt
 from app.core.security import SECRET_KEY, ALGORITHM
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -79,7 +81,7 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         print(f"Auth Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
         
-    user = db.query(User).filter(User.id == int(user_id)).first()
+    user = await db.get(User, int(user_id))
     if user is None:
         raise credentials_exception
     return user
@@ -1,94 +1,101 @@
 from fastapi import APIRouter, Request, HTTPException, Header, Depends
-from sqlalchemy.orm import Session
-from app.db.database import get_db
-from app.db.models import Order, OrderStatus, User
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import get_async_db
+from app.db.models import Order, OrderStatus
+from app.core.cache import TTLCache
 from app.core.config import settings
+from app.db.upsert import async_insert_ignore
+from app.schemas.webhooks import ShopifyOrderPayload, parse_payload
+from app.services.analytics import record_transitions_async
+from app.services.ingest import new_order_event, order_journal, order_values
+from app.services.user_cache import webhook_users
 import hmac
-import hashlib
 import base64
-import json
 import logging
 
 router = APIRouter()
 
 logger = logging.getLogger(__name__)
 
-async def verify_shopify_webhook(request: Request, x_shopify_hmac_sha256: str = Header(None)):
+async def verify_shopify_webhook(
+    user_id: int,
+    request: Request,
+    x_shopify_hmac_sha256: str = Header(None),
+    db: AsyncSession = Depends(get_async_db)
+) -> bytes:
+    """Reads the raw body once, verifies its HMAC with the user's secret and hands it on."""
     if not x_shopify_hmac_sha256:
         raise HTTPException(status_code=401, detail="Missing HMAC header")
     
+    # Cached: no query unless the user is new to this process
+    user = await webhook_users.get(db, user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    if not user.is_active:
+        raise HTTPException(status_code=403, detail="User is inactive")
+    
     body = await request.body()
-    secret = settings.SHOPIFY_WEBHOOK_SECRET.encode('utf-8')
-    digest = hmac.new(secret, body, hashlib.sha256).digest()
-    computed_hmac = base64.b64encode(digest).decode('utf-8')
+    try:
+        received = base64.b64decode(x_shopify_hmac_sha256, validate=True)
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Invalid HMAC signature")
     
-    if not hmac.compare_digest(computed_hmac, x_shopify_hmac_sha256):
+    if not hmac.compare_digest(user.sign(body), received):
         raise HTTPException(status_code=401, detail="Invalid HMAC signature")
-    return True
+    return body
+
+# Shopify retries a delivery with the same X-Shopify-Webhook-Id; remember
+# the ones already handled so retries don't reach the database.
+processed_webhooks = TTLCache(maxsize=settings.WEBHOOK_DEDUPE_CACHE_SIZE, ttl=settings.WEBHOOK_DEDUPE_TTL)
 
 @router.post("/{user_id}/orders/create")
 async def handle_order_create(
     user_id: int,
-    request: Request, 
-    db: Session = Depends(get_db),
-    verified: bool = Depends(verify_shopify_webhook)
+    db: AsyncSession = Depends(get_async_db),
+    body: bytes = Depends(verify_shopify_webhook),
+    x_shopify_webhook_id: str = Header(None)
 ):
-    # Verify user exists
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    if x_shopify_webhook_id and x_shopify_webhook_id in processed_webhooks:
+        logger.info(f"Webhook {x_shopify_webhook_id} already processed. Skipping.")
+        return {"status": "skipped", "reason": "duplicate"}
+
+    if settings.WEBHOOK_INGEST_MODE == "journal":
+        # Ack first: durably journal the raw body and let the flusher
+        # create the order
+        await order_journal.append_async(user_id, body, x_shopify_webhook_id)
+        if x_shopify_webhook_id:
+            processed_webhooks.set(x_shopify_webhook_id, True)
+        return {"status": "accepted"}
 
-    payload = await request.json()
-    logger.info(f"Received order create webhook for user {user_id}: {payload.get('id')}")
+    try:
+        order = parse_payload(ShopifyOrderPayload, body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid order payload: {e}")
+    logger.info(f"Received order create webhook for user {user_id}: {order.id}")
     
     # Extract relevant data
-    shopify_order_id = str(payload.get("id"))
-    order_number = str(payload.get("order_number"))
-    customer = payload.get("customer", {})
-    customer_phone = customer.get("phone") or payload.get("phone")
-    customer_name = f"{customer.get('first_name', '')} {customer.get('last_name', '')}".strip()
-    total_price = payload.get("total_price")
-    currency = payload.get("currency")
+    values = order_values(user_id, order)
     
-    # Check if order already exists
-    existing_order = db.query(Order).filter(Order.shopify_order_id == shopify_order_id).first()
-    if existing_order:
-        logger.info(f"Order {order_number} already exists. Skipping.")
+    # Create the order unless it already exists; concurrent retries of the
+    # same order can't both get past this
+    order_id = await async_insert_ignore(db, Order, values, "shopify_order_id")
+    if order_id is not None:
+        await record_transitions_async(db, [(user_id, None, None, values["status"])])
+    await db.commit()
+
+    if x_shopify_webhook_id:
+        processed_webhooks.set(x_shopify_webhook_id, True)
+
+    if order_id is None:
+        logger.info(f"Order {values['order_number']} already exists. Skipping.")
         return {"status": "skipped", "reason": "duplicate"}
     
-    # Create new order linked to user
-    new_order = Order(
-        user_id=user.id,
-        shopify_order_id=shopify_order_id,
-        order_number=order_number,
-        customer_phone=customer_phone,
-        customer_name=customer_name,
-        total_price=total_price,
-        currency=currency,
-        financial_status=payload.get("financial_status"),
-        fulfillment_status=payload.get("fulfillment_status"),
-        status=OrderStatus.PENDING
-    )
-    
-    db.add(new_order)
-    db.commit()
-    db.refresh(new_order)
-    
     # Trigger async task
     from app.worker.tasks import send_order_confirmation
-    send_order_confirmation.apply_async(args=[new_order.id], countdown=10)
+    send_order_confirmation.apply_async(args=[order_id], countdown=10)
     
-    # Broadcast to WebSocket clients (TODO: Filter by user)
-    from app.services.websocket import manager
-    await manager.broadcast({
-        "type": "new_order",
-        "data": {
-            "order_number": new_order.order_number,
-            "customer_name": new_order.customer_name,
-            "total_price": new_order.total_price,
-            "status": new_order.status.value,
-            "delivery_slot": new_order.delivery_slot
-        }
-    })
+    # Only this merchant's dashboards, on whichever API process holds them
+    from app.services.events import event_bus
+    await event_bus.publish_async(user_id, new_order_event(values))
     
-    return {"status": "success", "order_id": new_order.id}
+    return {"status": "success", "order_id": order_id}
@@ -1,8 +1,12 @@
-from fastapi import APIRouter, Request, HTTPException, Depends
-from sqlalchemy.orm import Session
-from app.db.database import get_db
+from fastapi import APIRouter, Request, HTTPException, Header, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import get_async_db
 from app.db.models import Order, OrderStatus, MessageLog
 from app.core.config import settings
+from app.schemas.webhooks import WhatsAppWebhookPayload, parse_payload
+from app.services.analytics import set_order_status_async
+import hashlib
+import hmac
 import logging
 
 router = APIRouter()
@@ -25,58 +29,85 @@ async def verify_whatsapp_webhook(request: Request):
             raise HTTPException(status_code=403, detail="Verification failed")
     return {"status": "ok"}
 
+async def verify_whatsapp_signature(request: Request, x_hub_signature_256: str = Header(None)) -> bytes:
+    """
+    Reads the raw body once and, when WHATSAPP_APP_SECRET is set, checks
+    Meta's X-Hub-Signature-256 over it.
+    """
+    body = await request.body()
+    if settings.WHATSAPP_APP_SECRET:
+        if not x_hub_signature_256:
+            raise HTTPException(status_code=401, detail="Missing signature header")
+        expected = "sha256=" + hmac.new(settings.WHATSAPP_APP_SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected, x_hub_signature_256):
+            raise HTTPException(status_code=401, detail="Invalid signature")
+    return body
+
 @router.post("/whatsapp")
-async def handle_whatsapp_message(request: Request, db: Session = Depends(get_db)):
-    payload = await request.json()
+async def handle_whatsapp_message(body: bytes = Depends(verify_whatsapp_signature), db: AsyncSession = Depends(get_async_db)):
+    try:
+        payload = parse_payload(WhatsAppWebhookPayload, body)
+    except ValueError as e:
+        # Acknowledge anyway; Meta would keep redelivering a malformed body
+        logger.error(f"Invalid WhatsApp webhook payload: {e}")
+        return {"status": "invalid payload"}
     
-    # Basic parsing of the payload
     try:
-        entry = payload.get("entry", [])[0]
-        changes = entry.get("changes", [])[0]
-        value = changes.get("value", {})
-        messages = value.get("messages", [])
+        message = payload.first_message()
         
-        if not messages:
+        if not message:
             return {"status": "no messages"}
             
-        message = messages[0]
-        from_number = message.get("from")
-        msg_type = message.get("type")
+        from_number = message.from_
+        msg_type = message.type
         
-        if msg_type == "interactive":
-            interactive = message.get("interactive")
-            inter_type = interactive.get("type")
+        if msg_type == "interactive" and message.interactive:
+            interactive = message.interactive
+            inter_type = interactive.type
             
-            if inter_type == "button_reply":
-                reply = interactive.get("button_reply")
-                button_id = reply.get("id")
+            if inter_type == "button_reply" and interactive.button_reply:
+                button_id = interactive.button_reply.id
                 # ... (existing button logic) ...
                 action, order_id = button_id.split("_")
                 order_id = int(order_id)
                 
-                order = db.query(Order).filter(Order.id == order_id).first()
+                order = await db.get(Order, order_id)
                 if not order: return {"status": "error"}
 
+                moved = None
                 if action == "confirm":
-                    order.status = OrderStatus.CONFIRMED
-                    logger.info(f"Order {order_id} confirmed.")
-                    # Trigger Delivery Reminder after some time (e.g., 1 minute for demo)
-                    from app.worker.tasks import send_delivery_reminder
-                    send_delivery_reminder.apply_async(args=[order_id], countdown=60)
+                    # Conditional: a concurrent auto-cancel or sync may have moved it
+                    if await set_order_status_async(db, order, OrderStatus.CONFIRMED):
+                        moved = OrderStatus.CONFIRMED
+                        logger.info(f"Order {order_id} confirmed.")
+                        # Trigger Delivery Reminder after some time (e.g., 1 minute for demo)
+                        from app.worker.tasks import send_delivery_reminder
+                        send_delivery_reminder.apply_async(args=[order_id], countdown=60)
                     
                 elif action == "cancel":
-                    order.status = OrderStatus.CANCELLED
-                    logger.info(f"Order {order_id} cancelled.")
+                    if await set_order_status_async(db, order, OrderStatus.CANCELLED):
+                        moved = OrderStatus.CANCELLED
+                        logger.info(f"Order {order_id} cancelled.")
                 
                 elif action == "address":
                     # In a real app, we'd set a state to expect text input next
                     pass
                 
-                db.commit()
+                user_id, order_number = order.user_id, order.order_number
+                await db.commit()
+
+                if moved is not None:
+                    # Status update for the merchant's dashboards
+                    from app.services.events import event_bus
+                    await event_bus.publish_async(user_id, {
+                        "type": "status_update",
+                        "order_id": order_id,
+                        "order_number": order_number,
+                        "status": moved.value
+                    })
 
-            elif inter_type == "list_reply":
-                reply = interactive.get("list_reply")
-                list_id = reply.get("id") # e.g., slot_morning_123
+            elif inter_type == "list_reply" and interactive.list_reply:
+                list_id = interactive.list_reply.id # e.g., slot_morning_123
                 
                 parts = list_id.split("_")
                 # slot, morning, 123
@@ -84,10 +115,10 @@ async def handle_whatsapp_message(request: Request, db: Session = Depends(get_db
                     slot_time = parts[1]
                     order_id = int(parts[2])
                     
-                    order = db.query(Order).filter(Order.id == order_id).first()
+                    order = await db.get(Order, order_id)
                     if order:
                         order.delivery_slot = slot_time
-                        db.commit()
+                        await db.commit()
                         
                         # Ask for instructions
                         # For simplicity, we just acknowledge
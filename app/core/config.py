@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Optional
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "Shopify WhatsApp Integration"
@@ -11,17 +11,120 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str = "" # Update this!
     POSTGRES_DB: str = "shopify_whatsapp"
     DATABASE_URL: str = "mysql+pymysql://root:@localhost/shopify_whatsapp"
+    ASYNC_DATABASE_URL: Optional[str] = None # Defaults to DATABASE_URL with its async driver
 
     # Shopify
     SHOPIFY_WEBHOOK_SECRET: str = "your_webhook_secret"
+    SHOPIFY_SHOP_URL: str = "your-shop.myshopify.com" # Default shop for users without their own
+    SHOPIFY_ACCESS_TOKEN: str = "your_access_token"
+    SHOPIFY_API_VERSION: str = "2024-07" # orderCancel needs 2024-04+
+    SHOPIFY_SYNC_PAGE_SIZE: int = 250 # Orders per Admin API page (Shopify's maximum)
+    SHOPIFY_SYNC_BATCH_SIZE: int = 500 # Orders per upsert
+    SHOPIFY_SYNC_OVERLAP: int = 300 # Seconds re-read on each incremental run
+    SHOPIFY_SYNC_CONFIRM_WITHIN: int = 86400 # Imported orders younger than this get a confirmation
+    SHOPIFY_SYNC_INTERVAL: float = 3600.0 # Seconds between scheduled syncs
+    SHOPIFY_SYNC_STALE_AFTER: int = 7200 # A run still "running" after this many seconds is presumed dead
+    SHOPIFY_REST_BUCKET_SIZE: int = 40 # Assumed until a shop reports its own (Plus: 400)
+    SHOPIFY_REST_LEAK_RATE: float = 2.0 # Calls per second
+    SHOPIFY_GRAPHQL_BUCKET_SIZE: float = 1000.0 # Cost points
+    SHOPIFY_GRAPHQL_RESTORE_RATE: float = 50.0 # Points per second
+    SHOPIFY_GRAPHQL_BATCH_SIZE: int = 25 # Order mutations per GraphQL request
+    SHOPIFY_THROTTLE_HEADROOM: float = 0.9 # Share of a bucket we fill before waiting
+    WEBHOOK_DEDUPE_TTL: int = 172800 # Shopify retries a webhook for up to 48 hours
+    WEBHOOK_DEDUPE_CACHE_SIZE: int = 100000 # X-Shopify-Webhook-Id values remembered
+    USER_CACHE_TTL: int = 300 # Seconds another process may use a changed secret
+    USER_CACHE_NEGATIVE_TTL: int = 30 # Seconds an unknown user id is remembered
+    USER_CACHE_SIZE: int = 10000
+    WEBHOOK_INGEST_MODE: str = "direct" # Options: "direct" (insert per request), "journal" (ack first, flush in batches)
+    WEBHOOK_JOURNAL_DIR: str = "webhook_journal"
+    WEBHOOK_JOURNAL_SEGMENT_BYTES: int = 16 * 1024 * 1024
+    WEBHOOK_JOURNAL_FSYNC: bool = True # fsync every append before acknowledging
+    WEBHOOK_JOURNAL_FLUSH_BATCH: int = 500 # Orders per INSERT
+    WEBHOOK_JOURNAL_FLUSH_INTERVAL: float = 0.2 # Seconds between flushes
     
     # WhatsApp
     WHATSAPP_API_TOKEN: str = "your_whatsapp_token"
     WHATSAPP_PHONE_NUMBER_ID: str = "your_phone_number_id"
     WHATSAPP_PROVIDER: str = "selenium" # Options: "official", "selenium"
+    WHATSAPP_APP_SECRET: Optional[str] = None # Verifies X-Hub-Signature-256 on incoming webhooks when set
+
+    # WhatsApp throughput limits (messages per second per phone number ID)
+    WHATSAPP_RATE_LIMIT_DEFAULT: float = 20.0 # Shared default number
+    WHATSAPP_RATE_LIMITS_BY_TIER: Dict[int, float] = {1: 20.0, 2: 40.0, 3: 80.0} # Merchant-owned numbers
+    WHATSAPP_RATE_LIMIT_BURST_SECONDS: float = 1.0 # Bucket size, in seconds of throughput
+    WHATSAPP_RATE_LIMIT_MAX_WAIT: float = 300.0 # Seconds a send may queue before giving up
+    WHATSAPP_RETRY_AFTER_DEFAULT: float = 5.0 # Pause when a 429 carries no Retry-After
+    RATE_LIMIT_BACKEND: str = "local" # Options: "local", "redis" (shared across workers)
+    WHATSAPP_BULK_CONCURRENCY: int = 10 # Sends in flight per bulk campaign
+    CAMPAIGN_CHECKPOINT_EVERY: int = 50 # Results logged per checkpoint write
+    CAMPAIGN_UPLOAD_DIR: str = "campaign_uploads"
+
+    # Selenium browser pool (one warm Chrome per linked user profile)
+    BROWSER_POOL_MAX_BROWSERS: int = 4
+    BROWSER_POOL_IDLE_TIMEOUT: int = 900 # Seconds before an unused browser is closed
+    BROWSER_POOL_CHECKOUT_TIMEOUT: int = 120 # Seconds to wait for a free browser
+    SELENIUM_PROFILE_DIR: str = "chrome_data" # One Chrome profile (WhatsApp Web login) per user
+    SELENIUM_LOCK_DIR: str = "chrome_data" # <user_id>.lock files guarding those profiles
+    SELENIUM_IN_APP_NAV_TIMEOUT: int = 8 # Seconds before falling back to a full page load
+    SELENIUM_ACK_TIMEOUT: int = 20 # Seconds to wait for the sent tick
+    SELENIUM_VERIFY_DELAY: int = 120 # Seconds before looking again for a message that got no tick
+    SEND_QUEUE_BATCH_SIZE: int = 20 # Messages sent per browser checkout
+    SEND_QUEUE_IDLE_TIMEOUT: int = 30 # Seconds before an empty account drainer exits
+    SEND_QUEUE_RESULT_TIMEOUT: int = 600 # Seconds a task waits for its queued message
     
+    # Outbound HTTP (WhatsApp Graph API, Shopify Admin API)
+    HTTP_CLIENT_HTTP2: bool = True
+    HTTP_CLIENT_MAX_CONNECTIONS: int = 100
+    HTTP_CLIENT_MAX_KEEPALIVE: int = 20
+    HTTP_CLIENT_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP_CLIENT_TIMEOUT: float = 15.0
+    HTTP_CLIENT_CONNECT_TIMEOUT: float = 5.0
+    HTTP_CLIENT_POOL_TIMEOUT: float = 10.0
+
+    # Retries and circuit breaking for outbound APIs
+    OUTBOUND_RETRIES: int = 2 # In-call retries before giving up
+    OUTBOUND_BACKOFF_BASE: float = 0.5
+    OUTBOUND_BACKOFF_CAP: float = 10.0
+    CIRCUIT_FAILURE_THRESHOLD: int = 5 # Consecutive failures that open a host's circuit
+    CIRCUIT_RESET_TIMEOUT: float = 30.0 # Seconds before a probe request is allowed
+    TASK_MAX_RETRIES: int = 5 # Celery-level retries of a failed outbound call
+    TASK_RETRY_BACKOFF_BASE: float = 30.0
+    TASK_RETRY_BACKOFF_CAP: float = 1800.0
+
     # Redis / Celery
     REDIS_URL: str = "redis://localhost:6379/0"
+    TASK_BACKEND: str = "local" # Options: "celery" (Redis broker), "local" (in-process runner), "eager" (inline)
+    LOCAL_RUNNER_WORKERS: int = 4
+    LOCAL_RUNNER_POLL_INTERVAL: float = 1.0
+    LOCAL_RUNNER_LEASE_SECONDS: int = 900 # Jobs of a crashed process are re-run after this
+    WORKER_ASYNC_TASKS: bool = False # Fire-and-forget official API sends on the worker loop
+    WORKER_MAX_IN_FLIGHT: int = 50 # Coroutines running at once on the worker loop
+
+    # Order follow-ups (reminder, then auto-cancel)
+    FOLLOWUP_REMINDER_DELAY: int = 86400 # Seconds after the confirmation message
+    FOLLOWUP_CANCEL_DELAY: int = 86400 # Seconds after the reminder
+    FOLLOWUP_SWEEP_INTERVAL: float = 60.0
+    FOLLOWUP_BATCH_SIZE: int = 200 # Orders claimed per batch
+    FOLLOWUP_MAX_BATCHES: int = 50 # Batches per sweep run
+    FOLLOWUP_CLAIM_LEASE: int = 600 # Seconds before a claimed follow-up is retried
+    CANCEL_CONCURRENCY: int = 10 # Shopify cancellations / notices in flight per batch
+    ANALYTICS_CACHE_TTL: float = 60.0 # Bounds staleness from status changes made in other processes
+    ANALYTICS_CACHE_SIZE: int = 10000
+    ANALYTICS_MAX_DAYS: int = 365 # Longest window of the daily charts
+
+    # Dashboard WebSockets
+    WS_SEND_QUEUE_SIZE: int = 100 # Events buffered per connection
+    WS_SLOW_CONSUMER_POLICY: str = "drop_oldest" # Options: "drop_oldest", "disconnect"
+    WS_SEND_TIMEOUT: float = 10.0 # Seconds one send may take before the socket is dropped
+    WS_PING_INTERVAL: float = 25.0 # Seconds between heartbeats to each dashboard
+    WS_PONG_TIMEOUT: float = 10.0 # Silence beyond one interval plus this reaps the socket
+    WS_MAX_CONNECTIONS: int = 10000 # Per API process
+    WS_MAX_CONNECTIONS_PER_USER: int = 20
+    WS_REPLAY_BUFFER: int = 200 # Recent events kept per user for reconnecting dashboards
+    WS_REPLAY_TTL: float = 900.0 # Seconds a quiet user's history is kept
+    WS_REPLAY_USERS: int = 10000 # Users with a history, at most
+    EVENT_BUS_BACKEND: str = "local" # Options: "local" (tasks in the API process), "redis" (Celery / several API workers)
+    EVENT_BUS_CHANNEL_PREFIX: str = "ws:" # Redis channel per user: ws:<user_id>
 
     class Config:
         env_file = ".env"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, JSON, Enum, Text
+from sqlalchemy import Column, BigInteger, Integer, String, Boolean, Date, DateTime, ForeignKey, JSON, Enum, Text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -11,6 +11,12 @@ class OrderStatus(str, enum.Enum):
     SHIPPED = "shipped"
     DELIVERED = "delivered"
 
+class CampaignStatus(str, enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
 class Merchant(Base):
     __tablename__ = "merchants"
     
@@ -32,6 +38,9 @@ class User(Base):
     email = Column(String(255), unique=True, index=True)
     hashed_password = Column(String(255))
     is_active = Column(Boolean, default=True)
+    shopify_webhook_secret = Column(String(255), nullable=True) # Falls back to SHOPIFY_WEBHOOK_SECRET
+    shopify_shop_domain = Column(String(255), nullable=True) # e.g. my-store.myshopify.com
+    shopify_access_token = Column(String(255), nullable=True) # Admin API token, for order sync
     
     orders = relationship("Order", back_populates="user")
 
@@ -59,6 +68,11 @@ class Order(Base):
     tracking_url = Column(String(255), nullable=True)
     courier_name = Column(String(255), nullable=True)
     
+    # Follow-up scheduling (reminder, then auto-cancel), swept by due time
+    followup_stage = Column(String(50), nullable=True)
+    followup_due_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    followup_attempts = Column(Integer, default=0)
+    
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -71,13 +85,40 @@ class MessageLog(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, ForeignKey("orders.id"))
+    campaign_id = Column(Integer, ForeignKey("campaigns.id"), nullable=True, index=True)
+    recipient = Column(String(255), nullable=True) # Phone for messages not tied to an order
     message_type = Column(String(50)) 
     status = Column(String(50)) 
     whatsapp_message_id = Column(String(255))
     content = Column(String(1000)) # Longer for content
+    latency_ms = Column(Integer, nullable=True) # Send-to-ack time reported by the sender
     sent_at = Column(DateTime(timezone=True), server_default=func.now())
 
     order = relationship("Order", back_populates="logs")
+    campaign = relationship("Campaign", back_populates="logs")
+
+class Campaign(Base):
+    __tablename__ = "campaigns"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    template_name = Column(String(255))
+    language_code = Column(String(50), default="en")
+    source = Column(String(50)) # "orders" or "upload"
+    source_filter = Column(JSON, nullable=True) # e.g. {"statuses": ["delivered"]}
+    upload_path = Column(String(255), nullable=True)
+    status = Column(Enum(CampaignStatus), default=CampaignStatus.PENDING)
+
+    # Progress: recipients [0, checkpoint) are done and logged
+    checkpoint = Column(Integer, default=0)
+    sent = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    logs = relationship("MessageLog", back_populates="campaign")
 
 class Config(Base):
     __tablename__ = "configs"
@@ -85,3 +126,71 @@ class Config(Base):
     key = Column(String(255), primary_key=True, index=True)
     value = Column(String(255))
     description = Column(String(255))
+
+class BackgroundJob(Base):
+    """Persistent queue for the in-process job runner (TASK_BACKEND=local)."""
+    __tablename__ = "background_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    task_name = Column(String(255))
+    args = Column(JSON, nullable=True)
+    kwargs = Column(JSON, nullable=True)
+    status = Column(String(50), default="queued", index=True) # queued, running, done, failed, retried
+    eta = Column(DateTime(timezone=True), index=True)
+    locked_until = Column(DateTime(timezone=True), nullable=True) # Lease of the runner executing it
+    retries = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class ShopifySyncState(Base):
+    """Per-user cursor of the Shopify order sync, so runs are incremental."""
+    __tablename__ = "shopify_sync_state"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    since_id = Column(BigInteger, default=0) # Highest Shopify order id imported
+    updated_at_min = Column(DateTime(timezone=True), nullable=True) # Reconcile changes after this
+    status = Column(String(50), default="idle") # idle, running, failed
+    orders_imported = Column(Integer, default=0)
+    orders_updated = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+class OrderStatusRollup(Base):
+    """
+    Orders per user, creation day and current status. Every status change
+    moves one count between rows in the same transaction (see
+    app.services.analytics); rebuild_rollup.py rebuilds it from orders.
+    """
+    __tablename__ = "order_status_rollup"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    status = Column(Enum(OrderStatus), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class OrderDailyStats(Base):
+    """
+    Order events per user and day: "created" on the creation day, and
+    "confirmed", "cancelled" and "delivered" on the day the order reached
+    that status. Feeds the daily charts without scanning orders.
+    """
+    __tablename__ = "order_daily_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    metric = Column(String(50), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class ConfirmationLatencyStats(Base):
+    """
+    Histogram of order-creation-to-confirmation times per user and
+    confirmation day; bucket indexes app.services.analytics.LATENCY_BOUNDS.
+    """
+    __tablename__ = "confirmation_latency_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    bucket = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
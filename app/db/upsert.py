@@ -0,0 +1,132 @@
+from sqlalchemy import and_, insert, update
+from sqlalchemy.exc import IntegrityError
+
+def _insert_ignore_statement(dialect: str, model, values: dict, conflict_column: str):
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        return (
+            dialect_insert(model).values(**values)
+            .on_conflict_do_nothing(index_elements=[conflict_column])
+            .returning(model.id)
+        )
+    if dialect == "mysql":
+        # ON DUPLICATE KEY UPDATE can't tell "inserted" from "already there"
+        # once the driver reports found rows; INSERT IGNORE affects 0 rows.
+        return insert(model).values(**values).prefix_with("IGNORE")
+    return None
+
+def _inserted_id(dialect: str, result):
+    if dialect == "mysql":
+        return result.lastrowid if result.rowcount else None
+    return result.scalar()
+
+def insert_ignore(db, model, values: dict, conflict_column: str):
+    """
+    Inserts a row unless one with the same unique conflict_column exists,
+    in a single statement. Returns the new primary key, or None when the
+    row was already there. The caller commits.
+    """
+    dialect = db.get_bind().dialect.name
+    stmt = _insert_ignore_statement(dialect, model, values, conflict_column)
+    if stmt is not None:
+        return _inserted_id(dialect, db.execute(stmt))
+
+    # Anything else: plain INSERT inside a savepoint
+    try:
+        with db.begin_nested():
+            return db.execute(insert(model).values(**values)).inserted_primary_key[0]
+    except IntegrityError:
+        return None
+
+async def async_insert_ignore(db, model, values: dict, conflict_column: str):
+    """insert_ignore() for an AsyncSession."""
+    dialect = db.get_bind().dialect.name
+    stmt = _insert_ignore_statement(dialect, model, values, conflict_column)
+    if stmt is not None:
+        return _inserted_id(dialect, await db.execute(stmt))
+
+    try:
+        async with db.begin_nested():
+            return (await db.execute(insert(model).values(**values))).inserted_primary_key[0]
+    except IntegrityError:
+        return None
+
+def insert_ignore_many(db, model, rows: list, conflict_column: str):
+    """
+    Multi-row insert_ignore(). Returns (id, conflict value) for the rows
+    that were inserted; rows that already existed are left out.
+    """
+    if not rows:
+        return []
+    dialect = db.get_bind().dialect.name
+    key = getattr(model, conflict_column)
+
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = (
+            dialect_insert(model).values(rows)
+            .on_conflict_do_nothing(index_elements=[conflict_column])
+            .returning(model.id, key)
+        )
+        return [tuple(row) for row in db.execute(stmt)]
+
+    # MySQL can't report which rows of a multi-row INSERT IGNORE were new;
+    # fall back to one statement per row within the caller's transaction.
+    inserted = []
+    for values in rows:
+        new_id = insert_ignore(db, model, values, conflict_column)
+        if new_id is not None:
+            inserted.append((new_id, values[conflict_column]))
+    return inserted
+
+def _increment_statement(dialect: str, model, rows: list, keys: list, column: str):
+    current = getattr(model, column)
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(model).values(rows)
+        return stmt.on_conflict_do_update(index_elements=keys, set_={column: current + stmt.excluded[column]})
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        stmt = dialect_insert(model).values(rows)
+        return stmt.on_duplicate_key_update({column: current + stmt.inserted[column]})
+    return None
+
+def _increment_fallback(model, values: dict, keys: list, column: str):
+    match = and_(*(getattr(model, key) == values[key] for key in keys))
+    return update(model).where(match).values({column: getattr(model, column) + values[column]})
+
+def increment_many(db, model, rows: list, keys: list, column: str):
+    """
+    Adds each row's column value to the row with the same keys, creating
+    it when missing, in one statement. The caller commits.
+    """
+    if not rows:
+        return
+    stmt = _increment_statement(db.get_bind().dialect.name, model, rows, keys, column)
+    if stmt is not None:
+        db.execute(stmt)
+        return
+    for values in rows:
+        if not db.execute(_increment_fallback(model, values, keys, column)).rowcount:
+            db.execute(insert(model).values(**values))
+
+async def async_increment_many(db, model, rows: list, keys: list, column: str):
+    """increment_many() for an AsyncSession."""
+    if not rows:
+        return
+    stmt = _increment_statement(db.get_bind().dialect.name, model, rows, keys, column)
+    if stmt is not None:
+        await db.execute(stmt)
+        return
+    for values in rows:
+        if not (await db.execute(_increment_fallback(model, values, keys, column))).rowcount:
+            await db.execute(insert(model).values(**values))
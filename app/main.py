@@ -1,8 +1,14 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from contextlib import asynccontextmanager
+import asyncio
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, status
 from app.api.v1.endpoints import webhooks
 from app.core.config import settings
-from app.db.database import engine, Base
+from app.db.database import engine, async_engine, Base, AsyncSessionLocal
+from app.db.models import User
+from app.core.security import user_id_from_token
 from app.services.websocket import manager
+from app.services.events import event_bus
+from app.services.http_client import http_clients
 
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
@@ -10,7 +16,29 @@ from fastapi.responses import FileResponse
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title=settings.PROJECT_NAME, openapi_url=f"{settings.API_V1_STR}/openapi.json")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await http_clients.startup()
+    await event_bus.start()
+    manager.start()
+    if settings.TASK_BACKEND == "local":
+        from app.worker.local_runner import local_runner
+        local_runner.start()
+    if settings.WEBHOOK_INGEST_MODE == "journal":
+        # Replays segments left by a previous run, then keeps flushing
+        from app.services.ingest import journal_flusher
+        journal_flusher.start()
+    yield
+    if settings.WEBHOOK_INGEST_MODE == "journal":
+        await asyncio.to_thread(journal_flusher.stop)
+    if settings.TASK_BACKEND == "local":
+        local_runner.stop()
+    await manager.stop()
+    await event_bus.stop()
+    await http_clients.shutdown()
+    await async_engine.dispose()
+
+app = FastAPI(title=settings.PROJECT_NAME, openapi_url=f"{settings.API_V1_STR}/openapi.json", lifespan=lifespan)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -20,14 +48,31 @@ app.include_router(whatsapp_webhook.router, prefix=f"{settings.API_V1_STR}/webho
 app.include_router(admin.router, prefix=f"{settings.API_V1_STR}/admin", tags=["admin"])
 app.include_router(auth.router, prefix=f"{settings.API_V1_STR}/auth", tags=["auth"])
 
+async def websocket_user(token: str):
+    user_id = user_id_from_token(token) if token else None
+    if user_id is None:
+        return None
+    async with AsyncSessionLocal() as db:
+        user = await db.get(User, user_id)
+    return user if user is not None and user.is_active else None
+
 @app.websocket("/ws/orders")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, token: str = None, last_seq: int = None, epoch: str = None):
+    # Browsers can't set headers on a WebSocket, so the JWT comes as ?token=
+    user = await websocket_user(token)
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    if not await manager.connect(websocket, user.id, last_seq=last_seq, epoch=epoch):
+        return
     try:
         while True:
-            await websocket.receive_text() # Keep connection alive
-    except WebSocketDisconnect:
-        manager.disconnect(websocket)
+            await websocket.receive_text() # Pongs; anything counts as a sign of life
+            manager.touch(websocket, user.id)
+    except (WebSocketDisconnect, RuntimeError):
+        pass # RuntimeError: we closed it (reaped or too slow)
+    finally:
+        manager.disconnect(websocket, user.id)
 
 @app.get("/")
 def read_root():
@@ -0,0 +1,72 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional, Union
+
+try:
+    from orjson import loads
+except ImportError: # Falls back to the stdlib parser
+    from json import loads
+
+# Only the fields we use are declared; everything else in the payload
+# (line items, addresses, ...) is skipped without building models for it.
+
+class ShopifyCustomer(BaseModel):
+    phone: Optional[str] = None
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+
+class ShopifyOrderPayload(BaseModel):
+    id: Union[int, str]
+    order_number: Optional[Union[int, str]] = None
+    phone: Optional[str] = None
+    customer: Optional[ShopifyCustomer] = None
+    total_price: Optional[str] = None
+    currency: Optional[str] = None
+    financial_status: Optional[str] = None
+    fulfillment_status: Optional[str] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+    cancelled_at: Optional[str] = None
+
+class ShopifyOrdersPage(BaseModel):
+    """A page of the Admin API orders list."""
+    orders: List[ShopifyOrderPayload] = []
+
+class WhatsAppReply(BaseModel):
+    id: str
+    title: Optional[str] = None
+
+class WhatsAppInteractive(BaseModel):
+    type: str
+    button_reply: Optional[WhatsAppReply] = None
+    list_reply: Optional[WhatsAppReply] = None
+
+class WhatsAppMessage(BaseModel):
+    from_: Optional[str] = Field(None, alias="from")
+    type: Optional[str] = None
+    interactive: Optional[WhatsAppInteractive] = None
+
+class WhatsAppValue(BaseModel):
+    messages: List[WhatsAppMessage] = []
+
+class WhatsAppChange(BaseModel):
+    value: WhatsAppValue = WhatsAppValue()
+
+class WhatsAppEntry(BaseModel):
+    changes: List[WhatsAppChange] = []
+
+class WhatsAppWebhookPayload(BaseModel):
+    entry: List[WhatsAppEntry] = []
+
+    def first_message(self) -> Optional[WhatsAppMessage]:
+        for entry in self.entry:
+            for change in entry.changes:
+                if change.value.messages:
+                    return change.value.messages[0]
+        return None
+
+def parse_payload(model, body: bytes):
+    """
+    Decodes and validates a raw webhook body. Raises ValueError (bad JSON
+    and pydantic's ValidationError both are).
+    """
+    return model.model_validate(loads(body))
@@ -0,0 +1,290 @@
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, event, func, insert, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.db.models import ConfirmationLatencyStats, MessageLog, Order, OrderDailyStats, OrderStatus, OrderStatusRollup
+from app.db.upsert import async_increment_many, increment_many
+import logging
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_KEYS = ["user_id", "day", "status"]
+DAILY_KEYS = ["user_id", "day", "metric"]
+LATENCY_KEYS = ["user_id", "day", "bucket"]
+
+# Statuses charted per day, under the name of their series
+SERIES = {OrderStatus.CONFIRMED: "confirmed", OrderStatus.CANCELLED: "cancelled", OrderStatus.DELIVERED: "delivered"}
+METRICS = ["created", *SERIES.values()]
+
+# Upper bounds (seconds) of the latency buckets: 30s growing by 1.5x to
+# ~13 days, plus an open last bucket. Percentiles are read to within a bucket.
+LATENCY_BOUNDS = [30 * 1.5 ** i for i in range(27)]
+PERCENTILES = (50, 90, 99)
+
+# Outbound messages whose sending moved an order to confirmed (Selenium);
+# official "confirmation" messages only ask, the customer's answer moves it
+CONFIRMATION_MESSAGES = ("selenium_text",)
+
+def _utc(moment: datetime) -> datetime:
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment # SQLite drops the offset
+
+def _day(created_at):
+    return _utc(created_at or datetime.now(timezone.utc)).astimezone(timezone.utc).date()
+
+def latency_bucket(seconds: float) -> int:
+    return bisect_left(LATENCY_BOUNDS, max(seconds, 0))
+
+def aggregate_rows(transitions, now: datetime = None):
+    """
+    Count changes for (user_id, created_at, old_status, new_status[,
+    changed_at]) transitions, as (model, keys, rows); old_status is None
+    for new orders. changed_at is when the change happened (e.g. Shopify's
+    cancelled_at); by default a new order's creation, else now.
+    """
+    now = now or datetime.now(timezone.utc)
+    today = now.date()
+    rollup, daily, latency = Counter(), Counter(), Counter()
+    for user_id, created_at, old_status, new_status, *changed_at in transitions:
+        if user_id is None or old_status == new_status:
+            continue
+        day = _day(created_at)
+        if old_status is None:
+            daily[(user_id, day, "created")] += 1
+        else:
+            rollup[(user_id, day, old_status)] -= 1
+        rollup[(user_id, day, new_status)] += 1
+        if new_status in SERIES:
+            # Backfilled history lands on its own day, not on the day of the import
+            changed_day = _day(changed_at[0]) if changed_at and changed_at[0] else (day if old_status is None else today)
+            daily[(user_id, changed_day, SERIES[new_status])] += 1
+        if new_status == OrderStatus.CONFIRMED and old_status is not None and created_at is not None:
+            latency[(user_id, today, latency_bucket((now - _utc(created_at)).total_seconds()))] += 1
+
+    def rows(counts, keys):
+        return [dict(zip(keys, key), count=delta) for key, delta in counts.items() if delta]
+
+    return [
+        (OrderStatusRollup, ROLLUP_KEYS, rows(rollup, ROLLUP_KEYS)),
+        (OrderDailyStats, DAILY_KEYS, rows(daily, DAILY_KEYS)),
+        (ConfirmationLatencyStats, LATENCY_KEYS, rows(latency, LATENCY_KEYS)),
+    ]
+
+def _mark_changed(db, changes):
+    # Cached analytics are dropped once this transaction commits
+    users = db.info.setdefault("analytics_users", set())
+    for _, _, rows in changes:
+        users.update(row["user_id"] for row in rows)
+
+def record_transitions(db, transitions):
+    """Moves the aggregates for status changes; call before the caller commits."""
+    changes = aggregate_rows(transitions)
+    for model, keys, rows in changes:
+        increment_many(db, model, rows, keys, "count")
+    _mark_changed(db, changes)
+
+async def record_transitions_async(db, transitions):
+    changes = aggregate_rows(transitions)
+    for model, keys, rows in changes:
+        await async_increment_many(db, model, rows, keys, "count")
+    _mark_changed(db.sync_session, changes)
+
+def _move(order: Order, status):
+    # Only from the status the order was loaded with
+    return (
+        update(Order)
+        .where(Order.id == order.id, Order.status == order.status)
+        .values(status=status)
+        .execution_options(synchronize_session=False)
+    )
+
+def _moved(db, order: Order, status, rowcount: int) -> bool:
+    if rowcount != 1:
+        db.expire(order, ["status"]) # Someone else moved it; reload before reading
+        logger.info(f"Order {order.id} changed status concurrently; not moving it to {status.value}")
+        return False
+    set_committed_value(order, "status", status)
+    return True
+
+def set_order_status(db, order: Order, status) -> bool:
+    """
+    Moves the order to status if it still has the status it was loaded
+    with, and records the transition; returns False (changing nothing)
+    when something else moved it meanwhile. The caller commits.
+    """
+    if order.status == status:
+        return True
+    old_status = order.status
+    if not _moved(db, order, status, db.execute(_move(order, status)).rowcount):
+        return False
+    record_transitions(db, [(order.user_id, order.created_at, old_status, status)])
+    return True
+
+async def set_order_status_async(db, order: Order, status) -> bool:
+    if order.status == status:
+        return True
+    old_status = order.status
+    if not _moved(db, order, status, (await db.execute(_move(order, status))).rowcount):
+        return False
+    await record_transitions_async(db, [(order.user_id, order.created_at, old_status, status)])
+    return True
+
+def rebuild_rollup(db, user_id: int = None):
+    """Recomputes the rollup from orders (all users, or one). The caller commits."""
+    orders = select(
+        Order.user_id, func.date(Order.created_at), Order.status, func.count()
+    ).where(Order.user_id.isnot(None))
+    stale = delete(OrderStatusRollup)
+    if user_id is not None:
+        orders = orders.where(Order.user_id == user_id)
+        stale = stale.where(OrderStatusRollup.user_id == user_id)
+    orders = orders.group_by(Order.user_id, func.date(Order.created_at), Order.status)
+
+    db.execute(stale)
+    db.execute(insert(OrderStatusRollup).from_select(["user_id", "day", "status", "count"], orders))
+    analytics_cache.clear()
+
+def rebuild_daily_stats(db, user_id: int = None):
+    """
+    Recomputes the daily series and latency histograms from orders (all
+    users, or one). Orders don't keep their transition history, so the
+    confirmation time is the first Selenium confirmation sent, else the
+    last update of a still-confirmed order; cancellations and deliveries
+    are dated by the last update. The caller commits.
+    """
+    confirmed_at = (
+        select(func.min(MessageLog.sent_at))
+        .where(
+            MessageLog.order_id == Order.id,
+            MessageLog.message_type.in_(CONFIRMATION_MESSAGES),
+            MessageLog.status == "sent",
+        )
+        .correlate(Order)
+        .scalar_subquery()
+    )
+    orders = select(Order.user_id, Order.status, Order.created_at, Order.updated_at, confirmed_at).where(Order.user_id.isnot(None))
+    stale_daily, stale_latency = delete(OrderDailyStats), delete(ConfirmationLatencyStats)
+    if user_id is not None:
+        orders = orders.where(Order.user_id == user_id)
+        stale_daily = stale_daily.where(OrderDailyStats.user_id == user_id)
+        stale_latency = stale_latency.where(ConfirmationLatencyStats.user_id == user_id)
+
+    daily, latency = Counter(), Counter()
+    for owner, status, created_at, updated_at, sent_at in db.execute(orders.execution_options(yield_per=1000)):
+        if created_at is None:
+            continue
+        daily[(owner, _day(created_at), "created")] += 1
+        confirmed = sent_at or (updated_at if status == OrderStatus.CONFIRMED else None)
+        if confirmed is not None and status in (OrderStatus.CONFIRMED, OrderStatus.SHIPPED, OrderStatus.DELIVERED):
+            daily[(owner, _day(confirmed), "confirmed")] += 1
+            latency[(owner, _day(confirmed), latency_bucket((_utc(confirmed) - _utc(created_at)).total_seconds()))] += 1
+        if status in (OrderStatus.CANCELLED, OrderStatus.DELIVERED):
+            daily[(owner, _day(updated_at or created_at), SERIES[status])] += 1
+
+    db.execute(stale_daily)
+    db.execute(stale_latency)
+    if daily:
+        db.execute(insert(OrderDailyStats), [dict(zip(DAILY_KEYS, key), count=n) for key, n in daily.items()])
+    if latency:
+        db.execute(insert(ConfirmationLatencyStats), [dict(zip(LATENCY_KEYS, key), count=n) for key, n in latency.items()])
+    analytics_cache.clear()
+
+# One entry per user holding all of their cached results, so a commit
+# touching the user drops them together
+analytics_cache = TTLCache(maxsize=settings.ANALYTICS_CACHE_SIZE, ttl=settings.ANALYTICS_CACHE_TTL)
+
+def _cached(user_id: int, key):
+    entry = analytics_cache.get(user_id)
+    return None if entry is None else entry.get(key)
+
+def _remember(user_id: int, key, value):
+    entry = analytics_cache.get(user_id)
+    if entry is None:
+        entry = {}
+        analytics_cache.set(user_id, entry)
+    entry[key] = value # Expires with the entry, not later
+
+async def status_counts(db, user_id: int) -> dict:
+    """The user's orders by current status: one GROUP BY over the rollup."""
+    counts = _cached(user_id, "status")
+    if counts is None:
+        rows = await db.execute(
+            select(OrderStatusRollup.status, func.sum(OrderStatusRollup.count))
+            .where(OrderStatusRollup.user_id == user_id)
+            .group_by(OrderStatusRollup.status)
+        )
+        counts = {status: int(total or 0) for status, total in rows.all()}
+        _remember(user_id, "status", counts)
+    return counts
+
+def _window(days: int):
+    end = datetime.now(timezone.utc).date()
+    return end - timedelta(days=days - 1), end
+
+async def daily_series(db, user_id: int, days: int) -> list:
+    """One point per day of the last `days` (today included), zero-filled."""
+    start, end = _window(days)
+    series = _cached(user_id, ("daily", start))
+    if series is None:
+        rows = await db.execute(
+            select(OrderDailyStats.day, OrderDailyStats.metric, OrderDailyStats.count)
+            .where(OrderDailyStats.user_id == user_id, OrderDailyStats.day >= start, OrderDailyStats.day <= end)
+        )
+        points = {start + timedelta(days=i): dict.fromkeys(METRICS, 0) for i in range(days)}
+        for day, metric, count in rows.all():
+            if day in points and metric in points[day]:
+                points[day][metric] += count
+        series = [{"day": day.isoformat(), **counts} for day, counts in points.items()]
+        _remember(user_id, ("daily", start), series)
+    return series
+
+def percentiles(histogram: dict, quantiles=PERCENTILES) -> dict:
+    """
+    Percentiles (seconds) from bucket counts, interpolating linearly within
+    the bucket a rank falls in; None when there is nothing to measure.
+    """
+    total = sum(histogram.values())
+    result = {}
+    for q in quantiles:
+        result[f"p{q}"] = None
+        rank, seen = q / 100 * total, 0
+        for bucket in sorted(histogram):
+            count = histogram[bucket]
+            if count > 0 and seen + count >= rank:
+                low = LATENCY_BOUNDS[bucket - 1] if bucket > 0 else 0
+                high = LATENCY_BOUNDS[bucket] if bucket < len(LATENCY_BOUNDS) else low
+                result[f"p{q}"] = round(low + (high - low) * (rank - seen) / count)
+                break
+            seen += count
+    return result
+
+async def confirmation_latency(db, user_id: int, days: int) -> dict:
+    """Creation-to-confirmation time of orders confirmed in the last `days`."""
+    start, end = _window(days)
+    summary = _cached(user_id, ("latency", start))
+    if summary is None:
+        rows = await db.execute(
+            select(ConfirmationLatencyStats.bucket, func.sum(ConfirmationLatencyStats.count))
+            .where(
+                ConfirmationLatencyStats.user_id == user_id,
+                ConfirmationLatencyStats.day >= start,
+                ConfirmationLatencyStats.day <= end,
+            )
+            .group_by(ConfirmationLatencyStats.bucket)
+        )
+        histogram = {bucket: int(count or 0) for bucket, count in rows.all()}
+        summary = {"count": sum(histogram.values()), **percentiles(histogram)}
+        _remember(user_id, ("latency", start), summary)
+    return summary
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_analytics(session):
+    for user_id in session.info.pop("analytics_users", ()):
+        analytics_cache.pop(user_id)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_analytics_changes(session):
+    session.info.pop("analytics_users", None)
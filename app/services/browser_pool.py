@@ -0,0 +1,223 @@
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+from app.core.config import settings
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class BrowserPoolExhausted(Exception):
+    pass
+
+class _PooledBrowser:
+    def __init__(self, bot):
+        self.bot = bot
+        self.in_use = False
+        self.last_used = time.monotonic()
+
+class BrowserPool:
+    """
+    Keeps one warm WhatsApp Web session per linked user profile.
+
+    Chrome locks its --user-data-dir, so a profile can only be driven by one
+    browser at a time: checkout is exclusive per user_id and callers for the
+    same user wait for the session to be returned instead of launching a
+    second Chrome against the same profile.
+    """
+
+    def __init__(self, max_browsers: int, idle_timeout: float, browser_factory: Optional[Callable] = None):
+        self.max_browsers = max_browsers
+        self.idle_timeout = idle_timeout
+        self._browser_factory = browser_factory or self._default_factory
+        self._browsers: Dict[int, _PooledBrowser] = {}
+        self._cond = threading.Condition()
+        self._reaper = None
+        self._stop = threading.Event()
+        self.created_count = 0
+        self.evicted_count = 0
+
+    @staticmethod
+    def _default_factory(user_id: int):
+        from app.services.whatsapp_browser import SeleniumWhatsApp
+        bot = SeleniumWhatsApp(user_id=user_id, headless=True)
+        bot.start()
+        return bot
+
+    def start(self):
+        """
+        Called once per worker process: resolves the driver binary up front
+        and starts the idle reaper.
+        """
+        from app.services.whatsapp_browser import get_driver_path
+        try:
+            get_driver_path()
+        except Exception as e:
+            logger.error(f"Could not resolve chromedriver at startup: {e}")
+
+        if self._reaper is None:
+            self._stop.clear()
+            self._reaper = threading.Thread(target=self._reap_loop, name="browser-pool-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+        interval = max(1.0, min(60.0, self.idle_timeout / 2))
+        while not self._stop.wait(interval):
+            self.evict_idle()
+
+    def checkout(self, user_id: int, timeout: Optional[float] = None):
+        deadline = time.monotonic() + (timeout if timeout is not None else settings.BROWSER_POOL_CHECKOUT_TIMEOUT)
+        if self._reaper is None:
+            # No background reaper in this process (e.g. eager mode in the API)
+            self.evict_idle()
+
+        victim = None
+        with self._cond:
+            while True:
+                entry = self._browsers.get(user_id)
+                if entry is not None and not entry.in_use:
+                    entry.in_use = True
+                    break
+                if entry is None:
+                    has_capacity, victim = self._reserve_slot_locked()
+                    if has_capacity:
+                        # Placeholder keeps other callers for this profile waiting
+                        # while the browser boots outside the lock.
+                        entry = _PooledBrowser(None)
+                        entry.in_use = True
+                        self._browsers[user_id] = entry
+                        break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise BrowserPoolExhausted(f"No browser available for user {user_id} within timeout")
+                self._cond.wait(remaining)
+
+        if victim is not None:
+            self._quit(*victim)
+
+        if entry.bot is None:
+            return self._launch(user_id, entry)
+
+        if not entry.bot.is_alive():
+            logger.warning(f"Browser for user {user_id} failed health check. Restarting.")
+            self._quit(user_id, entry.bot)
+            entry.bot = None
+            return self._launch(user_id, entry)
+
+        return entry.bot
+
+    def _reserve_slot_locked(self):
+        """
+        Reserves a slot for a new browser. When the pool is full, the least
+        recently used idle browser is evicted and returned so the caller can
+        quit it outside the lock.
+        """
+        if len(self._browsers) < self.max_browsers:
+            return True, None
+        idle = [(e.last_used, uid) for uid, e in self._browsers.items() if not e.in_use]
+        if not idle:
+            return False, None
+        _, victim_id = min(idle)
+        victim = self._browsers.pop(victim_id)
+        self.evicted_count += 1
+        return True, (victim_id, victim.bot)
+
+    def _launch(self, user_id: int, entry: _PooledBrowser):
+        try:
+            bot = self._browser_factory(user_id)
+        except Exception:
+            with self._cond:
+                if self._browsers.get(user_id) is entry:
+                    del self._browsers[user_id]
+                self._cond.notify_all()
+            raise
+
+        with self._cond:
+            entry.bot = bot
+            self.created_count += 1
+            live = len(self._browsers)
+        logger.info(f"Started pooled browser for user {user_id}. Live: {live}")
+        return bot
+
+    def checkin(self, user_id: int, bot, healthy: bool = True):
+        with self._cond:
+            entry = self._browsers.get(user_id)
+            orphaned = entry is None or entry.bot is not bot
+            if orphaned:
+                # Pool was closed while this browser was checked out
+                healthy = False
+            elif healthy:
+                entry.in_use = False
+                entry.last_used = time.monotonic()
+            else:
+                del self._browsers[user_id]
+            self._cond.notify_all()
+
+        if not healthy:
+            self._quit(user_id, bot)
+
+    @contextmanager
+    def session(self, user_id: int, timeout: Optional[float] = None):
+        bot = self.checkout(user_id, timeout=timeout)
+        healthy = True
+        try:
+            yield bot
+        except Exception:
+            healthy = bot.is_alive()
+            raise
+        finally:
+            self.checkin(user_id, bot, healthy=healthy)
+
+    def _quit(self, user_id: int, bot):
+        if bot is None:
+            return
+        try:
+            bot.close()
+        except Exception as e:
+            logger.warning(f"Error closing browser for user {user_id}: {e}")
+
+    def evict_idle(self):
+        now = time.monotonic()
+        victims = []
+        with self._cond:
+            for user_id, entry in list(self._browsers.items()):
+                if not entry.in_use and now - entry.last_used >= self.idle_timeout:
+                    victims.append((user_id, self._browsers.pop(user_id)))
+            if victims:
+                self.evicted_count += len(victims)
+                self._cond.notify_all()
+
+        for user_id, entry in victims:
+            logger.info(f"Closing idle browser for user {user_id}")
+            self._quit(user_id, entry.bot)
+        return len(victims)
+
+    def close_all(self):
+        self._stop.set()
+        self._reaper = None
+        with self._cond:
+            victims = list(self._browsers.items())
+            self._browsers.clear()
+            self._cond.notify_all()
+        for user_id, entry in victims:
+            self._quit(user_id, entry.bot)
+
+    def stats(self):
+        with self._cond:
+            in_use = sum(1 for e in self._browsers.values() if e.in_use)
+            starting = sum(1 for e in self._browsers.values() if e.bot is None)
+            return {
+                "live": len(self._browsers),
+                "in_use": in_use,
+                "starting": starting,
+                "idle": len(self._browsers) - in_use,
+                "max_browsers": self.max_browsers,
+                "created": self.created_count,
+                "evicted": self.evicted_count,
+            }
+
+browser_pool = BrowserPool(
+    max_browsers=settings.BROWSER_POOL_MAX_BROWSERS,
+    idle_timeout=settings.BROWSER_POOL_IDLE_TIMEOUT,
+)
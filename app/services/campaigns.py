@@ -0,0 +1,186 @@
+from datetime import datetime, timezone
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.db.models import Campaign, CampaignStatus, MessageLog, Order, OrderStatus
+from app.services.whatsapp import whatsapp_service
+import asyncio
+import csv
+import logging
+
+logger = logging.getLogger(__name__)
+
+def iter_order_recipients(db, user_id: int, statuses=None):
+    """Customer phones of a user's orders, oldest first (stable across resumes)."""
+    query = db.query(Order.customer_phone).filter(Order.user_id == user_id, Order.customer_phone.isnot(None))
+    if statuses:
+        query = query.filter(Order.status.in_([OrderStatus(s) for s in statuses]))
+    for (phone,) in query.order_by(Order.id).yield_per(500):
+        yield phone
+
+def iter_upload_recipients(path: str):
+    """Phones from the first column of an uploaded CSV / plain text file."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.reader(f):
+            if not row:
+                continue
+            phone = row[0].strip()
+            if phone and phone.lstrip("+").isdigit():
+                yield phone
+
+async def _in_thread(iterator, chunk_size: int = 500):
+    """Drains a blocking iterator in chunks off the event loop."""
+    def next_chunk():
+        chunk = []
+        for item in iterator:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                break
+        return chunk
+
+    while True:
+        chunk = await asyncio.to_thread(next_chunk)
+        if not chunk:
+            return
+        for item in chunk:
+            yield item
+
+class _Progress:
+    """
+    Tracks which recipient indices are in flight so the checkpoint only
+    advances past indices that are finished and logged.
+    """
+
+    def __init__(self, start: int):
+        self.next_index = start
+        self.in_flight = set()
+        self.buffer = []
+
+    def issue(self, index: int):
+        self.in_flight.add(index)
+        self.next_index = index + 1
+
+    def skip(self, index: int):
+        self.next_index = index + 1
+
+    def complete(self, result: dict):
+        self.in_flight.discard(result["index"])
+        self.buffer.append(result)
+
+    @property
+    def checkpoint(self):
+        return min(self.in_flight) if self.in_flight else self.next_index
+
+class CampaignRunner:
+    def _load(self, campaign_id: int):
+        db = SessionLocal()
+        try:
+            campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
+            if not campaign:
+                return None, set()
+            if campaign.status != CampaignStatus.COMPLETED:
+                campaign.status = CampaignStatus.RUNNING
+                campaign.started_at = campaign.started_at or datetime.now(timezone.utc)
+                db.commit()
+            # Recipients logged past the last checkpoint (sent out of order before a crash)
+            done = {
+                phone for (phone,) in db.query(MessageLog.recipient).filter(MessageLog.campaign_id == campaign_id)
+            }
+            db.refresh(campaign)
+            db.expunge(campaign)
+            return campaign, done
+        finally:
+            db.close()
+
+    def _flush(self, campaign_id: int, results: list, checkpoint: int, status: CampaignStatus = None):
+        db = SessionLocal()
+        try:
+            db.bulk_save_objects([
+                MessageLog(
+                    campaign_id=campaign_id,
+                    recipient=r["phone"],
+                    message_type="campaign",
+                    status=r["status"],
+                    whatsapp_message_id=r["message_id"],
+                    content=r["error"],
+                    latency_ms=r["latency_ms"],
+                )
+                for r in results
+            ])
+            campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
+            campaign.checkpoint = checkpoint
+            campaign.sent = (campaign.sent or 0) + sum(1 for r in results if r["status"] == "sent")
+            campaign.failed = (campaign.failed or 0) + sum(1 for r in results if r["status"] != "sent")
+            if status:
+                campaign.status = status
+                campaign.finished_at = datetime.now(timezone.utc)
+            db.commit()
+        finally:
+            db.close()
+
+    def _source(self, campaign: Campaign):
+        if campaign.source == "upload":
+            return iter_upload_recipients(campaign.upload_path), None
+        db = SessionLocal()
+        statuses = (campaign.source_filter or {}).get("statuses")
+        return iter_order_recipients(db, campaign.user_id, statuses), db
+
+    async def run(self, campaign_id: int):
+        campaign, done = await asyncio.to_thread(self._load, campaign_id)
+        if campaign is None:
+            logger.error(f"Campaign {campaign_id} not found.")
+            return None
+        if campaign.status == CampaignStatus.COMPLETED:
+            return {"status": "completed"}
+
+        progress = _Progress(campaign.checkpoint or 0)
+        flush_lock = asyncio.Lock()
+        source, source_db = self._source(campaign)
+
+        start = progress.next_index
+
+        async def recipients():
+            seen = set(done)
+            index = -1
+            async for phone in _in_thread(source):
+                index += 1
+                if index < start:
+                    continue
+                if phone in seen:
+                    progress.skip(index)
+                    continue
+                seen.add(phone)
+                progress.issue(index)
+                yield index, phone
+
+        async def flush(status=None):
+            async with flush_lock:
+                # Snapshot on the loop; only the DB write runs in a thread
+                results, progress.buffer = progress.buffer, []
+                await asyncio.to_thread(self._flush, campaign_id, results, progress.checkpoint, status)
+
+        async def on_result(result):
+            progress.complete(result)
+            if len(progress.buffer) >= settings.CAMPAIGN_CHECKPOINT_EVERY:
+                await flush()
+
+        logger.info(f"Running campaign {campaign_id} from checkpoint {progress.next_index}")
+        try:
+            summary = await whatsapp_service.send_bulk(
+                recipients(),
+                campaign.template_name,
+                language_code=campaign.language_code or "en",
+                on_result=on_result,
+            )
+        except Exception as e:
+            logger.error(f"Campaign {campaign_id} failed: {e}")
+            await flush(CampaignStatus.FAILED)
+            raise
+        finally:
+            if source_db is not None:
+                source_db.close()
+
+        await flush(CampaignStatus.COMPLETED)
+        logger.info(f"Campaign {campaign_id} finished: {summary}")
+        return summary
+
+campaign_runner = CampaignRunner()
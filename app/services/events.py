@@ -0,0 +1,133 @@
+from app.core.config import settings
+from app.services.websocket import dumps, manager
+import asyncio
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+class LocalEventBackend:
+    """
+    Single-process bus: events are handed straight to this process's
+    sockets. Enough when tasks run in the API process (local/eager).
+    """
+
+    def __init__(self):
+        self._loop = None
+
+    def publish(self, user_id: int, payload: str):
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            manager.send_payload(user_id, payload)
+        else:
+            # The registry belongs to the API loop
+            loop.call_soon_threadsafe(manager.send_payload, user_id, payload)
+
+    async def start(self, loop):
+        self._loop = loop
+
+    async def stop(self):
+        self._loop = None
+
+class RedisEventBackend:
+    """
+    Redis pub/sub with a channel per user. Any process (Celery workers,
+    every uvicorn worker) publishes; each API process subscribes to the
+    pattern and fans out to the sockets it holds.
+    """
+
+    def __init__(self, url: str, prefix: str):
+        self.url = url
+        self.prefix = prefix
+        self._publisher = None
+        self._publisher_lock = threading.Lock()
+        self._task = None
+
+    def _client(self):
+        import redis
+        with self._publisher_lock:
+            if self._publisher is None:
+                self._publisher = redis.Redis.from_url(self.url)
+            return self._publisher
+
+    def publish(self, user_id: int, payload: str):
+        self._client().publish(f"{self.prefix}{user_id}", payload)
+
+    async def _listen(self):
+        import redis.asyncio as redis
+        delay = 1.0
+        while True:
+            client = redis.from_url(self.url)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.psubscribe(f"{self.prefix}*")
+                    delay = 1.0
+                    async for message in pubsub.listen():
+                        if message["type"] != "pmessage":
+                            continue
+                        user_id = int(message["channel"].decode()[len(self.prefix):])
+                        manager.send_payload(user_id, message["data"].decode())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Events published while we're away are lost; dashboards resync on reconnect
+                logger.error(f"Event bus subscription failed: {e}. Resubscribing in {delay:.0f}s.")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+            finally:
+                await client.aclose()
+
+    async def start(self, loop):
+        self._task = loop.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+class EventBus:
+    """
+    Where every dashboard event goes, whichever process produced it. The
+    event is serialized once here and travels as the final payload.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.published = 0
+        self.failed = 0
+
+    def publish(self, user_id: int, event: dict):
+        """Safe from any thread or loop; never raises."""
+        try:
+            self.backend.publish(user_id, dumps(event))
+            self.published += 1
+        except Exception as e:
+            # Live updates are best effort; the order itself is stored
+            self.failed += 1
+            logger.error(f"Failed to publish {event.get('type')} event for user {user_id}: {e}")
+
+    async def publish_async(self, user_id: int, event: dict):
+        if isinstance(self.backend, LocalEventBackend):
+            self.publish(user_id, event)
+        else:
+            await asyncio.to_thread(self.publish, user_id, event)
+
+    async def start(self):
+        await self.backend.start(asyncio.get_running_loop())
+
+    async def stop(self):
+        await self.backend.stop()
+
+    def stats(self):
+        return {"backend": type(self.backend).__name__, "published": self.published, "failed": self.failed}
+
+def _build_backend():
+    if settings.EVENT_BUS_BACKEND == "redis":
+        return RedisEventBackend(settings.REDIS_URL, settings.EVENT_BUS_CHANNEL_PREFIX)
+    return LocalEventBackend()
+
+event_bus = EventBus(_build_backend())
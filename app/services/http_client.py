@@ -0,0 +1,116 @@
+from app.core.config import settings
+import asyncio
+import threading
+import weakref
+import httpx
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2 # noqa: F401 (only needed for HTTP/2 support)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+class HTTPClientManager:
+    """
+    Process-wide keep-alive connection pool for outbound API calls
+    (graph.facebook.com, *.myshopify.com).
+
+    An httpx.AsyncClient is bound to the event loop it was first used on, so
+    one client is kept per running loop. With a long-lived loop (API process,
+    worker loop) that is a single shared client for the whole process.
+    """
+
+    def __init__(self):
+        self._clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.requests_total = 0
+        self.in_flight = 0
+
+    def _build_client(self):
+        http2 = settings.HTTP_CLIENT_HTTP2 and HTTP2_AVAILABLE
+        if settings.HTTP_CLIENT_HTTP2 and not HTTP2_AVAILABLE:
+            logger.warning("HTTP/2 requested but the 'h2' package is not installed. Using HTTP/1.1.")
+        return httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_CLIENT_MAX_KEEPALIVE,
+                keepalive_expiry=settings.HTTP_CLIENT_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(
+                settings.HTTP_CLIENT_TIMEOUT,
+                connect=settings.HTTP_CLIENT_CONNECT_TIMEOUT,
+                pool=settings.HTTP_CLIENT_POOL_TIMEOUT,
+            ),
+        )
+
+    def get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None or client.is_closed:
+            with self._lock:
+                client = self._clients.get(loop)
+                if client is None or client.is_closed:
+                    client = self._clients[loop] = self._build_client()
+        return client
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        self.requests_total += 1
+        self.in_flight += 1
+        try:
+            return await self.get_client().request(method, url, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+    async def startup(self):
+        """FastAPI startup / worker init: create the pool on the serving loop."""
+        self.get_client()
+
+    async def shutdown(self):
+        """Closes the client that belongs to the current loop."""
+        loop = asyncio.get_running_loop()
+        client = self._clients.pop(loop, None)
+        if client is not None:
+            await client.aclose()
+
+    def reset(self):
+        """
+        Drops clients inherited across fork() (Celery prefork); their sockets
+        belong to the parent process.
+        """
+        self._clients = weakref.WeakKeyDictionary()
+        self.in_flight = 0
+
+    def close_all(self):
+        """Synchronous close for worker shutdown."""
+        for loop, client in list(self._clients.items()):
+            if client.is_closed or loop.is_closed() or loop.is_running():
+                continue
+            try:
+                loop.run_until_complete(client.aclose())
+            except Exception as e:
+                logger.warning(f"Error closing HTTP client: {e}")
+        self._clients = weakref.WeakKeyDictionary()
+
+    def stats(self):
+        connections = idle = 0
+        for client in list(self._clients.values()):
+            pool = getattr(getattr(client, "_transport", None), "_pool", None)
+            for conn in getattr(pool, "connections", []):
+                connections += 1
+                if conn.is_idle():
+                    idle += 1
+        return {
+            "clients": len(self._clients),
+            "http2": settings.HTTP_CLIENT_HTTP2 and HTTP2_AVAILABLE,
+            "max_connections": settings.HTTP_CLIENT_MAX_CONNECTIONS,
+            "connections": connections,
+            "idle_connections": idle,
+            "in_flight": self.in_flight,
+            "requests_total": self.requests_total,
+        }
+
+http_clients = HTTPClientManager()
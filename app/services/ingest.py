@@ -0,0 +1,311 @@
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.db.models import Order, OrderStatus, User
+from app.db.upsert import insert_ignore_many
+from app.services.analytics import record_transitions
+from app.schemas.webhooks import ShopifyCustomer, ShopifyOrderPayload, parse_payload
+from sqlalchemy.exc import InterfaceError, OperationalError
+import asyncio
+import glob
+import json
+import os
+import threading
+import time
+import logging
+
+try:
+    import fcntl
+except ImportError: # Windows: single-process only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# The database, not the records, is the problem: retry later, quarantine nothing
+DATABASE_UNAVAILABLE = (OperationalError, InterfaceError)
+
+def order_values(user_id: int, order: ShopifyOrderPayload) -> dict:
+    """Order columns from a Shopify orders/create payload."""
+    customer = order.customer or ShopifyCustomer()
+    return {
+        "user_id": user_id,
+        "shopify_order_id": str(order.id),
+        "order_number": str(order.order_number),
+        "customer_phone": customer.phone or order.phone,
+        "customer_name": f"{customer.first_name or ''} {customer.last_name or ''}".strip(),
+        "total_price": order.total_price,
+        "currency": order.currency,
+        "financial_status": order.financial_status,
+        "fulfillment_status": order.fulfillment_status,
+        "status": OrderStatus.PENDING,
+    }
+
+def new_order_event(values: dict) -> dict:
+    return {
+        "type": "new_order",
+        "data": {
+            "order_number": values["order_number"],
+            "customer_name": values["customer_name"],
+            "total_price": values["total_price"],
+            "status": OrderStatus.PENDING.value,
+            "delivery_slot": None
+        }
+    }
+
+class WebhookJournal:
+    """
+    Append-only, fsync'd journal of raw webhook bodies, split into segment
+    files. The writer holds an flock on its open segment; anything not
+    locked is sealed and can be flushed, including segments a crashed
+    process left behind.
+    """
+
+    def __init__(self, directory: str, segment_max_bytes: int, fsync: bool = True):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync = fsync
+        self._file = None
+        self._lock = threading.Lock()
+        self.appended = 0
+
+    def _open_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        # Sortable by creation time, unique per process
+        path = os.path.join(self.directory, f"{time.time_ns():020d}-{os.getpid()}.seg")
+        f = open(path, "ab")
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return f
+
+    def append(self, user_id: int, body: bytes, webhook_id: str = None):
+        record = json.dumps({"user_id": user_id, "webhook_id": webhook_id, "body": body.decode("utf-8")})
+        with self._lock:
+            if self._file is None:
+                self._file = self._open_segment()
+            self._file.write(record.encode("utf-8") + b"\n")
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.appended += 1
+            if self._file.tell() >= self.segment_max_bytes:
+                self._seal()
+
+    async def append_async(self, user_id: int, body: bytes, webhook_id: str = None):
+        # The fsync blocks; keep it off the event loop
+        await asyncio.to_thread(self.append, user_id, body, webhook_id)
+
+    def _seal(self):
+        if self._file is not None:
+            self._file.close() # Releases the flock
+            self._file = None
+
+    def seal(self):
+        """Closes the open segment so the flusher can take it."""
+        with self._lock:
+            self._seal()
+
+    def segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, "*.seg")))
+
+    def quarantine(self, segment: str, record):
+        """
+        Sets aside a record that can't be flushed, under the segment's name
+        in quarantine/. Moving the file back into the journal replays it.
+        """
+        directory = os.path.join(self.directory, "quarantine")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, os.path.basename(segment)), "ab") as f:
+            f.write(json.dumps(record).encode("utf-8") + b"\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def open_sealed(self, path: str):
+        """Opens a segment for flushing, or None if another process owns it."""
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None # Flushed by another process
+        if fcntl is not None:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                return None
+        current = self._file
+        if (current is not None and current.name == path) or not os.path.exists(path):
+            # Still being written, or flushed and removed while we waited
+            f.close()
+            return None
+        return f
+
+    @staticmethod
+    def read_records(f):
+        for line in f:
+            if not line.endswith(b"\n"):
+                # Torn write at the tail of a crashed segment; never acked
+                logger.warning(f"Ignoring incomplete record at the end of {f.name}")
+                return
+            try:
+                yield json.loads(line)
+            except ValueError:
+                logger.error(f"Skipping corrupt record in {f.name}")
+
+class JournalFlusher:
+    """
+    Background thread that turns journaled webhooks into orders: one
+    multi-row insert per micro-batch, then confirmations and WebSocket
+    events for the orders that were new. Segments are deleted once flushed,
+    so whatever is left on disk at startup is replayed. Records that fail on
+    their own are quarantined, so one bad record never holds up the rest.
+    """
+
+    def __init__(self, journal: WebhookJournal, batch_size: int, interval: float):
+        self.journal = journal
+        self.batch_size = batch_size
+        self.interval = interval
+        self._thread = None
+        self._stop = threading.Event()
+        self.flushed = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.quarantined = 0
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="journal-flusher", daemon=True)
+        self._thread.start()
+        logger.info("Webhook journal flusher started.")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+            self._thread = None
+        # Drain what was acknowledged before shutting down
+        self.flush_all()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.flush_all()
+            except Exception as e:
+                logger.error(f"Journal flush failed: {e}")
+            self._stop.wait(self.interval)
+
+    def flush_all(self):
+        self.journal.seal()
+        count = 0
+        for path in self.journal.segments():
+            f = self.journal.open_sealed(path)
+            if f is None:
+                continue
+            try:
+                count += self._flush_segment(path, f)
+                os.remove(path)
+            except DATABASE_UNAVAILABLE as e:
+                # Keep this segment and the ones after it, in order, for the next pass
+                logger.error(f"Journal flush paused at {path}: {e}")
+                break
+            finally:
+                f.close()
+        return count
+
+    def _flush_segment(self, path: str, f):
+        count = 0
+        batch = []
+        for record in self.journal.read_records(f):
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                count += self._flush_or_quarantine(path, batch)
+                batch = []
+        if batch:
+            count += self._flush_or_quarantine(path, batch)
+        return count
+
+    def _flush_or_quarantine(self, path: str, records):
+        try:
+            return self._flush_batch(records)
+        except DATABASE_UNAVAILABLE:
+            raise
+        except Exception as e:
+            logger.error(f"Flushing {len(records)} journaled webhooks from {path} failed: {e}. Retrying one by one.")
+
+        # Inserts are idempotent, so records of the failed batch can go again
+        count = 0
+        for record in records:
+            try:
+                count += self._flush_batch([record])
+            except DATABASE_UNAVAILABLE:
+                raise
+            except Exception as e:
+                logger.error(f"Quarantining a journaled webhook from {path}: {e}")
+                self.journal.quarantine(path, record)
+                self.quarantined += 1
+        return count
+
+    def _flush_batch(self, records):
+        rows = {}
+        for record in records:
+            try:
+                order = parse_payload(ShopifyOrderPayload, record["body"])
+            except ValueError as e:
+                logger.error(f"Dropping invalid webhook {record.get('webhook_id')}: {e}")
+                self.dropped += 1
+                continue
+            values = order_values(record["user_id"], order)
+            rows.setdefault(values["shopify_order_id"], values) # Same order twice in a batch
+
+        db = SessionLocal()
+        try:
+            user_ids = {values["user_id"] for values in rows.values()}
+            known = {user_id for (user_id,) in db.query(User.id).filter(User.id.in_(user_ids))}
+            valid = [values for values in rows.values() if values["user_id"] in known]
+            if len(valid) < len(rows):
+                logger.warning(f"Dropping {len(rows) - len(valid)} journaled orders for unknown users")
+                self.dropped += len(rows) - len(valid)
+
+            inserted = insert_ignore_many(db, Order, valid, "shopify_order_id")
+            record_transitions(db, [(rows[key]["user_id"], None, None, rows[key]["status"]) for _, key in inserted])
+            db.commit()
+        finally:
+            db.close()
+
+        self.flushed += len(inserted)
+        self.duplicates += len(valid) - len(inserted)
+        try:
+            self._after_insert([(order_id, rows[key]) for order_id, key in inserted])
+        except Exception as e:
+            # Committed already: a retry would find them duplicates and skip this
+            logger.error(f"Queueing confirmations for {len(inserted)} journaled orders failed: {e}")
+        return len(inserted)
+
+    def _after_insert(self, orders):
+        from app.worker.tasks import send_order_confirmation
+        from app.services.events import event_bus
+
+        for order_id, values in orders:
+            send_order_confirmation.apply_async(args=[order_id], countdown=10)
+            event_bus.publish(values["user_id"], new_order_event(values))
+
+    def stats(self):
+        return {
+            "appended": self.journal.appended,
+            "pending_segments": len(self.journal.segments()),
+            "flushed": self.flushed,
+            "duplicates": self.duplicates,
+            "dropped": self.dropped,
+            "quarantined": self.quarantined,
+        }
+
+order_journal = WebhookJournal(
+    directory=settings.WEBHOOK_JOURNAL_DIR,
+    segment_max_bytes=settings.WEBHOOK_JOURNAL_SEGMENT_BYTES,
+    fsync=settings.WEBHOOK_JOURNAL_FSYNC,
+)
+journal_flusher = JournalFlusher(
+    order_journal,
+    batch_size=settings.WEBHOOK_JOURNAL_FLUSH_BATCH,
+    interval=settings.WEBHOOK_JOURNAL_FLUSH_INTERVAL,
+)
@@ -0,0 +1,164 @@
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Optional
+from app.core.config import settings
+import asyncio
+import threading
+import time
+import weakref
+import logging
+
+logger = logging.getLogger(__name__)
+
+class RateLimitTimeout(Exception):
+    pass
+
+class LocalRateLimitBackend:
+    """
+    In-memory token buckets for single-node runs. Shared by every loop and
+    thread of the process.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, rate: float, capacity: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, blocked_until = self._buckets.get(key, (capacity, now, 0.0))
+            if blocked_until > now:
+                return blocked_until - now
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now, 0.0)
+                return 0.0
+            self._buckets[key] = (tokens, now, 0.0)
+            return (1 - tokens) / rate
+
+    async def block(self, key: str, seconds: float):
+        now = time.monotonic()
+        with self._lock:
+            # Drain the bucket so the number ramps up again after the pause
+            self._buckets[key] = (0.0, now + seconds, now + seconds)
+
+# Buckets live in Redis so every worker process sharing a phone number
+# draws from the same budget. Redis TIME keeps the clock consistent.
+TAKE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'blocked_until')
+local blocked_until = tonumber(state[3]) or 0
+if blocked_until > now then
+    return tostring(blocked_until - now)
+end
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+BLOCK_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local until_ts = now + tonumber(ARGV[1])
+redis.call('HSET', KEYS[1], 'tokens', 0, 'ts', until_ts, 'blocked_until', until_ts)
+redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[1])) + 60)
+return 1
+"""
+
+class RedisRateLimitBackend:
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        self.url = url
+        self.prefix = prefix
+        # redis.asyncio connections are bound to the loop that opened them
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _client(self):
+        import redis.asyncio as redis
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = redis.from_url(self.url)
+        return client
+
+    async def take(self, key: str, rate: float, capacity: float) -> float:
+        wait = await self._client().eval(TAKE_SCRIPT, 1, self.prefix + key, rate, capacity)
+        return float(wait)
+
+    async def block(self, key: str, seconds: float):
+        await self._client().eval(BLOCK_SCRIPT, 1, self.prefix + key, seconds)
+
+class RateLimiter:
+    """
+    Token bucket per WhatsApp phone_number_id. Callers wait for a token
+    instead of failing, and a 429 pauses the whole number for Retry-After.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.waits = 0
+        self.throttled = 0
+
+    def rate_for(self, merchant=None) -> float:
+        # Merchants on their own number (tier 3) get that number's limit;
+        # everybody else shares the default number.
+        if merchant is not None and merchant.whatsapp_phone_number_id:
+            return settings.WHATSAPP_RATE_LIMITS_BY_TIER.get(merchant.tier, settings.WHATSAPP_RATE_LIMIT_DEFAULT)
+        return settings.WHATSAPP_RATE_LIMIT_DEFAULT
+
+    async def acquire(self, key: str, rate: float, max_wait: Optional[float] = None):
+        max_wait = settings.WHATSAPP_RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait
+        capacity = max(1.0, rate * settings.WHATSAPP_RATE_LIMIT_BURST_SECONDS)
+        waited = 0.0
+        while True:
+            wait = await self.backend.take(key, rate, capacity)
+            if wait <= 0:
+                return waited
+            if waited + wait > max_wait:
+                raise RateLimitTimeout(f"Rate limit for {key} not available within {max_wait}s")
+            self.waits += 1
+            await asyncio.sleep(wait)
+            waited += wait
+
+    async def penalize(self, key: str, retry_after: float):
+        self.throttled += 1
+        logger.warning(f"WhatsApp throttled number {key}. Pausing for {retry_after:.1f}s.")
+        await self.backend.block(key, retry_after)
+
+    def stats(self):
+        return {
+            "backend": type(self.backend).__name__,
+            "waits": self.waits,
+            "throttled": self.throttled,
+        }
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After is either delta-seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def _build_backend():
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        return RedisRateLimitBackend(settings.REDIS_URL)
+    return LocalRateLimitBackend()
+
+rate_limiter = RateLimiter(_build_backend())
@@ -0,0 +1,176 @@
+from collections import defaultdict
+from typing import Optional
+from app.core.config import settings
+from app.services.rate_limit import parse_retry_after
+import asyncio
+import random
+import threading
+import time
+import httpx
+import logging
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class CircuitOpenError(Exception):
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"Circuit for {host} is open. Retry in {retry_in:.1f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+class ThrottledError(Exception):
+    """Throttling reported in a 200 body, e.g. GraphQL's THROTTLED error."""
+
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"{host} throttled the request. Retry in {retry_in:.1f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+def is_retryable(exc: Exception) -> bool:
+    """Network failures, timeouts, throttling and 5xx are worth another try."""
+    if isinstance(exc, (CircuitOpenError, ThrottledError)):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(exc, httpx.TransportError)
+
+def counts_against_host(exc: Exception) -> bool:
+    """Throttling means the host is up; only outages should open the circuit."""
+    if isinstance(exc, ThrottledError):
+        return False
+    if isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code == 429:
+        return False
+    return is_retryable(exc)
+
+def retry_after_hint(exc: Exception) -> Optional[float]:
+    if isinstance(exc, (CircuitOpenError, ThrottledError)):
+        return exc.retry_in
+    if isinstance(exc, httpx.HTTPStatusError):
+        return parse_retry_after(exc.response.headers.get("Retry-After"))
+    return None
+
+def backoff_delay(attempt: int, base: float, cap: float, exc: Exception = None) -> float:
+    """Exponential backoff with full jitter, never shorter than Retry-After."""
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    hint = retry_after_hint(exc) if exc is not None else None
+    return max(delay, hint) if hint is not None else delay
+
+class CircuitBreaker:
+    """
+    Per-host breaker: after failure_threshold consecutive failures the host
+    is short-circuited for reset_timeout, then a single probe is let through.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, host: str, failure_threshold: int, reset_timeout: float, counters=None):
+        self.host = host
+        self.counters = counters if counters is not None else defaultdict(int)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                retry_in = self.opened_at + self.reset_timeout - time.monotonic()
+                if retry_in > 0:
+                    raise CircuitOpenError(self.host, retry_in)
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    raise CircuitOpenError(self.host, self.reset_timeout)
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                if self.state != self.OPEN:
+                    self._transition(self.OPEN)
+
+    def _transition(self, state: str):
+        logger.warning(f"Circuit for {self.host}: {self.state} -> {state}")
+        self.state = state
+        self.counters[f"to_{state}"] += 1
+
+class Resilience:
+    def __init__(self):
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self.counters = defaultdict(lambda: defaultdict(int))
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(
+                    host, settings.CIRCUIT_FAILURE_THRESHOLD, settings.CIRCUIT_RESET_TIMEOUT,
+                    counters=self.counters[host]
+                )
+            return breaker
+
+    async def call(self, host: str, fn, retries: int = None):
+        """
+        Runs the coroutine factory fn through the host's breaker, retrying
+        retryable failures in-loop with jittered exponential backoff.
+        """
+        retries = settings.OUTBOUND_RETRIES if retries is None else retries
+        breaker = self.breaker(host)
+        counters = self.counters[host]
+        attempt = 0
+        while True:
+            try:
+                breaker.before_call()
+            except CircuitOpenError:
+                counters["short_circuited"] += 1
+                raise
+            try:
+                result = await fn()
+            except Exception as e:
+                if counts_against_host(e):
+                    breaker.record_failure()
+                    counters["failures"] += 1
+                else:
+                    # The host answered; the request was throttled or bad
+                    breaker.record_success()
+                    counters["rejected"] += 1
+                if not is_retryable(e) or attempt >= retries:
+                    raise
+                delay = backoff_delay(attempt, settings.OUTBOUND_BACKOFF_BASE, settings.OUTBOUND_BACKOFF_CAP, e)
+                counters["retries"] += 1
+                logger.warning(f"Retrying {host} in {delay:.2f}s after: {e}")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            breaker.record_success()
+            counters["successes"] += 1
+            return result
+
+    def stats(self):
+        return {
+            host: {"state": self.breaker(host).state, **dict(counters)}
+            for host, counters in list(self.counters.items())
+        }
+
+def task_retry_countdown(exc: Exception, retries: int) -> float:
+    """Celery countdown for a task-level retry of an outbound call."""
+    return backoff_delay(retries, settings.TASK_RETRY_BACKOFF_BASE, settings.TASK_RETRY_BACKOFF_CAP, exc)
+
+resilience = Resilience()
@@ -0,0 +1,172 @@
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict
+from app.core.config import settings
+from app.services.browser_pool import browser_pool
+import queue
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class OutboundMessage:
+    def __init__(self, phone: str, message: str, check: bool = False):
+        self.phone = phone
+        self.message = message
+        self.check = check # Look for an earlier send instead of sending
+        self.enqueued_at = time.monotonic()
+        self.future = Future()
+
+class _AccountQueue:
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.messages = queue.Queue()
+        self.worker = None
+        self.sent = 0
+        self.failed = 0
+        # (queue wait, send time) in seconds for the most recent messages
+        self.latencies = deque(maxlen=200)
+
+class AccountSendQueue:
+    """
+    Serializes Selenium sends per user_id into that user's pooled browser.
+
+    Each account gets one drainer thread. The drainer checks a session out of
+    the pool and keeps it for as long as messages keep arriving back-to-back
+    (up to batch_size), so a burst of orders for one merchant is sent from a
+    single live WhatsApp Web session.
+    """
+
+    def __init__(self, pool, batch_size: int, idle_timeout: float):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.idle_timeout = idle_timeout
+        self._accounts: Dict[int, _AccountQueue] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, user_id: int, phone: str, message: str, check: bool = False) -> Future:
+        item = OutboundMessage(phone, message, check)
+        with self._lock:
+            account = self._accounts.get(user_id)
+            if account is None:
+                account = self._accounts[user_id] = _AccountQueue(user_id)
+            account.messages.put(item)
+            if account.worker is None or not account.worker.is_alive():
+                account.worker = threading.Thread(
+                    target=self._drain, args=(account,), name=f"send-queue-{user_id}", daemon=True
+                )
+                account.worker.start()
+        return item.future
+
+    def send(self, user_id: int, phone: str, message: str, timeout: float = None):
+        """
+        Blocking helper for Celery tasks: enqueue and wait for the result.
+        """
+        return self.submit(user_id, phone, message).result(timeout=timeout)
+
+    def check(self, user_id: int, phone: str, message: str, timeout: float = None):
+        """
+        Blocking helper: whether an earlier send of message reached the chat
+        (see SeleniumWhatsApp.check). Queued like a send, on the same browser.
+        """
+        return self.submit(user_id, phone, message, check=True).result(timeout=timeout)
+
+    def _drain(self, account: _AccountQueue):
+        while True:
+            try:
+                first = account.messages.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                with self._lock:
+                    # Re-check under the lock so a concurrent submit never
+                    # enqueues onto a queue whose drainer is exiting.
+                    if account.messages.empty():
+                        account.worker = None
+                        return
+                continue
+            pending = first
+            while pending is not None:
+                pending = self._send_batch(account, pending)
+
+    def _send_batch(self, account: _AccountQueue, first: OutboundMessage):
+        """
+        Sends up to batch_size queued messages on one checked-out session.
+        Returns the next message if the batch limit was reached, so the
+        browser goes back to the pool between batches.
+        """
+        pending = first
+        try:
+            with self.pool.session(account.user_id) as bot:
+                for _ in range(self.batch_size):
+                    self._send_one(account, bot, pending)
+                    try:
+                        pending = account.messages.get_nowait()
+                    except queue.Empty:
+                        return None
+        except Exception as e:
+            logger.error(f"Send queue for user {account.user_id} failed: {e}")
+            self._fail(account, pending, e)
+            return None
+        return pending
+
+    def _send_one(self, account: _AccountQueue, bot, item: OutboundMessage):
+        if item.future.cancelled():
+            return
+        if item.check:
+            try:
+                item.future.set_result(bot.check(item.phone, item.message))
+            except Exception as e:
+                item.future.set_exception(e)
+                raise
+            return
+        started = time.monotonic()
+        try:
+            result = bot.send(item.phone, item.message)
+        except Exception as e:
+            self._fail(account, item, e)
+            raise
+        finished = time.monotonic()
+        account.latencies.append((started - item.enqueued_at, finished - started))
+        if result.ok:
+            account.sent += 1
+        else:
+            account.failed += 1
+        item.future.set_result(result)
+
+    def _fail(self, account: _AccountQueue, item: OutboundMessage, error: Exception):
+        if not item.future.done():
+            account.failed += 1
+            item.future.set_exception(error)
+
+    def depth(self, user_id: int) -> int:
+        account = self._accounts.get(user_id)
+        return account.messages.qsize() if account else 0
+
+    def stats(self):
+        result = {}
+        with self._lock:
+            accounts = list(self._accounts.values())
+        for account in accounts:
+            latencies = list(account.latencies)
+            waits = sorted(w for w, _ in latencies)
+            sends = sorted(s for _, s in latencies)
+            result[account.user_id] = {
+                "depth": account.messages.qsize(),
+                "sent": account.sent,
+                "failed": account.failed,
+                "queue_wait_p50_ms": _percentile_ms(waits, 0.5),
+                "send_p50_ms": _percentile_ms(sends, 0.5),
+                "send_max_ms": round(sends[-1] * 1000) if sends else None,
+            }
+        return result
+
+def _percentile_ms(values, q):
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(len(values) * q))] * 1000)
+
+send_queue = AccountSendQueue(
+    browser_pool,
+    batch_size=settings.SEND_QUEUE_BATCH_SIZE,
+    idle_timeout=settings.SEND_QUEUE_IDLE_TIMEOUT,
+)
@@ -1,48 +1,272 @@
-import httpx
 from app.core.config import settings
+from app.services.http_client import http_clients
+from app.services.rate_limit import parse_retry_after
+from app.services.resilience import ThrottledError, resilience
+import asyncio
+import threading
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+class ShopifyThrottle:
+    """
+    Client-side mirror of each shop's leaky bucket. REST responses report
+    the fill level in X-Shopify-Shop-Api-Call-Limit ("used/limit"), GraphQL
+    responses in extensions.cost; in between, the bucket is assumed to leak
+    at the shop's restore rate. Calls wait for room instead of running into
+    429s, and concurrent callers reserve their cost up front.
+    """
+
+    def __init__(self, headroom: float, clock=time.monotonic, sleep=asyncio.sleep):
+        self.headroom = headroom
+        self.clock = clock
+        self.sleep = sleep # Both injectable, so tests can run on a fake clock
+        self._buckets = {} # key -> [level, capacity, leak_rate, updated]
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.throttled = 0
+
+    def _bucket(self, key: str, capacity: float, leak_rate: float, now: float):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [0.0, capacity, leak_rate, now]
+        # Leak since the last observation (updated may lie ahead after a 429)
+        bucket[0] = max(0.0, bucket[0] - max(0.0, now - bucket[3]) * bucket[2])
+        bucket[3] = max(now, bucket[3])
+        return bucket
+
+    def reserve(self, key: str, cost: float, capacity: float, leak_rate: float) -> float:
+        """Takes cost from the bucket, or returns how long to wait for room."""
+        now = self.clock()
+        with self._lock:
+            bucket = self._bucket(key, capacity, leak_rate, now)
+            level, capacity, leak_rate, updated = bucket
+            room = capacity * self.headroom
+            # Slack for float leftovers of the leak, or a wait could round to
+            # nothing; an empty bucket always admits one call, however expensive
+            if level + cost <= room + 1e-6 or (level == 0 and updated <= now):
+                bucket[0] = level + cost
+                return 0.0
+            return max(updated - now, 0.0) + (level + cost - room) / leak_rate
+
+    async def acquire(self, key: str, cost: float, capacity: float, leak_rate: float):
+        while True:
+            wait = self.reserve(key, cost, capacity, leak_rate)
+            if wait <= 0:
+                return
+            self.waits += 1
+            await self.sleep(wait)
+
+    def observe(self, key: str, level: float, capacity: float, leak_rate: float):
+        """Replaces our estimate with what the shop reported."""
+        now = self.clock()
+        with self._lock:
+            bucket = self._bucket(key, capacity, leak_rate, now)
+            bucket[0], bucket[1], bucket[2] = level, capacity, leak_rate
+
+    def penalize(self, key: str, retry_after: float, capacity: float, leak_rate: float):
+        """The shop throttled us anyway: treat the bucket as full for retry_after."""
+        self.throttled += 1
+        now = self.clock()
+        with self._lock:
+            bucket = self._bucket(key, capacity, leak_rate, now)
+            bucket[0] = bucket[1]
+            bucket[3] = now + retry_after
+
+    def stats(self):
+        now = self.clock()
+        with self._lock:
+            levels = {
+                key: round(max(0.0, level - max(0.0, now - updated) * leak_rate), 1)
+                for key, (level, capacity, leak_rate, updated) in self._buckets.items()
+            }
+        return {"waits": self.waits, "throttled": self.throttled, "levels": levels}
+
+def parse_call_limit(value: str):
+    """X-Shopify-Shop-Api-Call-Limit, e.g. "32/40" -> (32, 40)."""
+    try:
+        used, limit = (int(part) for part in value.split("/"))
+    except (AttributeError, ValueError):
+        return None
+    return used, limit
+
+class ShopifyUserError(Exception):
+    """Shopify rejected the query or a mutation; retrying won't help."""
+
+# kind -> (aliased mutation, variable types); {i} is the operation's index.
+# Every payload aliases its user errors to "errors" so results read alike.
+ORDER_MUTATIONS = {
+    "cancel": (
+        "orderCancel(orderId: $id{i}, reason: CUSTOMER, refund: false, restock: true, notifyCustomer: false) "
+        "{ job { id } errors: orderCancelUserErrors { field message } }",
+        {"id": "ID!"},
+    ),
+    "note": (
+        "orderUpdate(input: {id: $id{i}, note: $value{i}}) { order { id } errors: userErrors { field message } }",
+        {"id": "ID!", "value": "String"},
+    ),
+    "tag": (
+        "tagsAdd(id: $id{i}, tags: $value{i}) { node { id } errors: userErrors { field message } }",
+        {"id": "ID!", "value": "[String!]!"},
+    ),
+}
+MUTATION_COST = 10 # Shopify's cost of one mutation field
+
+def order_gid(shopify_order_id) -> str:
+    return f"gid://shopify/Order/{shopify_order_id}"
+
+def build_order_mutations(operations):
+    """One mutation document for (kind, shopify_order_id, value) operations."""
+    declarations, fields, variables = [], [], {}
+    for i, (kind, shopify_order_id, value) in enumerate(operations):
+        field, types = ORDER_MUTATIONS[kind]
+        declarations += [f"$id{i}: {types['id']}"] + ([f"$value{i}: {types['value']}"] if "value" in types else [])
+        fields.append(f"op{i}: " + field.replace("{i}", str(i)))
+        variables[f"id{i}"] = order_gid(shopify_order_id)
+        if "value" in types:
+            variables[f"value{i}"] = value
+    return f"mutation({', '.join(declarations)}) {{ {' '.join(fields)} }}", variables
+
+shopify_throttle = ShopifyThrottle(headroom=settings.SHOPIFY_THROTTLE_HEADROOM)
+
 class ShopifyService:
-    def __init__(self):
-        # Assuming we have these in settings, though not added yet.
-        # In a real app, we'd need the shop URL and an access token.
-        self.shop_url = "your-shop.myshopify.com" 
-        self.access_token = "your_access_token"
-        self.base_url = f"https://{self.shop_url}/admin/api/2023-07"
+    def __init__(self, shop_url: str = None, access_token: str = None, client=None):
+        self.shop_url = shop_url or settings.SHOPIFY_SHOP_URL
+        self.access_token = access_token or settings.SHOPIFY_ACCESS_TOKEN
+        self.base_url = f"https://{self.shop_url}/admin/api/{settings.SHOPIFY_API_VERSION}"
         self.headers = {
             "X-Shopify-Access-Token": self.access_token,
             "Content-Type": "application/json"
         }
+        # Tests pass a client bound to a stub shop; otherwise the shared pool
+        self.client = client
+        self.rest_bucket = f"{self.shop_url}:rest"
+        self.graphql_bucket = f"{self.shop_url}:graphql"
 
-    async def cancel_order(self, shopify_order_id: str):
-        url = f"{self.base_url}/orders/{shopify_order_id}/cancel.json"
-        async with httpx.AsyncClient() as client:
+    @classmethod
+    def for_user(cls, user, client=None):
+        """The user's own shop when connected, else the default shop."""
+        if user is not None and user.shopify_shop_domain and user.shopify_access_token:
+            return cls(user.shopify_shop_domain, user.shopify_access_token, client=client)
+        return shopify_service
+
+    async def _http(self, method: str, url: str, **kwargs):
+        if self.client is not None:
+            return await self.client.request(method, url, headers=self.headers, **kwargs)
+        return await http_clients.request(method, url, headers=self.headers, **kwargs)
+
+    async def _send(self, method: str, url: str, **kwargs):
+        async def attempt():
+            await shopify_throttle.acquire(
+                self.rest_bucket, 1, settings.SHOPIFY_REST_BUCKET_SIZE, settings.SHOPIFY_REST_LEAK_RATE
+            )
+            response = await self._http(method, url, **kwargs)
+            call_limit = parse_call_limit(response.headers.get("X-Shopify-Shop-Api-Call-Limit"))
+            if call_limit:
+                shopify_throttle.observe(self.rest_bucket, *call_limit, settings.SHOPIFY_REST_LEAK_RATE)
+            if response.status_code == 429:
+                retry_after = parse_retry_after(response.headers.get("Retry-After")) or 1.0
+                shopify_throttle.penalize(
+                    self.rest_bucket, retry_after, settings.SHOPIFY_REST_BUCKET_SIZE, settings.SHOPIFY_REST_LEAK_RATE
+                )
+            response.raise_for_status()
+            return response
+
+        return await resilience.call(self.shop_url, attempt)
+
+    async def _request(self, method: str, path: str, **kwargs):
+        response = await self._send(method, f"{self.base_url}{path}", **kwargs)
+        return response.json()
+
+    async def graphql(self, query: str, variables: dict = None, cost: float = 1):
+        """
+        Runs a GraphQL Admin API query. cost is our estimate, reserved from
+        the shop's point bucket; the real figures come back in the response.
+        """
+        async def attempt():
+            await shopify_throttle.acquire(
+                self.graphql_bucket, cost, settings.SHOPIFY_GRAPHQL_BUCKET_SIZE, settings.SHOPIFY_GRAPHQL_RESTORE_RATE
+            )
+            response = await self._http("POST", f"{self.base_url}/graphql.json", json={"query": query, "variables": variables or {}})
+            response.raise_for_status()
+            body = response.json()
+
+            status = body.get("extensions", {}).get("cost", {}).get("throttleStatus")
+            if status:
+                capacity = status["maximumAvailable"]
+                shopify_throttle.observe(
+                    self.graphql_bucket, capacity - status["currentlyAvailable"], capacity, status["restoreRate"]
+                )
+            errors = body.get("errors") or []
+            if any(error.get("extensions", {}).get("code") == "THROTTLED" for error in errors):
+                restore_rate = status["restoreRate"] if status else settings.SHOPIFY_GRAPHQL_RESTORE_RATE
+                available = status["currentlyAvailable"] if status else 0
+                retry_in = max(cost - available, 0) / restore_rate
+                raise ThrottledError(self.shop_url, retry_in)
+            if errors:
+                raise ShopifyUserError(f"GraphQL errors: {errors}")
+            return body["data"]
+
+        return await resilience.call(self.shop_url, attempt)
+
+    async def bulk_update_orders(self, operations):
+        """
+        Applies (kind, shopify_order_id, value) operations - kinds are the
+        keys of ORDER_MUTATIONS - as aliased mutations, many per request.
+        Returns one entry per operation: the mutation payload, or the
+        exception that operation (or its whole request) failed with.
+        """
+        results = []
+        size = settings.SHOPIFY_GRAPHQL_BATCH_SIZE
+        for start in range(0, len(operations), size):
+            chunk = operations[start:start + size]
+            query, variables = build_order_mutations(chunk)
             try:
-                response = await client.post(url, headers=self.headers, json={})
-                response.raise_for_status()
-                return response.json()
+                data = await self.graphql(query, variables, cost=MUTATION_COST * len(chunk))
             except Exception as e:
-                logger.error(f"Failed to cancel Shopify order {shopify_order_id}: {e}")
-                # Don't raise, just log for now
-                return None
+                logger.error(f"Bulk order update of {len(chunk)} orders on {self.shop_url} failed: {e}")
+                results.extend([e] * len(chunk))
+                continue
+            for i, (kind, shopify_order_id, _) in enumerate(chunk):
+                payload = data.get(f"op{i}") or {}
+                if payload.get("errors"):
+                    results.append(ShopifyUserError(f"{kind} on order {shopify_order_id}: {payload['errors']}"))
+                else:
+                    results.append(payload)
+        return results
+
+    async def cancel_orders(self, shopify_order_ids):
+        return await self.bulk_update_orders([("cancel", order_id, None) for order_id in shopify_order_ids])
+
+    async def list_orders(self, params: dict = None, page_url: str = None):
+        """
+        One page of the orders list. Returns the raw response so callers can
+        follow its Link header (page_url).
+        """
+        if page_url:
+            return await self._send("GET", page_url)
+        return await self._send("GET", f"{self.base_url}/orders.json", params=params)
+
+    async def cancel_order(self, shopify_order_id: str):
+        try:
+            return await self._request("POST", f"/orders/{shopify_order_id}/cancel.json", json={})
+        except Exception as e:
+            logger.error(f"Failed to cancel Shopify order {shopify_order_id}: {e}")
+            # Callers decide whether to retry (see resilience.is_retryable)
+            raise
 
     async def add_order_note(self, shopify_order_id: str, note: str):
-        url = f"{self.base_url}/orders/{shopify_order_id}.json"
         payload = {
             "order": {
                 "id": shopify_order_id,
                 "note": note
             }
         }
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.put(url, headers=self.headers, json=payload)
-                response.raise_for_status()
-                return response.json()
-            except Exception as e:
-                logger.error(f"Failed to update Shopify order {shopify_order_id}: {e}")
-                return None
+        try:
+            return await self._request("PUT", f"/orders/{shopify_order_id}.json", json=payload)
+        except Exception as e:
+            logger.error(f"Failed to update Shopify order {shopify_order_id}: {e}")
+            raise
 
 shopify_service = ShopifyService()
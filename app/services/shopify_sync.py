@@ -0,0 +1,267 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import bindparam, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.db.models import Order, OrderStatus, ShopifySyncState, User
+from app.db.upsert import insert_ignore_many
+from app.schemas.webhooks import ShopifyOrdersPage, parse_payload
+from app.services.analytics import record_transitions
+from app.services.ingest import order_values
+from app.services.shopify import ShopifyService
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Only what order_values() needs; keeps pages small
+SYNC_FIELDS = "id,order_number,phone,customer,total_price,currency,financial_status,fulfillment_status,created_at,updated_at,cancelled_at"
+
+def parse_timestamp(value: str):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+async def _orders(pages):
+    async for page in pages:
+        for order in page:
+            yield order
+
+async def _batched(items, size: int):
+    batch = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class ShopifySync:
+    """
+    Backfills and reconciles a user's orders from the Admin API. Pages are
+    streamed through a generator pipeline into batched upserts, and the
+    cursor is saved with every batch so an interrupted run resumes.
+
+    New orders are paged by since_id; on incremental runs, orders changed
+    since the last run are paged by updated_at_min to pick up status changes.
+    """
+
+    def __init__(self, page_size: int, batch_size: int, client=None):
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.client = client # Stub shop in tests
+
+    async def _fetch(self, shop: ShopifyService, params: dict = None, page_url: str = None):
+        # ShopifyService paces these against the shop's call bucket
+        response = await shop.list_orders(params=params, page_url=page_url)
+        return response, parse_payload(ShopifyOrdersPage, response.content).orders
+
+    async def new_order_pages(self, shop: ShopifyService, since_id: int):
+        while True:
+            _, orders = await self._fetch(shop, {
+                "status": "any", "limit": self.page_size, "since_id": since_id, "fields": SYNC_FIELDS
+            })
+            if orders:
+                yield orders
+            if len(orders) < self.page_size:
+                return
+            since_id = max(int(order.id) for order in orders)
+
+    async def updated_order_pages(self, shop: ShopifyService, updated_at_min: datetime):
+        response, orders = await self._fetch(shop, {
+            "status": "any", "limit": self.page_size, "fields": SYNC_FIELDS,
+            "updated_at_min": updated_at_min.isoformat()
+        })
+        while True:
+            if orders:
+                yield orders
+            # Cursor pagination: the next page is only reachable via the Link header
+            next_url = response.links.get("next", {}).get("url")
+            if not next_url:
+                return
+            response, orders = await self._fetch(shop, page_url=next_url)
+
+    def _begin(self, user_id: int):
+        """
+        Claims the user's sync; returns (cursor, shop), (None, None) for an
+        unknown user, or (None, False) while another run holds the claim.
+        """
+        db = SessionLocal()
+        try:
+            user = db.query(User).filter(User.id == user_id).first()
+            if user is None:
+                return None, None
+            if db.get(ShopifySyncState, user_id) is None:
+                db.add(ShopifySyncState(user_id=user_id, since_id=0, orders_imported=0, orders_updated=0, status="idle"))
+                try:
+                    db.commit()
+                except IntegrityError:
+                    db.rollback() # Created by a concurrent run; the claim below decides
+
+            # One conditional UPDATE, so overlapping runs (a schedule tick and a
+            # manual sync) can't both hold it. A run that has been "running" for
+            # longer than SHOPIFY_SYNC_STALE_AFTER died without finishing.
+            now = datetime.now(timezone.utc)
+            stale_before = now - timedelta(seconds=settings.SHOPIFY_SYNC_STALE_AFTER)
+            previous = db.get(ShopifySyncState, user_id)
+            claimed = db.execute(
+                update(ShopifySyncState)
+                .where(
+                    ShopifySyncState.user_id == user_id,
+                    or_(
+                        ShopifySyncState.status.is_(None),
+                        ShopifySyncState.status != "running",
+                        ShopifySyncState.started_at.is_(None),
+                        ShopifySyncState.started_at < stale_before,
+                    ),
+                )
+                .values(status="running", last_error=None, started_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            if claimed.rowcount != 1:
+                db.rollback()
+                return None, False
+            if previous.status == "running":
+                logger.warning(f"Shopify sync for user {user_id} started at {previous.started_at} never finished; treating it as failed.")
+            db.commit()
+            db.refresh(previous)
+            cursor = (previous.since_id or 0, previous.updated_at_min)
+            return cursor, ShopifyService.for_user(user, client=self.client)
+        finally:
+            db.close()
+
+    def _store(self, user_id: int, orders, advance_cursor: bool):
+        """Upserts one batch; returns (order ids to confirm, imported, updated)."""
+        rows = {}
+        cancelled = set()
+        for order in orders:
+            values = order_values(user_id, order)
+            # Placed when Shopify says, so backfilled history lands on the right day
+            values["created_at"] = parse_timestamp(order.created_at) or datetime.now(timezone.utc)
+            if order.cancelled_at:
+                values["status"] = OrderStatus.CANCELLED
+                cancelled.add(values["shopify_order_id"])
+            rows[values["shopify_order_id"]] = (values, order)
+
+        confirm_after = datetime.now(timezone.utc) - timedelta(seconds=settings.SHOPIFY_SYNC_CONFIRM_WITHIN)
+        db = SessionLocal()
+        try:
+            inserted = insert_ignore_many(db, Order, [values for values, _ in rows.values()], "shopify_order_id")
+            new_keys = {key for _, key in inserted}
+            transitions = [
+                (user_id, rows[key][0]["created_at"], None, rows[key][0]["status"], parse_timestamp(rows[key][1].cancelled_at))
+                for _, key in inserted
+            ]
+
+            existing = [values for key, (values, _) in rows.items() if key not in new_keys]
+            if existing:
+                # Remote status fields only; our own workflow status is left alone
+                db.execute(
+                    update(Order.__table__)
+                    .where(Order.__table__.c.shopify_order_id == bindparam("key"))
+                    .values(financial_status=bindparam("financial"), fulfillment_status=bindparam("fulfillment")),
+                    [
+                        {"key": v["shopify_order_id"], "financial": v["financial_status"], "fulfillment": v["fulfillment_status"]}
+                        for v in existing
+                    ]
+                )
+            cancelled_existing = cancelled - new_keys
+            if cancelled_existing:
+                pending = db.execute(
+                    select(Order.id, Order.created_at, Order.shopify_order_id)
+                    .where(Order.shopify_order_id.in_(cancelled_existing), Order.status == OrderStatus.PENDING)
+                    .with_for_update()
+                ).all()
+                if pending:
+                    db.execute(
+                        update(Order)
+                        .where(Order.id.in_([order_id for order_id, _, _ in pending]))
+                        .values(status=OrderStatus.CANCELLED, followup_stage=None, followup_due_at=None)
+                        .execution_options(synchronize_session=False)
+                    )
+                    transitions += [
+                        (user_id, created_at, OrderStatus.PENDING, OrderStatus.CANCELLED, parse_timestamp(rows[key][1].cancelled_at))
+                        for _, created_at, key in pending
+                    ]
+            record_transitions(db, transitions)
+
+            state = db.query(ShopifySyncState).filter(ShopifySyncState.user_id == user_id).first()
+            if advance_cursor:
+                state.since_id = max(state.since_id or 0, max(int(order.id) for order in orders))
+            state.orders_imported = (state.orders_imported or 0) + len(inserted)
+            state.orders_updated = (state.orders_updated or 0) + len(existing)
+            db.commit()
+        finally:
+            db.close()
+
+        # Orders we missed recently still get their confirmation; history doesn't
+        confirm = []
+        for order_id, key in inserted:
+            values, order = rows[key]
+            created = parse_timestamp(order.created_at)
+            if key not in cancelled and created is not None and created >= confirm_after:
+                confirm.append(order_id)
+        return confirm, len(inserted), len(existing)
+
+    def _finish(self, user_id: int, status: str, updated_at_min: datetime = None, error: str = None):
+        db = SessionLocal()
+        try:
+            state = db.query(ShopifySyncState).filter(ShopifySyncState.user_id == user_id).first()
+            state.status = status
+            state.last_error = error
+            state.finished_at = datetime.now(timezone.utc)
+            if updated_at_min is not None:
+                state.updated_at_min = updated_at_min
+            db.commit()
+        finally:
+            db.close()
+
+    async def _consume(self, user_id: int, pages, advance_cursor: bool, summary: dict):
+        from app.worker.tasks import send_order_confirmation
+
+        async for batch in _batched(_orders(pages), self.batch_size):
+            confirm, imported, updated = await asyncio.to_thread(self._store, user_id, batch, advance_cursor)
+            summary["imported"] += imported
+            summary["updated"] += updated
+            for order_id in confirm:
+                send_order_confirmation.apply_async(args=[order_id], countdown=10)
+            summary["confirmations"] += len(confirm)
+
+    async def run(self, user_id: int):
+        cursor, shop = await asyncio.to_thread(self._begin, user_id)
+        if shop is False:
+            logger.info(f"Shopify sync for user {user_id} is already running. Skipping.")
+            return {"status": "running"}
+        if cursor is None:
+            logger.error(f"Shopify sync: user {user_id} not found.")
+            return None
+        since_id, updated_at_min = cursor
+        if updated_at_min is not None and updated_at_min.tzinfo is None:
+            updated_at_min = updated_at_min.replace(tzinfo=timezone.utc) # SQLite drops the offset
+        started = datetime.now(timezone.utc)
+        summary = {"imported": 0, "updated": 0, "confirmations": 0}
+
+        logger.info(f"Shopify sync for user {user_id} from since_id={since_id}, updated_at_min={updated_at_min}")
+        try:
+            await self._consume(user_id, self.new_order_pages(shop, since_id), True, summary)
+            if updated_at_min is not None:
+                # First runs import everything above; later runs also reconcile changes
+                await self._consume(user_id, self.updated_order_pages(shop, updated_at_min), False, summary)
+        except Exception as e:
+            logger.error(f"Shopify sync for user {user_id} failed: {e}")
+            await asyncio.to_thread(self._finish, user_id, "failed", None, str(e))
+            raise
+
+        next_cursor = started - timedelta(seconds=settings.SHOPIFY_SYNC_OVERLAP)
+        await asyncio.to_thread(self._finish, user_id, "idle", next_cursor)
+        logger.info(f"Shopify sync for user {user_id} finished: {summary}")
+        return summary
+
+shopify_sync = ShopifySync(
+    page_size=settings.SHOPIFY_SYNC_PAGE_SIZE,
+    batch_size=settings.SHOPIFY_SYNC_BATCH_SIZE,
+)
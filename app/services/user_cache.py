@@ -0,0 +1,88 @@
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.db.models import User
+import hashlib
+import hmac
+import logging
+
+logger = logging.getLogger(__name__)
+
+class WebhookUser:
+    """What the webhook path needs to know about a user, precomputed."""
+
+    __slots__ = ("user_id", "is_active", "hmac_key")
+
+    def __init__(self, user_id: int, is_active: bool, secret: str):
+        self.user_id = user_id
+        self.is_active = is_active
+        # Keyed once; each request copies it instead of re-deriving the pads
+        self.hmac_key = hmac.new(secret.encode("utf-8"), digestmod=hashlib.sha256)
+
+    def sign(self, body: bytes) -> bytes:
+        mac = self.hmac_key.copy()
+        mac.update(body)
+        return mac.digest()
+
+class WebhookUserCache:
+    """
+    user_id -> WebhookUser, so authenticating a webhook costs no query.
+    Unknown ids are cached too (briefly). Entries are dropped whenever a
+    commit touches the user; other processes catch up within the TTL.
+    """
+
+    _UNKNOWN = False
+
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: float):
+        self.negative_ttl = negative_ttl
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def _load(self, db, user_id: int):
+        row = (await db.execute(
+            select(User.id, User.is_active, User.shopify_webhook_secret).where(User.id == user_id)
+        )).first()
+        if row is None:
+            return None
+        return WebhookUser(row.id, bool(row.is_active), row.shopify_webhook_secret or settings.SHOPIFY_WEBHOOK_SECRET)
+
+    async def get(self, db, user_id: int):
+        entry = self._cache.get(user_id)
+        if entry is None:
+            entry = await self._load(db, user_id)
+            if entry is None:
+                self._cache.set(user_id, self._UNKNOWN, ttl=self.negative_ttl)
+                return None
+            self._cache.set(user_id, entry)
+        return entry or None
+
+    def invalidate(self, user_id: int):
+        self._cache.pop(user_id)
+
+    def stats(self):
+        return self._cache.stats()
+
+webhook_users = WebhookUserCache(
+    maxsize=settings.USER_CACHE_SIZE,
+    ttl=settings.USER_CACHE_TTL,
+    negative_ttl=settings.USER_CACHE_NEGATIVE_TTL,
+)
+
+# Invalidate on commit (not flush), so a concurrent request can't re-cache
+# the old row between the UPDATE and the COMMIT.
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _track_changed_user(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_user_ids", set()).add(target.id)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop("changed_user_ids", ()):
+        webhook_users.invalidate(user_id)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_users(session):
+    session.info.pop("changed_user_ids", None)
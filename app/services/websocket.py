@@ -1,34 +1,293 @@
+from collections import defaultdict, deque
 from fastapi import WebSocket
-from typing import List
+from typing import Dict, Optional
+from app.core.cache import TTLCache
+from app.core.config import settings
+import asyncio
+import uuid
 import logging
 
+try:
+    from orjson import dumps as _dumps
+
+    def dumps(message) -> str:
+        return _dumps(message).decode()
+except ImportError: # Falls back to the stdlib encoder
+    from json import dumps
+
 logger = logging.getLogger(__name__)
 
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+DROP_OLDEST = "drop_oldest"
+DISCONNECT = "disconnect"
+
+PING = '{"type":"ping"}'
+CLOSE_GOING_AWAY = 1001
+CLOSE_TRY_AGAIN_LATER = 1013
+
+class UserHistory:
+    """
+    A user's recent events, numbered. The epoch names this sequence: it
+    changes whenever numbering restarts (another process, a restart, or the
+    history expiring), so a seq is only comparable within its epoch.
+    """
+
+    def __init__(self, size: int):
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.events = deque(maxlen=size)
+
+    def record(self, payload: str) -> str:
+        self.seq += 1
+        # Prepend seq/epoch to the serialized object instead of re-encoding it
+        header = f'{{"seq":{self.seq},"epoch":"{self.epoch}"'
+        framed = header + ("," + payload[1:] if payload != "{}" else "}")
+        self.events.append((self.seq, framed))
+        return framed
+
+    def since(self, last_seq: int):
+        """Events after last_seq, or None if some of them were evicted."""
+        if last_seq > self.seq:
+            return None
+        oldest = self.events[0][0] if self.events else self.seq + 1
+        if last_seq + 1 < oldest:
+            return None
+        return [framed for seq, framed in self.events if seq > last_seq]
+
+class ClientConnection:
+    """
+    One dashboard socket with a bounded outbox drained by its own writer
+    task, so a slow client only ever delays itself.
+    """
+
+    def __init__(self, websocket: WebSocket, user_id: int, queue_size: int, on_close):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.loop = asyncio.get_running_loop()
+        self.on_close = on_close
+        self.writer = self.loop.create_task(self._write())
+        self.sent = 0
+        self.dropped = 0
+        self.last_seen = self.last_ping = self.loop.time()
+
+    async def _write(self):
+        try:
+            while True:
+                payload = await self.queue.get()
+                await asyncio.wait_for(self.websocket.send_text(payload), settings.WS_SEND_TIMEOUT)
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Dropping WebSocket of user {self.user_id}: {e}")
+            self.on_close(self, "failed")
+
+    def offer(self, payload: str, policy: str):
+        # Producers may be on another loop or thread (worker loop, flusher)
+        if self.loop is not _running_loop():
+            self.loop.call_soon_threadsafe(self.offer, payload, policy)
+            return
+        if self.writer.done():
+            return
+        try:
+            self.queue.put_nowait(payload)
+            return
+        except asyncio.QueueFull:
+            pass
+        if policy == DISCONNECT:
+            logger.warning(f"WebSocket of user {self.user_id} is too slow. Disconnecting.")
+            self.on_close(self, "slow")
+            return
+        self.queue.get_nowait() # Newest events matter most on a dashboard
+        self.queue.put_nowait(payload)
+        self.dropped += 1
+
+    async def close(self, code: int = 1000):
+        self.writer.cancel()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass # Already gone
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    """
+    Dashboard sockets indexed by user, so an event only reaches the sockets
+    of the merchant it belongs to. Each event is serialized once and handed
+    to the connections' outboxes; the producer never waits on a client.
+    """
+
+    def __init__(self, queue_size: int, policy: str, replay_size: int, replay_ttl: float, replay_users: int,
+                 max_connections: int, max_per_user: int, ping_interval: float, pong_timeout: float):
+        self.queue_size = queue_size
+        self.policy = policy
+        self.max_connections = max_connections
+        self.max_per_user = max_per_user
+        self.ping_interval = ping_interval
+        self.pong_timeout = pong_timeout
+        self._heartbeat = None
+        self.replay_size = replay_size
+        self.histories = TTLCache(maxsize=replay_users, ttl=replay_ttl)
+        self.connections: Dict[int, Dict[WebSocket, ClientConnection]] = defaultdict(dict)
+        self.total = 0
+        self.counters = defaultdict(int)
 
-    async def connect(self, websocket: WebSocket):
+    def _history(self, user_id: int) -> UserHistory:
+        history = self.histories.get(user_id)
+        if history is None:
+            history = UserHistory(self.replay_size)
+        self.histories.set(user_id, history) # Active users stay
+        return history
+
+    async def connect(self, websocket: WebSocket, user_id: int, last_seq: Optional[int] = None, epoch: Optional[str] = None) -> bool:
+        """
+        Registers the socket, or closes it and returns False when a
+        connection cap is reached. A reconnecting dashboard passes the last
+        seq (and epoch) it saw and gets just the events it missed; if those
+        are gone it is told to resync from the REST endpoints instead.
+        """
         await websocket.accept()
-        self.active_connections.append(websocket)
-        print(f"DEBUG: WebSocket connected. Total: {len(self.active_connections)}")
-        logger.info(f"WebSocket connected. Total: {len(self.active_connections)}")
-
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-            print(f"DEBUG: WebSocket disconnected. Total: {len(self.active_connections)}")
-            logger.info(f"WebSocket disconnected. Total: {len(self.active_connections)}")
-
-    async def broadcast(self, message: dict):
-        print(f"DEBUG: Broadcasting message to {len(self.active_connections)} clients")
-        logger.info(f"Broadcasting message to {len(self.active_connections)} clients")
-        for connection in self.active_connections:
+        if self.total >= self.max_connections or len(self.connections.get(user_id, ())) >= self.max_per_user:
+            self.counters["rejected"] += 1
+            logger.warning(f"Rejecting WebSocket of user {user_id}: connection cap reached")
+            await websocket.close(code=CLOSE_TRY_AGAIN_LATER)
+            return False
+        # No awaits from here on: nothing can be published between the
+        # replay and the registration, so no event is missed or doubled.
+        connection = ClientConnection(websocket, user_id, self.queue_size, self._closed)
+        history = self._history(user_id)
+        missed = None
+        if last_seq is not None and epoch == history.epoch:
+            missed = history.since(last_seq)
+        if missed is not None and len(missed) <= self.queue_size:
+            for framed in missed:
+                connection.queue.put_nowait(framed)
+            self.counters["replayed"] += len(missed)
+        else:
+            # Fresh dashboards and ones past the gap load a snapshot over REST
+            if last_seq is not None:
+                self.counters["resyncs"] += 1
+            kind = "hello" if last_seq is None else "resync"
+            connection.queue.put_nowait(dumps({"type": kind, "seq": history.seq, "epoch": history.epoch}))
+
+        self.connections[user_id][websocket] = connection
+        self.total += 1
+        logger.info(f"WebSocket connected for user {user_id}. Total: {self.total}")
+        return True
+
+    def touch(self, websocket: WebSocket, user_id: int):
+        """The client said something (a pong or anything else): it's alive."""
+        connection = self.connections.get(user_id, {}).get(websocket)
+        if connection is not None:
+            connection.last_seen = connection.loop.time()
+
+    def check_heartbeats(self):
+        """Reaps sockets that stopped answering and pings the ones due."""
+        now = asyncio.get_running_loop().time()
+        deadline = self.ping_interval + self.pong_timeout
+        for sockets in list(self.connections.values()):
+            for connection in list(sockets.values()):
+                if now - connection.last_seen > deadline:
+                    # Half-open: a laptop went to sleep, a proxy dropped the flow
+                    logger.info(f"Reaping silent WebSocket of user {connection.user_id}")
+                    self._closed(connection, "reaped", CLOSE_GOING_AWAY)
+                elif now - connection.last_ping >= self.ping_interval:
+                    connection.last_ping = now
+                    connection.offer(PING, self.policy)
+                    self.counters["pings"] += 1
+
+    async def _run_heartbeats(self):
+        # One sweep for all sockets instead of a timer per socket
+        while True:
+            await asyncio.sleep(min(self.ping_interval, self.pong_timeout) / 2)
             try:
-                await connection.send_json(message)
+                self.check_heartbeats()
             except Exception as e:
-                print(f"DEBUG: Error broadcasting: {e}")
-                logger.error(f"Error broadcasting to client: {e}")
-                self.disconnect(connection)
+                logger.error(f"WebSocket heartbeat sweep failed: {e}")
+
+    def start(self):
+        if self._heartbeat is None:
+            self._heartbeat = asyncio.get_running_loop().create_task(self._run_heartbeats())
+
+    async def stop(self):
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            try:
+                await self._heartbeat
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat = None
+        for sockets in list(self.connections.values()):
+            for connection in list(sockets.values()):
+                self._closed(connection, "shutdown", CLOSE_GOING_AWAY)
+
+    def _remove(self, websocket: WebSocket, user_id: int):
+        sockets = self.connections.get(user_id)
+        if sockets is None or websocket not in sockets:
+            return None
+        connection = sockets.pop(websocket)
+        if not sockets:
+            del self.connections[user_id]
+        self.total -= 1
+        self.counters["sent"] += connection.sent
+        self.counters["dropped"] += connection.dropped
+        logger.info(f"WebSocket disconnected for user {user_id}. Total: {self.total}")
+        return connection
+
+    def _closed(self, connection: ClientConnection, reason: str, code: int = 1000):
+        # Called from a writer, a producer or the heartbeat; the socket may still be open
+        if self._remove(connection.websocket, connection.user_id) is not None:
+            self.counters[f"{reason}_disconnects"] += 1
+            connection.loop.create_task(connection.close(code))
+
+    def disconnect(self, websocket: WebSocket, user_id: int):
+        connection = self._remove(websocket, user_id)
+        if connection is not None:
+            connection.writer.cancel()
+
+    def send_payload(self, user_id: int, payload: str):
+        """
+        Numbers an already serialized event and queues it for the user's
+        sockets. Kept for replay even when none are connected right now.
+        """
+        framed = self._history(user_id).record(payload)
+        for connection in list(self.connections.get(user_id, {}).values()):
+            connection.offer(framed, self.policy)
+
+    async def send_to_user(self, user_id: int, message: dict):
+        self.send_payload(user_id, dumps(message))
+
+    def stats(self):
+        live = [c for sockets in self.connections.values() for c in sockets.values()]
+        return {
+            "connections": self.total,
+            "users": len(self.connections),
+            "queued": sum(c.queue.qsize() for c in live),
+            "sent": self.counters["sent"] + sum(c.sent for c in live),
+            "dropped": self.counters["dropped"] + sum(c.dropped for c in live),
+            "slow_disconnects": self.counters["slow_disconnects"],
+            "failed_disconnects": self.counters["failed_disconnects"],
+            "reaped": self.counters["reaped_disconnects"],
+            "rejected": self.counters["rejected"],
+            "pings": self.counters["pings"],
+            "replayed": self.counters["replayed"],
+            "resyncs": self.counters["resyncs"],
+            "histories": len(self.histories),
+        }
 
-manager = ConnectionManager()
+manager = ConnectionManager(
+    queue_size=settings.WS_SEND_QUEUE_SIZE,
+    policy=settings.WS_SLOW_CONSUMER_POLICY,
+    replay_size=settings.WS_REPLAY_BUFFER,
+    replay_ttl=settings.WS_REPLAY_TTL,
+    replay_users=settings.WS_REPLAY_USERS,
+    max_connections=settings.WS_MAX_CONNECTIONS,
+    max_per_user=settings.WS_MAX_CONNECTIONS_PER_USER,
+    ping_interval=settings.WS_PING_INTERVAL,
+    pong_timeout=settings.WS_PONG_TIMEOUT,
+)
@@ -1,9 +1,19 @@
 import httpx
 from app.core.config import settings
+from app.services.http_client import http_clients
+from app.services.rate_limit import rate_limiter, parse_retry_after
+from app.services.resilience import resilience
+import asyncio
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Graph API error codes that mean "slow down" rather than "bad request"
+THROTTLE_ERROR_CODES = {4, 80007, 130429, 131056}
+
+GRAPH_HOST = "graph.facebook.com"
+
 class WhatsAppService:
     def __init__(self):
         self.default_api_token = settings.WHATSAPP_API_TOKEN
@@ -16,12 +26,59 @@ class WhatsAppService:
         }
 
     def _get_url(self, phone_number_id):
-        return f"https://graph.facebook.com/v17.0/{phone_number_id}/messages"
+        return f"https://{GRAPH_HOST}/v17.0/{phone_number_id}/messages"
 
-    async def send_template_message(self, to_phone: str, template_name: str, language_code: str = "en", components: list = None, merchant=None):
+    def _get_credentials(self, merchant):
         api_token = merchant.whatsapp_api_token if merchant and merchant.whatsapp_api_token else self.default_api_token
         phone_number_id = merchant.whatsapp_phone_number_id if merchant and merchant.whatsapp_phone_number_id else self.default_phone_number_id
-        
+        return api_token, phone_number_id
+
+    def _is_throttled(self, response):
+        if response.status_code == 429:
+            return True
+        if response.status_code == 400:
+            try:
+                return response.json().get("error", {}).get("code") in THROTTLE_ERROR_CODES
+            except ValueError:
+                return False
+        return False
+
+    async def _post(self, payload: dict, merchant=None):
+        api_token, phone_number_id = self._get_credentials(merchant)
+        rate = rate_limiter.rate_for(merchant)
+        deadline = time.monotonic() + settings.WHATSAPP_RATE_LIMIT_MAX_WAIT
+
+        while True:
+            # Queue for this number's throughput budget instead of failing
+            await rate_limiter.acquire(phone_number_id, rate, max_wait=max(0.0, deadline - time.monotonic()))
+
+            async def attempt():
+                # Shared keep-alive pool: no new TCP/TLS handshake per message
+                response = await http_clients.request(
+                    "POST",
+                    self._get_url(phone_number_id),
+                    headers=self._get_headers(api_token),
+                    json=payload
+                )
+                if response.status_code >= 500:
+                    response.raise_for_status()
+                return response
+
+            # Retries 5xx / network errors; fails fast while Graph is down
+            response = await resilience.call(GRAPH_HOST, attempt)
+
+            if self._is_throttled(response):
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if retry_after is None:
+                    retry_after = settings.WHATSAPP_RETRY_AFTER_DEFAULT
+                if time.monotonic() + retry_after < deadline:
+                    await rate_limiter.penalize(phone_number_id, retry_after)
+                    continue
+
+            response.raise_for_status()
+            return response.json()
+
+    async def send_template_message(self, to_phone: str, template_name: str, language_code: str = "en", components: list = None, merchant=None):
         payload = {
             "messaging_product": "whatsapp",
             "to": to_phone,
@@ -37,26 +94,16 @@ class WhatsAppService:
         if components:
             payload["template"]["components"] = components
 
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    self._get_url(phone_number_id), 
-                    headers=self._get_headers(api_token), 
-                    json=payload
-                )
-                response.raise_for_status()
-                return response.json()
-            except httpx.HTTPStatusError as e:
-                logger.error(f"WhatsApp API Error: {e.response.text}")
-                raise e
-            except Exception as e:
-                logger.error(f"Error sending WhatsApp message: {str(e)}")
-                raise e
+        try:
+            return await self._post(payload, merchant=merchant)
+        except httpx.HTTPStatusError as e:
+            logger.error(f"WhatsApp API Error: {e.response.text}")
+            raise e
+        except Exception as e:
+            logger.error(f"Error sending WhatsApp message: {str(e)}")
+            raise e
 
     async def send_interactive_message(self, to_phone: str, body_text: str, buttons: list, merchant=None):
-        api_token = merchant.whatsapp_api_token if merchant and merchant.whatsapp_api_token else self.default_api_token
-        phone_number_id = merchant.whatsapp_phone_number_id if merchant and merchant.whatsapp_phone_number_id else self.default_phone_number_id
-
         payload = {
             "messaging_product": "whatsapp",
             "to": to_phone,
@@ -72,23 +119,13 @@ class WhatsAppService:
             }
         }
 
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    self._get_url(phone_number_id), 
-                    headers=self._get_headers(api_token), 
-                    json=payload
-                )
-                response.raise_for_status()
-                return response.json()
-            except httpx.HTTPStatusError as e:
-                logger.error(f"WhatsApp API Error: {e.response.text}")
-                raise e
+        try:
+            return await self._post(payload, merchant=merchant)
+        except httpx.HTTPStatusError as e:
+            logger.error(f"WhatsApp API Error: {e.response.text}")
+            raise e
 
     async def send_list_message(self, to_phone: str, body_text: str, button_text: str, sections: list, merchant=None):
-        api_token = merchant.whatsapp_api_token if merchant and merchant.whatsapp_api_token else self.default_api_token
-        phone_number_id = merchant.whatsapp_phone_number_id if merchant and merchant.whatsapp_phone_number_id else self.default_phone_number_id
-
         payload = {
             "messaging_product": "whatsapp",
             "to": to_phone,
@@ -105,17 +142,67 @@ class WhatsAppService:
             }
         }
 
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    self._get_url(phone_number_id), 
-                    headers=self._get_headers(api_token), 
-                    json=payload
-                )
-                response.raise_for_status()
-                return response.json()
-            except httpx.HTTPStatusError as e:
-                logger.error(f"WhatsApp API Error: {e.response.text}")
-                raise e
+        try:
+            return await self._post(payload, merchant=merchant)
+        except httpx.HTTPStatusError as e:
+            logger.error(f"WhatsApp API Error: {e.response.text}")
+            raise e
+
+    async def send_bulk(self, recipients, template_name: str, language_code: str = "en", components: list = None,
+                        merchant=None, concurrency: int = None, on_result=None):
+        """
+        Sends one template to many recipients with bounded concurrency.
+
+        recipients is a (async or sync) iterable of (index, phone) pairs and is
+        consumed lazily, so large audiences are never loaded in full. Each
+        outcome is passed to the async on_result callback as a dict with
+        index, phone, status, message_id, error and latency_ms.
+        """
+        concurrency = concurrency or settings.WHATSAPP_BULK_CONCURRENCY
+        queue = asyncio.Queue(maxsize=concurrency * 2) # Backpressure on the recipient stream
+        summary = {"sent": 0, "failed": 0}
+        started = time.monotonic()
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                index, phone = item
+                sent_at = time.monotonic()
+                result = {"index": index, "phone": phone, "message_id": None, "error": None}
+                try:
+                    response = await self.send_template_message(phone, template_name, language_code, components, merchant=merchant)
+                    result["status"] = "sent"
+                    result["message_id"] = response.get("messages", [{}])[0].get("id")
+                    summary["sent"] += 1
+                except Exception as e:
+                    result["status"] = "failed"
+                    result["error"] = str(e)[:1000]
+                    summary["failed"] += 1
+                result["latency_ms"] = round((time.monotonic() - sent_at) * 1000)
+                if on_result:
+                    await on_result(result)
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            if hasattr(recipients, "__aiter__"):
+                async for item in recipients:
+                    await queue.put(item)
+            else:
+                for item in recipients:
+                    await queue.put(item)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        except BaseException:
+            for task in workers:
+                task.cancel()
+            raise
+
+        elapsed = time.monotonic() - started
+        summary["elapsed_seconds"] = round(elapsed, 3)
+        summary["messages_per_second"] = round((summary["sent"] + summary["failed"]) / elapsed, 2) if elapsed > 0 else 0
+        return summary
 
 whatsapp_service = WhatsAppService()
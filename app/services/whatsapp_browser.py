@@ -6,12 +6,92 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.keys import Keys
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.chrome.service import Service
+from app.core.config import settings
+import threading
 import time
 import os
 import logging
 
+try:
+    import fcntl
+except ImportError: # Windows: Chrome's own profile lock is the only guard
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
+SEND_BUTTON_SELECTOR = "span[data-icon='send']"
+CHAT_COMPOSER_SELECTOR = "#main footer"
+
+# Status icons on outgoing message bubbles
+PENDING_ICONS = {"msg-time"}
+SENT_ICONS = {"msg-check", "msg-dblcheck", "msg-dblcheck-ack"}
+FAILED_ICONS = {"msg-error", "alert-notification"}
+
+OPEN_CHAT_SCRIPT = """
+var link = document.createElement('a');
+link.href = arguments[0];
+link.style.display = 'none';
+(document.getElementById('side') || document.body).appendChild(link);
+link.click();
+link.remove();
+"""
+
+COUNT_OUTGOING_SCRIPT = "return document.querySelectorAll('#main div.message-out').length;"
+
+LAST_OUTGOING_STATE_SCRIPT = """
+var bubbles = document.querySelectorAll('#main div.message-out');
+if (bubbles.length <= arguments[0]) return null;
+var icon = bubbles[bubbles.length - 1].querySelector('span[data-icon^="msg-"], span[data-icon="alert-notification"]');
+return icon ? icon.getAttribute('data-icon') : null;
+"""
+
+# Status icon of the newest outgoing bubble containing arguments[0]; null
+# when the chat has no such message
+FIND_OUTGOING_STATE_SCRIPT = """
+var bubbles = document.querySelectorAll('#main div.message-out');
+for (var i = bubbles.length - 1; i >= 0; i--) {
+    if (bubbles[i].innerText.indexOf(arguments[0]) === -1) continue;
+    var icon = bubbles[i].querySelector('span[data-icon^="msg-"], span[data-icon="alert-notification"]');
+    return icon ? icon.getAttribute('data-icon') : 'unknown';
+}
+return null;
+"""
+
+class SendResult:
+    def __init__(self, status, timings, state=None, error=None):
+        self.status = status # "sent", "failed" or "timeout"
+        self.timings = timings
+        self.state = state
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.status == "sent"
+
+    @property
+    def latency_ms(self):
+        return self.timings.get("total_ms")
+
+def _elapsed_ms(since):
+    return round((time.monotonic() - since) * 1000)
+
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+def get_driver_path():
+    """
+    Resolves the chromedriver binary once per process.
+    ChromeDriverManager().install() hits the network and the disk cache,
+    so it should not run on every browser start.
+    """
+    global _driver_path
+    if _driver_path is None:
+        with _driver_path_lock:
+            if _driver_path is None:
+                _driver_path = ChromeDriverManager().install()
+                logger.info(f"Resolved chromedriver at {_driver_path}")
+    return _driver_path
+
 class SeleniumWhatsApp:
     def __init__(self, user_id: int, headless=True):
         self.options = Options()
@@ -22,17 +102,46 @@ class SeleniumWhatsApp:
         self.options.add_argument("--disable-dev-shm-usage")
         
         # Persist user data to keep login session
-        current_dir = os.getcwd()
         # Use user-specific directory
-        user_data_dir = os.path.join(current_dir, "chrome_data", str(user_id))
+        user_data_dir = os.path.abspath(os.path.join(settings.SELENIUM_PROFILE_DIR, str(user_id)))
         self.options.add_argument(f"--user-data-dir={user_data_dir}")
         
+        self.user_id = user_id
         self.driver = None
+        self._lock_path = os.path.abspath(os.path.join(settings.SELENIUM_LOCK_DIR, f"{user_id}.lock"))
+        self._lock_file = None
+
+    def _acquire_profile_lock(self, timeout):
+        """
+        Takes an exclusive lock on this user's profile so that two worker
+        processes never drive the same --user-data-dir at once.
+        """
+        if fcntl is None:
+            return
+        os.makedirs(os.path.dirname(self._lock_path), exist_ok=True)
+        lock_file = open(self._lock_path, "w")
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self._lock_file = lock_file
+                return
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    lock_file.close()
+                    raise Exception(f"WhatsApp profile for user {self.user_id} is in use by another process")
+                time.sleep(0.5)
+
+    def _release_profile_lock(self):
+        if self._lock_file:
+            self._lock_file.close() # Closing the file drops the flock
+            self._lock_file = None
 
-    def start(self):
+    def start(self, lock_timeout=120):
         logger.info("Starting Selenium WebDriver...")
+        self._acquire_profile_lock(lock_timeout)
         try:
-            service = Service(ChromeDriverManager().install())
+            service = Service(get_driver_path())
             self.driver = webdriver.Chrome(service=service, options=self.options)
             self.driver.get("https://web.whatsapp.com")
             logger.info("WhatsApp Web opened.")
@@ -48,49 +157,157 @@ class SeleniumWhatsApp:
                 
         except Exception as e:
             logger.error(f"Failed to start Selenium: {e}")
-            if self.driver:
-                self.driver.quit()
+            self.close()
             raise e
 
     def send_message(self, phone, message):
+        """
+        Backwards compatible wrapper around send(): True only once the
+        outgoing message has left the browser.
+        """
+        return self.send(phone, message).ok
+
+    def send(self, phone, message, ack_timeout=None):
+        """
+        Opens the chat without reloading WhatsApp Web, sends the message and
+        waits for the outgoing bubble to get its "sent" tick.
+        Returns a SendResult with status sent/failed/timeout and timings.
+        """
         if not self.driver:
             raise Exception("Driver not started. Call start() first.")
-            
+
+        ack_timeout = ack_timeout or settings.SELENIUM_ACK_TIMEOUT
+        timings = {}
+        started = time.monotonic()
+
         try:
             logger.info(f"Sending message to {phone}...")
-            
-            # 1. Open chat directly
-            # Encode message for URL
             from urllib.parse import quote
             encoded_message = quote(message)
-            url = f"https://web.whatsapp.com/send?phone={phone}&text={encoded_message}"
-            self.driver.get(url)
-            
-            # 2. Wait for send button (The arrow icon)
-            # Note: Selectors change often. Using a generic approach or aria-label is safer.
-            # Currently, the send button usually has data-icon='send' or aria-label='Send'
-            send_button = WebDriverWait(self.driver, 30).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, "span[data-icon='send']"))
-            )
-            
-            # 3. Click send
+
+            # 1. Open the chat in-app; fall back to a full page load
+            send_button = self._open_chat_in_app(phone, encoded_message)
+            if send_button is None:
+                logger.info("In-app navigation did not open the chat. Reloading.")
+                self.driver.get(f"https://web.whatsapp.com/send?phone={phone}&text={encoded_message}")
+                # Note: Selectors change often. Currently, the send button usually has data-icon='send'
+                send_button = WebDriverWait(self.driver, 30).until(
+                    EC.element_to_be_clickable((By.CSS_SELECTOR, SEND_BUTTON_SELECTOR))
+                )
+            timings["open_ms"] = _elapsed_ms(started)
+            outgoing_before = self._count_outgoing()
+
+            # 2. Click send
+            clicked = time.monotonic()
             send_button.click()
-            logger.info("Send button clicked.")
-            
-            # 4. Wait a bit for message to actually leave
-            time.sleep(3) 
-            
-            logger.info("Message sent successfully via Selenium.")
-            return True
-            
+
+            # 3. Wait for the new outgoing bubble to leave the pending state
+            state = self._wait_for_ack(outgoing_before, ack_timeout)
+            timings["ack_ms"] = _elapsed_ms(clicked)
+            timings["total_ms"] = _elapsed_ms(started)
+
+            if state in SENT_ICONS:
+                logger.info(f"Message to {phone} sent in {timings['total_ms']}ms ({state}).")
+                return SendResult("sent", timings, state)
+            if state in FAILED_ICONS:
+                logger.error(f"WhatsApp Web reported a failed send to {phone} ({state}).")
+                return SendResult("failed", timings, state, error="Message was rejected by WhatsApp Web")
+            logger.warning(f"No sent tick for message to {phone} after {ack_timeout}s (last state: {state}).")
+            return SendResult("timeout", timings, state)
+
         except Exception as e:
             logger.error(f"Error sending message via Selenium: {e}")
+            timings["total_ms"] = _elapsed_ms(started)
+            return SendResult("failed", timings, error=str(e))
+
+    def check(self, phone, message):
+        """
+        Looks for an earlier send of message in the chat with phone, for
+        sends that ended in "timeout". Returns a SendResult: sent once it has
+        its tick, timeout while it is still pending, failed when WhatsApp
+        rejected it or it never reached the chat (so a resend is safe).
+        """
+        if not self.driver:
+            raise Exception("Driver not started. Call start() first.")
+
+        started = time.monotonic()
+        try:
+            # A full load: without text there is no send button to tell an
+            # in-app switch apart from the chat that was already open. Checks
+            # are rare, so the reload is affordable.
+            self.driver.get(f"https://web.whatsapp.com/send?phone={phone}")
+            WebDriverWait(self.driver, 30).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, CHAT_COMPOSER_SELECTOR))
+            )
+            state = self.driver.execute_script(FIND_OUTGOING_STATE_SCRIPT, message)
+        except Exception as e:
+            logger.error(f"Error checking message to {phone} via Selenium: {e}")
+            return SendResult("timeout", {"total_ms": _elapsed_ms(started)}, error=str(e)) # Unknown; look again later
+        timings = {"total_ms": _elapsed_ms(started)}
+
+        if state in SENT_ICONS:
+            return SendResult("sent", timings, state)
+        if state is None:
+            return SendResult("failed", timings, error="Message not found in the chat")
+        if state in FAILED_ICONS:
+            return SendResult("failed", timings, state, error="Message was rejected by WhatsApp Web")
+        return SendResult("timeout", timings, state)
+
+    def _open_chat_in_app(self, phone, encoded_message):
+        """
+        Clicks an injected api.whatsapp.com link. WhatsApp Web intercepts
+        these links and switches chats client-side, which avoids reloading
+        the whole app for every message.
+        """
+        try:
+            self.driver.execute_script(OPEN_CHAT_SCRIPT, f"https://api.whatsapp.com/send?phone={phone}&text={encoded_message}")
+            return WebDriverWait(self.driver, settings.SELENIUM_IN_APP_NAV_TIMEOUT).until(
+                EC.element_to_be_clickable((By.CSS_SELECTOR, SEND_BUTTON_SELECTOR))
+            )
+        except Exception:
+            return None
+
+    def _count_outgoing(self):
+        try:
+            return self.driver.execute_script(COUNT_OUTGOING_SCRIPT) or 0
+        except Exception:
+            return 0
+
+    def _wait_for_ack(self, outgoing_before, timeout):
+        """
+        Polls the status icon of the newest outgoing bubble until it is no
+        longer pending. Returns the last seen icon name (or None).
+        """
+        state = None
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            state = self.driver.execute_script(LAST_OUTGOING_STATE_SCRIPT, outgoing_before)
+            if state in SENT_ICONS or state in FAILED_ICONS:
+                return state
+            time.sleep(0.1)
+        return state
+
+    def is_alive(self):
+        """
+        Cheap health check: the driver must answer and still be on WhatsApp Web.
+        """
+        if not self.driver:
+            return False
+        try:
+            return "web.whatsapp.com" in self.driver.current_url
+        except Exception:
             return False
 
     def close(self):
-        if self.driver:
-            self.driver.quit()
-            logger.info("Selenium WebDriver closed.")
+        try:
+            if self.driver:
+                try:
+                    self.driver.quit()
+                finally:
+                    self.driver = None
+                logger.info("Selenium WebDriver closed.")
+        finally:
+            self._release_profile_lock()
 
     def link_device(self):
         """
@@ -102,7 +319,8 @@ class SeleniumWhatsApp:
             # Force headless=False for linking
             self.options.arguments.remove("--headless=new") if "--headless=new" in self.options.arguments else None
             
-            service = Service(ChromeDriverManager().install())
+            self._acquire_profile_lock(timeout=5)
+            service = Service(get_driver_path())
             self.driver = webdriver.Chrome(service=service, options=self.options)
             self.driver.get("https://web.whatsapp.com")
             logger.info("WhatsApp Web opened for linking.")
@@ -124,6 +342,5 @@ class SeleniumWhatsApp:
                 
         except Exception as e:
             logger.error(f"Failed to link device: {e}")
-            if self.driver:
-                self.driver.quit()
+            self.close()
             return False
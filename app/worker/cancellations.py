@@ -0,0 +1,155 @@
+from collections import defaultdict
+from sqlalchemy import select, update
+from sqlalchemy.orm import joinedload
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.db.models import MessageLog, Order, OrderStatus
+from app.services.analytics import record_transitions
+from app.services.rate_limit import RateLimitTimeout
+from app.services.resilience import is_retryable, task_retry_countdown
+from app.services.shopify import ShopifyService
+from app.services.whatsapp import whatsapp_service
+from app.worker.loop import worker_loop
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+CANCELLED_TEMPLATE = "order_cancelled_notification"
+
+class CancellationPipeline:
+    """
+    Cancels unanswered orders in bulk: one conditional UPDATE moves a whole
+    batch from PENDING to CANCELLED, then the Shopify cancellations (batched
+    GraphQL mutations, one request stream per shop) and the customer
+    notices go out concurrently. Transient failures are handed to
+    the per-order retry tasks; every outcome is written to message_logs.
+    """
+
+    def __init__(self, batch_size: int, concurrency: int):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+
+    def _transition(self, db, *criteria, limit: int = None):
+        """PENDING -> CANCELLED for matching orders; returns the ids it moved."""
+        pending = select(Order.id).where(Order.status == OrderStatus.PENDING, *criteria).order_by(Order.id)
+        moved = (Order.id, Order.user_id, Order.created_at)
+        if limit:
+            pending = pending.limit(limit)
+        pending = pending.with_for_update(skip_locked=True)
+        values = {"status": OrderStatus.CANCELLED, "followup_stage": None, "followup_due_at": None}
+
+        if db.get_bind().dialect.update_returning:
+            stmt = (
+                update(Order)
+                .where(Order.id.in_(pending), Order.status == OrderStatus.PENDING)
+                .values(**values)
+                .returning(*moved)
+                .execution_options(synchronize_session=False)
+            )
+            rows = db.execute(stmt).all()
+        else:
+            # No RETURNING (MySQL): the rows stay locked until the commit
+            rows = db.execute(pending.with_only_columns(*moved)).all()
+            if rows:
+                db.execute(
+                    update(Order).where(Order.id.in_([row[0] for row in rows])).values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+        record_transitions(db, [(user_id, created_at, OrderStatus.PENDING, OrderStatus.CANCELLED) for _, user_id, created_at in rows])
+        db.commit()
+        return [row[0] for row in rows]
+
+    async def _cancel_on_shopify(self, orders, shops, slots):
+        by_shop = defaultdict(list)
+        for order in orders:
+            by_shop[shops[order.id].shop_url].append(order)
+
+        async def cancel_batch(shop_orders):
+            async with slots:
+                return await shops[shop_orders[0].id].cancel_orders([o.shopify_order_id for o in shop_orders])
+
+        batches = list(by_shop.values())
+        outcomes = await asyncio.gather(*(cancel_batch(b) for b in batches), return_exceptions=True)
+        results = {}
+        for shop_orders, outcome in zip(batches, outcomes):
+            for i, order in enumerate(shop_orders):
+                results[order.id] = outcome if isinstance(outcome, Exception) else outcome[i]
+        return [results[order.id] for order in orders]
+
+    async def _fan_out(self, orders, shops):
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def notify(phone):
+            async with slots:
+                return await whatsapp_service.send_template_message(to_phone=phone, template_name=CANCELLED_TEMPLATE)
+
+        shopify_results, notice_results = await asyncio.gather(
+            self._cancel_on_shopify(orders, shops, slots),
+            asyncio.gather(*(notify(o.customer_phone) for o in orders), return_exceptions=True),
+        )
+        return shopify_results, notice_results
+
+    def _outcome(self, order_id: int, message_type: str, result, retry_task, counts):
+        from app.worker.tasks import cancel_shopify_order, send_cancellation_notice
+
+        if not isinstance(result, Exception):
+            counts[f"{message_type}_sent"] += 1
+            message_id = result.get("messages", [{}])[0].get("id") if isinstance(result, dict) else None
+            return MessageLog(order_id=order_id, message_type=message_type, status="sent", whatsapp_message_id=message_id)
+
+        if is_retryable(result) or isinstance(result, RateLimitTimeout):
+            task = cancel_shopify_order if retry_task == "shopify" else send_cancellation_notice
+            task.apply_async(args=[order_id], countdown=task_retry_countdown(result, 0))
+            counts[f"{message_type}_retrying"] += 1
+            status = "retrying"
+        else:
+            counts[f"{message_type}_failed"] += 1
+            status = "failed"
+        logger.warning(f"{message_type} for order {order_id} {status}: {result}")
+        return MessageLog(order_id=order_id, message_type=message_type, status=status, content=str(result))
+
+    def _finish(self, db, order_ids, counts):
+        if not order_ids:
+            return
+        orders = db.query(Order).options(joinedload(Order.user)).filter(Order.id.in_(order_ids)).all()
+        shops = {order.id: ShopifyService.for_user(order.user) for order in orders}
+        shopify_results, notice_results = worker_loop.run(self._fan_out(orders, shops))
+
+        logs = []
+        for order, shopify_result, notice_result in zip(orders, shopify_results, notice_results):
+            logs.append(self._outcome(order.id, "shopify_cancel", shopify_result, "shopify", counts))
+            logs.append(self._outcome(order.id, "cancellation", notice_result, "notice", counts))
+        db.bulk_save_objects(logs)
+        db.commit()
+        counts["cancelled"] += len(orders)
+
+    def cancel(self, order_ids):
+        """Cancels the given orders that are still pending."""
+        counts = defaultdict(int)
+        db = SessionLocal()
+        try:
+            ids = self._transition(db, Order.id.in_(list(order_ids)))
+            self._finish(db, ids, counts)
+        finally:
+            db.close()
+        return dict(counts)
+
+    def cancel_matching(self, *criteria, max_batches: int = 1):
+        """Cancels pending orders matching criteria, one batch per statement."""
+        counts = defaultdict(int)
+        for _ in range(max_batches):
+            db = SessionLocal()
+            try:
+                ids = self._transition(db, *criteria, limit=self.batch_size)
+                self._finish(db, ids, counts)
+            finally:
+                db.close()
+            if len(ids) < self.batch_size:
+                break
+        return dict(counts)
+
+cancellation_pipeline = CancellationPipeline(
+    batch_size=settings.FOLLOWUP_BATCH_SIZE,
+    concurrency=settings.CANCEL_CONCURRENCY,
+)
@@ -1,10 +1,48 @@
-from celery import Celery
+from celery import Celery, Task
+from celery.exceptions import Retry
+from celery.signals import worker_process_init, worker_process_shutdown
 from app.core.config import settings
 
+class DispatchTask(Task):
+    """
+    Routes apply_async() to the in-process job runner when
+    TASK_BACKEND == "local" (no Redis), keeping countdown/ETA semantics.
+    """
+
+    def apply_async(self, args=None, kwargs=None, countdown=None, eta=None, **options):
+        if settings.TASK_BACKEND == "local":
+            from app.worker.local_runner import local_runner
+            return local_runner.enqueue(self.name, args, kwargs, countdown=countdown, eta=eta, retries=options.get("retries", 0))
+        return super().apply_async(args=args, kwargs=kwargs, countdown=countdown, eta=eta, **options)
+
+    def retry(self, args=None, kwargs=None, exc=None, throw=True, eta=None, countdown=None, max_retries=None, **options):
+        if settings.TASK_BACKEND != "local":
+            return super().retry(args=args, kwargs=kwargs, exc=exc, throw=throw, eta=eta, countdown=countdown, max_retries=max_retries, **options)
+
+        request = self.request
+        max_retries = self.max_retries if max_retries is None else max_retries
+        if max_retries is not None and request.retries >= max_retries:
+            if exc is not None:
+                raise exc
+            raise self.MaxRetriesExceededError(f"Can't retry {self.name}")
+
+        from app.worker.local_runner import local_runner
+        local_runner.enqueue(
+            self.name,
+            args if args is not None else request.args,
+            kwargs if kwargs is not None else request.kwargs,
+            countdown=countdown, eta=eta, retries=request.retries + 1
+        )
+        ret = Retry(exc=exc, when=eta or countdown)
+        if throw:
+            raise ret
+        return ret
+
 celery_app = Celery(
     "worker",
     broker=settings.REDIS_URL,
-    backend=settings.REDIS_URL
+    backend=settings.REDIS_URL,
+    task_cls=DispatchTask
 )
 
 celery_app.conf.task_routes = {
@@ -17,6 +55,42 @@ celery_app.conf.update(
     result_serializer="json",
     timezone="UTC",
     enable_utc=True,
-    task_always_eager=True, # Run tasks locally without Redis for testing
+    # "eager" runs tasks inline (tests); "local" uses the in-process job runner
+    task_always_eager=settings.TASK_BACKEND == "eager",
     task_eager_propagates=True,
 )
+
+# Periodic jobs. Run by celery beat, or by the local runner's poller when
+# TASK_BACKEND == "local".
+celery_app.conf.beat_schedule = {
+    "sweep-followups": {
+        "task": "app.worker.tasks.sweep_followups",
+        "schedule": settings.FOLLOWUP_SWEEP_INTERVAL,
+    },
+    "sync-shopify": {
+        "task": "app.worker.tasks.sync_all_shopify_users",
+        "schedule": settings.SHOPIFY_SYNC_INTERVAL,
+    },
+}
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    from app.services.http_client import http_clients
+    from app.worker.loop import worker_loop
+    http_clients.reset()
+    worker_loop.start()
+
+    if settings.WHATSAPP_PROVIDER == "selenium":
+        from app.services.browser_pool import browser_pool
+        browser_pool.start()
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    from app.services.http_client import http_clients
+    from app.worker.loop import worker_loop
+    worker_loop.stop()
+    http_clients.close_all()
+
+    if settings.WHATSAPP_PROVIDER == "selenium":
+        from app.services.browser_pool import browser_pool
+        browser_pool.close_all()
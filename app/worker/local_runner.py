@@ -0,0 +1,271 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import or_, and_, update
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.db.models import BackgroundJob
+import threading
+import time
+import traceback
+import logging
+
+logger = logging.getLogger(__name__)
+
+class LocalJobResult:
+    """Stand-in for Celery's AsyncResult when jobs run in-process."""
+
+    def __init__(self, job_id: int):
+        self.id = job_id
+
+class LocalJobRunner:
+    """
+    Runs Celery tasks without a broker: apply_async() inserts a row into
+    background_jobs and returns immediately, and a poller thread in the same
+    process claims due jobs and executes them on a thread pool.
+
+    Jobs are claimed with a conditional UPDATE and a lease, so several API
+    processes can share the table, and jobs left behind by a crashed process
+    are picked up again once their lease expires. The poller keeps renewing
+    the leases of the jobs this process is running, however long they take.
+    """
+
+    def __init__(self, max_workers: int, poll_interval: float, lease_seconds: int):
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._executor = None
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._slots = threading.Semaphore(max_workers)
+        self._periodic_due = {}
+        self._running = set() # Ids of the jobs this process is executing
+        self._running_lock = threading.Lock()
+        self._renew_due = 0.0
+
+    def enqueue(self, task_name: str, args=None, kwargs=None, countdown=None, eta=None, retries: int = 0):
+        due = eta or datetime.utcnow()
+        if countdown:
+            due = datetime.utcnow() + timedelta(seconds=countdown)
+        if due.tzinfo is not None:
+            due = due.astimezone(timezone.utc).replace(tzinfo=None) # Stored as naive UTC
+
+        db = SessionLocal()
+        try:
+            job = BackgroundJob(
+                task_name=task_name,
+                args=list(args or []),
+                kwargs=dict(kwargs or {}),
+                eta=due,
+                retries=retries,
+                status="queued"
+            )
+            db.add(job)
+            db.commit()
+            job_id = job.id
+        finally:
+            db.close()
+
+        if not countdown:
+            self._wakeup.set()
+        return LocalJobResult(job_id)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="local-job")
+        self._thread = threading.Thread(target=self._poll_loop, name="local-job-poller", daemon=True)
+        self._thread.start()
+        logger.info(f"Local job runner started with {self.max_workers} workers.")
+
+    def stop(self, wait: bool = True):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def enqueue_periodic(self):
+        """
+        Stands in for celery beat: queues each beat_schedule entry once its
+        interval has passed, unless a run of it is still queued or running.
+        """
+        from app.worker.celery_app import celery_app
+
+        now = time.monotonic()
+        for name, entry in celery_app.conf.beat_schedule.items():
+            interval = entry["schedule"]
+            if not isinstance(interval, (int, float)) or self._periodic_due.get(name, 0) > now:
+                continue
+            self._periodic_due[name] = now + interval
+
+            db = SessionLocal()
+            try:
+                pending = db.query(BackgroundJob.id).filter(
+                    BackgroundJob.task_name == entry["task"],
+                    BackgroundJob.status.in_(["queued", "running"])
+                ).first()
+            finally:
+                db.close()
+            if pending is None:
+                self.enqueue(entry["task"], entry.get("args"), entry.get("kwargs"))
+
+    def renew_leases(self):
+        """
+        Extends the lease of every job this process is still running, so a
+        long job (a big campaign, a sweep) isn't taken for crashed and run
+        a second time by another poller.
+        """
+        with self._running_lock:
+            running = list(self._running)
+        if not running:
+            return 0
+        db = SessionLocal()
+        try:
+            result = db.execute(
+                update(BackgroundJob)
+                .where(BackgroundJob.id.in_(running), BackgroundJob.status == "running")
+                .values(locked_until=datetime.utcnow() + timedelta(seconds=self.lease_seconds))
+            )
+            db.commit()
+            return result.rowcount
+        finally:
+            db.close()
+
+    def _poll_loop(self):
+        while not self._stop.is_set():
+            try:
+                now = time.monotonic()
+                if now >= self._renew_due:
+                    # Several renewals per lease, so one missed beat is harmless
+                    self._renew_due = now + self.lease_seconds / 3
+                    self.renew_leases()
+                self.enqueue_periodic()
+                claimed = self.run_due_jobs()
+            except Exception as e:
+                logger.error(f"Local job runner poll failed: {e}")
+                claimed = 0
+            if not claimed:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _claim(self, limit: int):
+        now = datetime.utcnow()
+        with self._running_lock:
+            running = list(self._running)
+        db = SessionLocal()
+        try:
+            candidates = db.query(BackgroundJob.id).filter(
+                BackgroundJob.eta <= now,
+                or_(
+                    BackgroundJob.status == "queued",
+                    # Lease expired: the process running it died
+                    and_(BackgroundJob.status == "running", BackgroundJob.locked_until < now)
+                )
+            )
+            if running:
+                # Ours even if a renewal was missed: still in flight here
+                candidates = candidates.filter(BackgroundJob.id.notin_(running))
+            candidates = candidates.order_by(BackgroundJob.eta).limit(limit).all()
+
+            claimed = []
+            for (job_id,) in candidates:
+                result = db.execute(
+                    update(BackgroundJob)
+                    .where(
+                        BackgroundJob.id == job_id,
+                        or_(
+                            BackgroundJob.status == "queued",
+                            and_(BackgroundJob.status == "running", BackgroundJob.locked_until < now)
+                        )
+                    )
+                    .values(status="running", locked_until=now + timedelta(seconds=self.lease_seconds))
+                )
+                if result.rowcount == 1:
+                    claimed.append(job_id)
+            db.commit()
+            if not claimed:
+                return []
+            jobs = db.query(BackgroundJob).filter(BackgroundJob.id.in_(claimed)).all()
+            return [(job.id, job.task_name, job.args or [], job.kwargs or {}, job.retries or 0) for job in jobs]
+        finally:
+            db.close()
+
+    def run_due_jobs(self):
+        """Claims as many due jobs as there are free workers and submits them."""
+        free = 0
+        while self._slots.acquire(blocking=False):
+            free += 1
+        if not free:
+            return 0
+        try:
+            jobs = self._claim(free)
+        except Exception:
+            for _ in range(free):
+                self._slots.release()
+            raise
+        for _ in range(free - len(jobs)):
+            self._slots.release()
+        with self._running_lock:
+            self._running.update(job[0] for job in jobs)
+
+        for job in jobs:
+            if self._executor is None:
+                self._execute(*job)
+            else:
+                self._executor.submit(self._execute, *job)
+        return len(jobs)
+
+    def _execute(self, job_id, task_name, args, kwargs, retries):
+        from celery.exceptions import Retry
+        from app.worker.celery_app import celery_app
+        import app.worker.tasks # noqa: F401 (registers the tasks)
+
+        status, error = "done", None
+        try:
+            task = celery_app.tasks[task_name]
+            result = task.apply(args=args, kwargs=kwargs, retries=retries, throw=True)
+            if result.state == "RETRY":
+                # DispatchTask.retry already queued the next attempt
+                status = "retried"
+        except Retry:
+            status = "retried"
+        except Exception as e:
+            status, error = "failed", f"{e}\n{traceback.format_exc()}"
+            logger.error(f"Local job {job_id} ({task_name}) failed: {e}")
+        finally:
+            self._slots.release()
+            self._wakeup.set()
+
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(BackgroundJob)
+                .where(BackgroundJob.id == job_id)
+                .values(status=status, last_error=error, locked_until=None)
+            )
+            db.commit()
+        finally:
+            db.close()
+            with self._running_lock:
+                self._running.discard(job_id)
+
+local_runner = LocalJobRunner(
+    max_workers=settings.LOCAL_RUNNER_WORKERS,
+    poll_interval=settings.LOCAL_RUNNER_POLL_INTERVAL,
+    lease_seconds=settings.LOCAL_RUNNER_LEASE_SECONDS,
+)
+
+if __name__ == "__main__":
+    # Standalone runner: python -m app.worker.local_runner
+    logging.basicConfig(level=logging.INFO)
+    local_runner.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        local_runner.stop()
@@ -0,0 +1,79 @@
+from app.core.config import settings
+import asyncio
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+class WorkerLoop:
+    """
+    One long-lived asyncio loop per worker process, running in a background
+    thread. Sync Celery tasks hand their coroutines to it, so the pooled HTTP
+    client and anything else bound to a loop survives across tasks.
+    """
+
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max_in_flight
+        self.loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._slots = None
+        self.in_flight = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self.loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(ready,), name="worker-loop", daemon=True)
+            self._thread.start()
+            ready.wait()
+        logger.info("Worker event loop started.")
+
+    def _run(self, ready):
+        asyncio.set_event_loop(self.loop)
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self.loop.call_soon(ready.set)
+        self.loop.run_forever()
+
+    def run(self, coro, timeout=None):
+        """Runs a coroutine on the worker loop and blocks for its result."""
+        if self._thread is threading.current_thread():
+            raise RuntimeError("WorkerLoop.run() called from the worker loop itself; await the coroutine instead")
+        return self.submit(coro).result(timeout=timeout)
+
+    def submit(self, coro):
+        """
+        Schedules a coroutine without waiting for it. At most max_in_flight
+        submitted coroutines run at once; the rest wait for a slot.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        return asyncio.run_coroutine_threadsafe(self._bounded(coro), self.loop)
+
+    async def _bounded(self, coro):
+        async with self._slots:
+            self.in_flight += 1
+            try:
+                return await coro
+            finally:
+                self.in_flight -= 1
+
+    def stop(self, timeout=10):
+        with self._lock:
+            if self._thread is None:
+                return
+            from app.services.http_client import http_clients
+            try:
+                asyncio.run_coroutine_threadsafe(http_clients.shutdown(), self.loop).result(timeout=timeout)
+            except Exception as e:
+                logger.warning(f"Error closing HTTP client on worker loop: {e}")
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=timeout)
+            self.loop.close()
+            self._thread = None
+            self.loop = None
+        logger.info("Worker event loop stopped.")
+
+worker_loop = WorkerLoop(max_in_flight=settings.WORKER_MAX_IN_FLIGHT)
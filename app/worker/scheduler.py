@@ -0,0 +1,147 @@
+from datetime import datetime, timedelta, timezone
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.db.models import Order, OrderStatus, MessageLog
+from app.services.whatsapp import whatsapp_service
+from app.services.resilience import is_retryable, task_retry_countdown
+from app.worker.cancellations import cancellation_pipeline
+from app.worker.loop import worker_loop
+from collections import Counter
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+REMINDER = "reminder"
+CANCEL = "cancel"
+
+def schedule_followup(order: Order, stage: str, delay: float):
+    """Sets the order's next follow-up; the caller commits."""
+    order.followup_stage = stage
+    order.followup_due_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+
+def clear_followup(order: Order):
+    order.followup_stage = None
+    order.followup_due_at = None
+
+def reminder_text(customer_name: str, order_number: str) -> str:
+    return f"Hi {customer_name}, we are still waiting for your confirmation for order #{order_number}. Please confirm to avoid cancellation."
+
+class FollowupSweeper:
+    """
+    Replaces the 24-hour countdown tasks: due times live on the order row and
+    a periodic sweep claims whatever is due in batches, so nothing is held in
+    worker memory while orders wait.
+    """
+
+    def __init__(self, batch_size: int, max_batches: int, lease_seconds: int):
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.lease_seconds = lease_seconds
+
+    def _claim(self, db, now: datetime):
+        # SKIP LOCKED lets concurrent sweepers take disjoint batches; pushing
+        # the due time out by a lease hands the batch back if we crash.
+        orders = db.query(Order).filter(
+            Order.followup_due_at <= now
+        ).order_by(Order.followup_due_at).limit(self.batch_size).with_for_update(skip_locked=True).all()
+        lease = now + timedelta(seconds=self.lease_seconds)
+        for order in orders:
+            order.followup_due_at = lease
+        db.commit()
+        return orders
+
+    async def _send_reminders(self, reminders):
+        async def send(order_id, phone, body_text):
+            return await whatsapp_service.send_interactive_message(
+                to_phone=phone,
+                body_text=body_text,
+                buttons=[{"type": "reply", "reply": {"id": f"confirm_{order_id}", "title": "Confirm ✅"}}]
+            )
+
+        # The rate limiter paces these; a failure only affects its own order
+        return await asyncio.gather(
+            *(send(order_id, phone, body_text) for order_id, phone, body_text in reminders),
+            return_exceptions=True
+        )
+
+    def _remind(self, db, orders, counts):
+        reminders = [(o.id, o.customer_phone, reminder_text(o.customer_name, o.order_number)) for o in orders]
+        results = worker_loop.run(self._send_reminders(reminders))
+
+        by_id = {o.id: o for o in orders}
+        for (order_id, _, body_text), result in zip(reminders, results):
+            order = by_id[order_id]
+            if isinstance(result, Exception):
+                attempts = order.followup_attempts or 0
+                if is_retryable(result) and attempts < settings.TASK_MAX_RETRIES:
+                    order.followup_attempts = attempts + 1
+                    schedule_followup(order, REMINDER, task_retry_countdown(result, attempts))
+                    counts["retried"] += 1
+                    continue
+                logger.error(f"Failed to send follow-up for order {order_id}: {result}")
+                db.add(MessageLog(order_id=order_id, message_type="reminder", status="failed", content=str(result)))
+                counts["failed"] += 1
+            else:
+                db.add(MessageLog(
+                    order_id=order_id,
+                    message_type="reminder",
+                    status="sent",
+                    whatsapp_message_id=result.get("messages", [{}])[0].get("id"),
+                    content=body_text
+                ))
+                counts["reminded"] += 1
+            # The cancellation deadline runs either way
+            order.followup_attempts = 0
+            schedule_followup(order, CANCEL, settings.FOLLOWUP_CANCEL_DELAY)
+        db.commit()
+
+    def sweep(self):
+        """Works through every due follow-up, one batch at a time."""
+        counts = Counter({"reminded": 0, "cancelled": 0, "retried": 0, "failed": 0, "skipped": 0})
+
+        # Expired cancel deadlines go through the bulk pipeline directly
+        counts.update(cancellation_pipeline.cancel_matching(
+            Order.followup_stage == CANCEL,
+            Order.followup_due_at <= datetime.now(timezone.utc),
+            max_batches=self.max_batches
+        ))
+
+        for _ in range(self.max_batches):
+            db = SessionLocal()
+            try:
+                orders = self._claim(db, datetime.now(timezone.utc))
+                if not orders:
+                    break
+
+                reminders, cancels = [], []
+                for order in orders:
+                    if order.status != OrderStatus.PENDING:
+                        # Answered (or cancelled) in the meantime
+                        clear_followup(order)
+                        counts["skipped"] += 1
+                    elif order.followup_stage == CANCEL:
+                        cancels.append(order)
+                    else:
+                        reminders.append(order)
+                db.commit()
+
+                if reminders:
+                    self._remind(db, reminders, counts)
+                if cancels:
+                    # Came due after the bulk pass above
+                    counts.update(cancellation_pipeline.cancel([o.id for o in cancels]))
+            finally:
+                db.close()
+            if len(orders) < self.batch_size:
+                break
+
+        if any(counts.values()):
+            logger.info(f"Follow-up sweep: {counts}")
+        return dict(counts)
+
+followup_sweeper = FollowupSweeper(
+    batch_size=settings.FOLLOWUP_BATCH_SIZE,
+    max_batches=settings.FOLLOWUP_MAX_BATCHES,
+    lease_seconds=settings.FOLLOWUP_CLAIM_LEASE,
+)
@@ -3,16 +3,87 @@ from app.services.whatsapp import whatsapp_service
 from app.db.database import SessionLocal
 from app.db.models import Order, OrderStatus, MessageLog
 from app.core.config import settings
+from app.worker.loop import worker_loop
+from app.services.resilience import is_retryable, task_retry_countdown
+from app.services.analytics import set_order_status
+from app.worker.cancellations import CANCELLED_TEMPLATE
+from app.worker.scheduler import followup_sweeper, schedule_followup, reminder_text, REMINDER, CANCEL
+from concurrent.futures import TimeoutError as FutureTimeoutError
 import asyncio
 import logging
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-# Helper to run async code in sync Celery task
-def run_async(coro):
-    loop = asyncio.get_event_loop()
-    return loop.run_until_complete(coro)
+# Helper to run async code in sync Celery task (on the persistent worker loop)
+def run_async(coro, timeout=None):
+    return worker_loop.run(coro, timeout=timeout)
+
+def _log_async_failure(future):
+    if not future.cancelled() and future.exception():
+        logger.error(f"Async task failed: {future.exception()}")
+
+def _retry_outbound(task, exc):
+    """
+    Re-queues the task with jittered backoff when the failure is transient
+    (timeouts, 5xx, throttling, open circuit). Returns False when the error
+    is permanent or retries are used up.
+    """
+    if not is_retryable(exc) or task.request.retries >= settings.TASK_MAX_RETRIES:
+        return False
+    countdown = task_retry_countdown(exc, task.request.retries)
+    logger.warning(f"{task.name} will retry in {countdown:.0f}s after: {exc}")
+    raise task.retry(exc=exc, countdown=countdown, max_retries=settings.TASK_MAX_RETRIES)
+
+def _retry_later(task, args: list, exc, retries: int):
+    """
+    _retry_outbound() for calls finished off the task (on the worker loop),
+    where raising Retry is no longer possible: enqueues the next attempt
+    with the same backoff. Returns False when the error is permanent or
+    retries are used up.
+    """
+    if not is_retryable(exc) or retries >= settings.TASK_MAX_RETRIES:
+        return False
+    countdown = task_retry_countdown(exc, retries)
+    logger.warning(f"{task.name} will retry in {countdown:.0f}s after: {exc}")
+    task.apply_async(args=args, countdown=countdown, retries=retries + 1)
+    return True
+
+class SeleniumSendError(Exception):
+    """WhatsApp Web rejected a message, or the browser failed to send it."""
+
+def _retry_selenium(task, error: str):
+    """
+    _retry_outbound() for failed Selenium sends, which never leave the
+    browser and so are safe to repeat. Returns False once retries are used up.
+    """
+    if task.request.retries >= settings.TASK_MAX_RETRIES:
+        return False
+    exc = SeleniumSendError(error)
+    countdown = task_retry_countdown(exc, task.request.retries)
+    logger.warning(f"{task.name} will retry in {countdown:.0f}s after: {exc}")
+    raise task.retry(exc=exc, countdown=countdown, max_retries=settings.TASK_MAX_RETRIES)
+
+def _selenium_confirmation_text(order) -> str:
+    return f"Hello {order.customer_name}, your order {order.order_number} of {order.currency} {order.total_price} is confirmed!"
+
+def _confirm_selenium_order(db, order) -> bool:
+    # The Selenium message announces the order as confirmed and replies
+    # aren't read, so there is no answer to wait for and nothing for the
+    # follow-up sweeper to chase.
+    if not set_order_status(db, order, OrderStatus.CONFIRMED):
+        return False
+    db.commit()
+    
+    # Status update for the merchant's dashboards
+    from app.services.events import event_bus
+    event_bus.publish(order.user_id, {
+        "type": "status_update",
+        "order_id": order.id,
+        "order_number": order.order_number,
+        "status": order.status.value
+    })
+    return True
 
 @celery_app.task(bind=True)
 def send_order_confirmation(self, order_id: int):
@@ -26,57 +97,57 @@ def send_order_confirmation(self, order_id: int):
         if order.status != OrderStatus.PENDING:
             logger.info(f"Order {order_id} is not pending (Status: {order.status}). Skipping confirmation.")
             return "Skipped"
+        if order.followup_stage is not None:
+            # Asked already (a redelivered task); the sweeper follows up from here
+            logger.info(f"Order {order_id} is awaiting the customer's answer. Skipping confirmation.")
+            return "Skipped"
 
         # Check Provider
         if settings.WHATSAPP_PROVIDER == "selenium":
             logger.info(f"Using Selenium Provider for Order {order.order_number}")
+            from app.services.send_queue import send_queue
+            from app.services.whatsapp_browser import SendResult
+            
+            message = _selenium_confirmation_text(order)
             try:
-                from app.services.whatsapp_browser import SeleniumWhatsApp
-                # Use user_id from order
-                bot = SeleniumWhatsApp(user_id=order.user_id, headless=True) 
-                bot.start()
-                
-                message = f"Hello {order.customer_name}, your order {order.order_number}} of {order.currency} {order.total_price} is confirmed!"
-                bot.send_message(order.customer_phone, message)
-                bot.close()
-                
-                # Log success
-                log = MessageLog(
-                    order_id=order.id,
-                    message_type="selenium_text",
-                    status="sent",
-                    content=message
+                # Queued behind this user's other sends; drained into one warm browser
+                result = send_queue.send(
+                    order.user_id, order.customer_phone, message,
+                    timeout=settings.SEND_QUEUE_RESULT_TIMEOUT
                 )
-                db.add(log)
-                db.commit()
-                
-                # Update Order Status
-                order.status = OrderStatus.CONFIRMED
-                db.commit()
-                
-                # Broadcast status update via WebSocket
-                from app.services.websocket import manager
-                asyncio.run(manager.broadcast({
-                    "type": "status_update",
-                    "order_id": order.id,
-                    "order_number": order.order_number,
-                    "status": order.status.value
-                }))
-                
-                return "Message Sent (Selenium)"
-                
+            except FutureTimeoutError:
+                # Still queued, so it may go out yet; resending could send it twice
+                result = SendResult("timeout", {}, error="Still queued after SEND_QUEUE_RESULT_TIMEOUT")
             except Exception as e:
                 logger.error(f"Selenium Error: {e}")
-                # Log failure
-                log = MessageLog(
-                    order_id=order.id,
-                    message_type="selenium_text",
-                    status="failed",
-                    content=str(e)
+                result = SendResult("failed", {}, error=str(e))
+            
+            # Log the outcome reported by WhatsApp Web
+            log = MessageLog(
+                order_id=order.id,
+                message_type="selenium_text",
+                status=result.status,
+                content=message if result.ok else (result.error or message),
+                latency_ms=result.latency_ms
+            )
+            db.add(log)
+            db.commit()
+            
+            if result.status == "timeout":
+                # No tick in time, but the message may have gone out: look for
+                # it in the chat before resending anything
+                verify_selenium_confirmation.apply_async(
+                    args=[order.id], countdown=settings.SELENIUM_VERIFY_DELAY, retries=self.request.retries or 0
                 )
-                db.add(log)
-                db.commit()
-                return f"Selenium Failed: {e}"
+                return "Selenium Timeout: verifying later"
+            if not result.ok:
+                _retry_selenium(self, result.error or result.state)
+                return f"Selenium Failed: {result.error or result.state}"
+            
+            if not _confirm_selenium_order(db, order):
+                # Cancelled (or synced) while the message was queued; theirs stands
+                return "Message Sent (Selenium); order changed meanwhile"
+            return "Message Sent (Selenium)"
         
         else:
             # OFFICIAL API (Existing Logic)
@@ -92,56 +163,149 @@ def send_order_confirmation(self, order_id: int):
             
             body_text = f"Hello {order.customer_name}, thank you for your order #{order.order_number} of {order.currency} {order.total_price}. Please confirm your order details."
 
+            if settings.WORKER_ASYNC_TASKS:
+                # Don't hold the Celery slot for the HTTP round trip; many
+                # confirmations can be in flight on the worker loop at once.
+                future = worker_loop.submit(_send_official_confirmation_async(
+                    order_id, order.customer_phone, body_text, buttons, retries=self.request.retries or 0
+                ))
+                future.add_done_callback(_log_async_failure)
+                return "Queued (Official)"
+
             try:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                response = loop.run_until_complete(whatsapp_service.send_interactive_message(
+                response = run_async(whatsapp_service.send_interactive_message(
                     to_phone=order.customer_phone,
                     body_text=body_text,
                     buttons=buttons
                 ))
-                loop.close()
-                
-                # Log the message
-                log = MessageLog(
-                    order_id=order.id,
-                    message_type="confirmation",
-                    status="sent",
-                    whatsapp_message_id=response.get("messages", [{}])[0].get("id"),
-                    content=body_text
-                )
-                db.add(log)
-                db.commit()
-                
-                #Update Order Status
-                order.status = OrderStatus.CONFIRMED
-                db.commit()
                 
-                # Broadcast status update via WebSocket
-                from app.services.websocket import manager
-                asyncio.run(manager.broadcast({
-                    "type": "status_update",
-                    "order_id": order.id,
-                    "order_number": order.order_number,
-                    "status": order.status.value
-                }))
+                event = _record_official_confirmation(db, order, body_text, response)
                 
-                # Schedule follow-up check (e.g., 24 hours later)
-                check_order_response.apply_async(args=[order_id], countdown=86400)
+                # Tells the merchant's dashboards the customer was asked
+                from app.services.events import event_bus
+                event_bus.publish(order.user_id, event)
                 
                 return "Message Sent (Official)"
                 
             except Exception as e:
+                _retry_outbound(self, e)
                 logger.error(f"Failed to send WhatsApp message: {e}")
                 return f"Failed: {e}"
 
     finally:
         db.close()
 
-from app.services.shopify import shopify_service
+@celery_app.task(bind=True)
+def verify_selenium_confirmation(self, order_id: int):
+    """
+    Follows up a Selenium confirmation that got no tick in time: confirms
+    the order once the message shows as sent, resends it when it never
+    reached the chat, and looks again later while it is still pending.
+    Shares send_order_confirmation's retry budget.
+    """
+    from app.services.send_queue import send_queue
+    
+    retries = self.request.retries or 0
+    db = SessionLocal()
+    try:
+        order = db.query(Order).filter(Order.id == order_id).first()
+        if not order or order.status != OrderStatus.PENDING:
+            return "Skipped"
+        
+        message = _selenium_confirmation_text(order)
+        try:
+            result = send_queue.check(order.user_id, order.customer_phone, message, timeout=settings.SEND_QUEUE_RESULT_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Could not check Selenium confirmation for order {order_id}: {e}")
+            result = None
+        
+        if result is not None and result.ok:
+            db.add(MessageLog(order_id=order.id, message_type="selenium_text", status="sent", content=message))
+            db.commit()
+            if not _confirm_selenium_order(db, order):
+                return "Verified (Selenium); order changed meanwhile"
+            return "Verified (Selenium)"
+        
+        if retries >= settings.TASK_MAX_RETRIES:
+            logger.error(f"Selenium confirmation for order {order_id} is still unconfirmed after {retries} attempts.")
+            db.add(MessageLog(order_id=order.id, message_type="selenium_text", status="failed", content="Never confirmed as sent"))
+            db.commit()
+            return "Unverified (Selenium)"
+        
+        if result is not None and result.status == "failed":
+            # Never left the browser, so a resend can't duplicate it
+            logger.info(f"Selenium confirmation for order {order_id} did not reach the chat. Resending.")
+            send_order_confirmation.apply_async(args=[order_id], retries=retries + 1)
+            return "Resending (Selenium)"
+        
+        # Still pending (or the check itself failed): look again later
+        raise self.retry(countdown=settings.SELENIUM_VERIFY_DELAY, max_retries=settings.TASK_MAX_RETRIES)
+    finally:
+        db.close()
+
+def _record_official_confirmation(db, order, body_text, response):
+    # Log the message
+    message_id = response.get("messages", [{}])[0].get("id")
+    log = MessageLog(
+        order_id=order.id,
+        message_type="confirmation",
+        status="sent",
+        whatsapp_message_id=message_id,
+        content=body_text
+    )
+    db.add(log)
+    
+    # The order stays pending until the customer taps Confirm or Cancel;
+    # until then sweep_followups reminds them (e.g. after 24 hours) and
+    # finally cancels it
+    schedule_followup(order, REMINDER, settings.FOLLOWUP_REMINDER_DELAY)
+    db.commit()
+    
+    # Not a status change: the status_update follows the customer's answer
+    return {
+        "type": "confirmation_sent",
+        "order_id": order.id,
+        "order_number": order.order_number,
+        "whatsapp_message_id": message_id
+    }
+
+async def _send_official_confirmation_async(order_id: int, to_phone: str, body_text: str, buttons: list, retries: int = 0):
+    try:
+        response = await whatsapp_service.send_interactive_message(
+            to_phone=to_phone,
+            body_text=body_text,
+            buttons=buttons
+        )
+    except Exception as e:
+        # The task has returned already; transient failures go back on the queue
+        if await asyncio.to_thread(_retry_later, send_order_confirmation, [order_id], e, retries):
+            return
+        raise
+
+    def record():
+        db = SessionLocal()
+        try:
+            order = db.query(Order).filter(Order.id == order_id).first()
+            return order.user_id, _record_official_confirmation(db, order, body_text, response)
+        finally:
+            db.close()
+
+    # Keep blocking DB I/O off the worker loop
+    user_id, event = await asyncio.to_thread(record)
+
+    from app.services.events import event_bus
+    await event_bus.publish_async(user_id, event)
+
+from app.services.shopify import ShopifyService
+
+@celery_app.task(bind=True)
+def sweep_followups(self):
+    """Periodic: sends due reminders and cancels orders that never answered."""
+    return followup_sweeper.sweep()
 
 @celery_app.task(bind=True)
 def check_order_response(self, order_id: int):
+    # Kept for countdown tasks queued before follow-ups moved to the sweeper
     db = SessionLocal()
     try:
         order = db.query(Order).filter(Order.id == order_id).first()
@@ -149,22 +313,21 @@ def check_order_response(self, order_id: int):
             return
             
         # Send follow-up reminder
-        body_text = f"Hi {order.customer_name}, we are still waiting for your confirmation for order #{order.order_number}. Please confirm to avoid cancellation."
+        body_text = reminder_text(order.customer_name, order.order_number)
         
         try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(whatsapp_service.send_interactive_message(
+            run_async(whatsapp_service.send_interactive_message(
                 to_phone=order.customer_phone,
                 body_text=body_text,
                 buttons=[{"type": "reply", "reply": {"id": f"confirm_{order_id}", "title": "Confirm ✅"}}]
             ))
-            loop.close()
             
             # Schedule auto-cancel
-            auto_cancel_order.apply_async(args=[order_id], countdown=86400) # 24 hours later
+            schedule_followup(order, CANCEL, settings.FOLLOWUP_CANCEL_DELAY)
+            db.commit()
             
         except Exception as e:
+            _retry_outbound(self, e)
             logger.error(f"Failed to send follow-up: {e}")
 
     finally:
@@ -172,27 +335,74 @@ def check_order_response(self, order_id: int):
 
 @celery_app.task(bind=True)
 def auto_cancel_order(self, order_id: int):
+    # Kept for countdown tasks queued before follow-ups moved to the sweeper
+    from app.worker.cancellations import cancellation_pipeline
+    return cancellation_pipeline.cancel([order_id])
+
+@celery_app.task(bind=True)
+def cancel_shopify_order(self, order_id: int):
     db = SessionLocal()
     try:
         order = db.query(Order).filter(Order.id == order_id).first()
-        if not order or order.status != OrderStatus.PENDING:
+        if not order:
             return
-            
-        # Cancel locally
-        order.status = OrderStatus.CANCELLED
-        db.commit()
-        
-        # Cancel on Shopify
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(shopify_service.cancel_order(order.shopify_order_id))
-        
-        # Notify user
-        loop.run_until_complete(whatsapp_service.send_template_message(
-            to_phone=order.customer_phone,
-            template_name="order_cancelled_notification"
-        ))
-        loop.close()
-        
+        try:
+            run_async(ShopifyService.for_user(order.user).cancel_order(order.shopify_order_id))
+        except Exception as e:
+            _retry_outbound(self, e)
+            logger.error(f"Giving up on Shopify cancellation of order {order_id}: {e}")
+            return f"Failed: {e}"
+    finally:
+        db.close()
+
+@celery_app.task(bind=True)
+def send_cancellation_notice(self, order_id: int):
+    db = SessionLocal()
+    try:
+        order = db.query(Order).filter(Order.id == order_id).first()
+        if not order:
+            return
+        try:
+            run_async(whatsapp_service.send_template_message(
+                to_phone=order.customer_phone,
+                template_name=CANCELLED_TEMPLATE
+            ))
+        except Exception as e:
+            _retry_outbound(self, e)
+            logger.error(f"Failed to notify customer of cancelled order {order_id}: {e}")
+            return f"Failed: {e}"
+    finally:
+        db.close()
+
+@celery_app.task(bind=True)
+def run_campaign(self, campaign_id: int):
+    from app.services.campaigns import campaign_runner
+    return run_async(campaign_runner.run(campaign_id))
+
+@celery_app.task(bind=True)
+def sync_shopify_orders(self, user_id: int):
+    """Backfills, then incrementally reconciles, one user's Shopify orders."""
+    from app.services.shopify_sync import shopify_sync
+    try:
+        return run_async(shopify_sync.run(user_id))
+    except Exception as e:
+        # The cursor was saved per batch, so a retry resumes where this stopped
+        _retry_outbound(self, e)
+        return f"Failed: {e}"
+
+@celery_app.task(bind=True)
+def sync_all_shopify_users(self):
+    """Periodic: queues a sync for every user with Admin API credentials."""
+    from app.db.models import User
+    db = SessionLocal()
+    try:
+        user_ids = [user_id for (user_id,) in db.query(User.id).filter(
+            User.is_active == True,
+            User.shopify_shop_domain.isnot(None),
+            User.shopify_access_token.isnot(None)
+        )]
     finally:
         db.close()
+    for user_id in user_ids:
+        sync_shopify_orders.delay(user_id)
+    return len(user_ids)
@@ -0,0 +1,94 @@
+"""
+Concurrent-request benchmark: sync SessionLocal inside async endpoints
+(the old pattern) vs the async session factory.
+
+Both endpoints run the same deliberately slow query against DATABASE_URL
+while a /ping probe measures how long the event loop is stalled.
+
+Usage: python benchmark_db.py [--requests 200] [--concurrency 20] [--size 300]
+"""
+from fastapi import FastAPI
+from sqlalchemy import text
+from app.db.database import SessionLocal, AsyncSessionLocal, async_engine
+import argparse
+import asyncio
+import statistics
+import time
+import httpx
+
+# Row count of a self-joined recursive CTE; portable across SQLite/MySQL 8/Postgres
+SLOW_QUERY = text(
+    "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < :n) "
+    "SELECT count(*) FROM c a, c b"
+)
+
+app = FastAPI()
+
+@app.get("/sync")
+async def sync_session(n: int):
+    db = SessionLocal()
+    try:
+        return {"count": db.execute(SLOW_QUERY, {"n": n}).scalar()}
+    finally:
+        db.close()
+
+@app.get("/async")
+async def async_session(n: int):
+    async with AsyncSessionLocal() as db:
+        return {"count": (await db.execute(SLOW_QUERY, {"n": n})).scalar()}
+
+@app.get("/ping")
+async def ping():
+    return {"ok": True}
+
+async def run(path: str, total: int, concurrency: int, size: int):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        queue = asyncio.Queue()
+        for _ in range(total):
+            queue.put_nowait(None)
+        done = asyncio.Event()
+        pings = []
+
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                response = await client.get(path, params={"n": size})
+                response.raise_for_status()
+
+        async def probe():
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/ping")
+                pings.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(0.01)
+
+        prober = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await prober
+
+    pings.sort()
+    return {
+        "requests_per_second": round(total / elapsed, 1),
+        "elapsed_s": round(elapsed, 2),
+        "pings": len(pings), # Few pings = the loop was blocked
+        "ping_p50_ms": round(statistics.median(pings), 1) if pings else None,
+        "ping_max_ms": round(pings[-1], 1) if pings else None,
+    }
+
+async def main(args):
+    for path in ("/sync", "/async"):
+        await run(path, min(args.concurrency, args.requests), args.concurrency, args.size) # Warm up pools
+        result = await run(path, args.requests, args.concurrency, args.size)
+        print(f"{path:7} {result}")
+    await async_engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--size", type=int, default=300)
+    asyncio.run(main(parser.parse_args()))
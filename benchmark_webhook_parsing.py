@@ -0,0 +1,74 @@
+"""
+Microbenchmarks for the orders/create body pipeline on large Shopify
+payloads: stdlib json + dict access (the old path) vs orjson + the typed
+model (parse_payload), plus the HMAC over the same buffer.
+
+Usage: python benchmark_webhook_parsing.py [--items 10 250 1000]
+"""
+from app.schemas.webhooks import ShopifyOrderPayload, parse_payload
+from app.services.ingest import order_values
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import timeit
+
+def shopify_order(line_items: int) -> bytes:
+    item = {
+        "id": 466157049, "variant_id": 39072856, "title": "IPod Nano - 8gb", "quantity": 1,
+        "sku": "IPOD2008GREEN", "vendor": None, "product_id": 632910392, "requires_shipping": True,
+        "taxable": True, "gift_card": False, "name": "IPod Nano - 8gb - green", "price": "199.00",
+        "total_discount": "0.00", "fulfillment_status": None,
+        "properties": [{"name": "Custom Engraving", "value": "Happy Birthday"}],
+        "tax_lines": [{"price": "3.98", "rate": 0.06, "title": "State Tax"}],
+        "price_set": {"shop_money": {"amount": "199.00", "currency_code": "USD"},
+                      "presentment_money": {"amount": "199.00", "currency_code": "USD"}},
+    }
+    address = {"first_name": "Bob", "last_name": "Norman", "address1": "Chestnut Street 92",
+               "city": "Louisville", "province": "Kentucky", "country": "United States", "zip": "40202",
+               "phone": "555-625-1199"}
+    payload = {
+        "id": 820982911946154508, "order_number": 1234, "email": "jon@example.com",
+        "total_price": "598.94", "currency": "USD", "financial_status": "voided", "fulfillment_status": "pending",
+        "phone": None, "customer": {"id": 115310627314723954, "phone": "+15555550100", "first_name": "John", "last_name": "Smith"},
+        "billing_address": address, "shipping_address": address,
+        "line_items": [dict(item, id=item["id"] + i) for i in range(line_items)],
+    }
+    return json.dumps(payload).encode()
+
+def old_path(body: bytes) -> dict:
+    payload = json.loads(body)
+    customer = payload.get("customer", {})
+    return {
+        "shopify_order_id": str(payload.get("id")),
+        "order_number": str(payload.get("order_number")),
+        "customer_phone": customer.get("phone") or payload.get("phone"),
+        "customer_name": f"{customer.get('first_name', '')} {customer.get('last_name', '')}".strip(),
+        "total_price": payload.get("total_price"),
+        "currency": payload.get("currency"),
+    }
+
+def new_path(body: bytes) -> dict:
+    return order_values(1, parse_payload(ShopifyOrderPayload, body))
+
+def verify(body: bytes, secret=b"secret") -> str:
+    return base64.b64encode(hmac.new(secret, body, hashlib.sha256).digest()).decode()
+
+def bench(fn, body, number):
+    return min(timeit.repeat(lambda: fn(body), number=number, repeat=5)) / number * 1e6
+
+def main(args):
+    print(f"{'items':>6} {'bytes':>9} {'stdlib json':>12} {'orjson+model':>13} {'speedup':>8} {'hmac':>8}  (us/payload)")
+    for items in args.items:
+        body = shopify_order(items)
+        number = max(10, 20000 // (items + 10))
+        old = bench(old_path, body, number)
+        new = bench(new_path, body, number)
+        mac = bench(verify, body, number)
+        print(f"{items:>6} {len(body):>9} {old:>12.1f} {new:>13.1f} {old / new:>7.2f}x {mac:>8.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, nargs="+", default=[10, 250, 1000])
+    main(parser.parse_args())
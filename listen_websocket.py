@@ -1,10 +1,20 @@
+"""
+Prints a merchant's live order events.
+
+The socket only accepts a JWT (as ?token=), e.g. the access_token returned
+by /api/v1/auth/login; pass it with --token or in WS_TOKEN.
+
+Usage: python listen_websocket.py [--token <jwt>] [--url ws://127.0.0.1:8000/ws/orders]
+"""
+from urllib.parse import urlencode
+import argparse
 import asyncio
+import os
 import websockets
-import json
 
-async def listen():
-    uri = "ws://127.0.0.1:8000/ws/orders"
-    print(f"Connecting to {uri}...", flush=True)
+async def listen(url: str, token: str):
+    uri = f"{url}?{urlencode({'token': token})}"
+    print(f"Connecting to {url}...", flush=True)
     try:
         async with websockets.connect(uri) as websocket:
             print("Connected! Waiting for messages...", flush=True)
@@ -15,4 +25,10 @@ async def listen():
         print(f"Error: {e}", flush=True)
 
 if __name__ == "__main__":
-    asyncio.run(listen())
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--token", default=os.environ.get("WS_TOKEN"))
+    parser.add_argument("--url", default="ws://127.0.0.1:8000/ws/orders")
+    args = parser.parse_args()
+    if not args.token:
+        parser.error("a token is required (--token or WS_TOKEN)")
+    asyncio.run(listen(args.url, args.token))
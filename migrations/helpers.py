@@ -0,0 +1,25 @@
+"""
+The app still creates missing tables with create_all on startup, so a
+migration may find its table or column already there (a fresh install, or
+a table create_all made first). These only add what is missing.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+def _inspector():
+    return sa.inspect(op.get_bind())
+
+def add_missing_columns(table: str, *columns: sa.Column):
+    existing = {column["name"] for column in _inspector().get_columns(table)}
+    for column in columns:
+        if column.name not in existing:
+            op.add_column(table, column)
+
+def create_missing_index(name: str, table: str, columns: list):
+    if name not in {index["name"] for index in _inspector().get_indexes(table)}:
+        op.create_index(name, table, columns)
+
+def drop_columns(table: str, *names: str):
+    with op.batch_alter_table(table) as batch:
+        for name in names:
+            batch.drop_column(name)
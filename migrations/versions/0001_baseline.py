@@ -0,0 +1,20 @@
+"""Baseline: the schema create_all built before migrations existed
+
+Nothing to do; existing databases are already here. Upgrading one from
+before migrations is just: alembic upgrade head
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    pass
+
+def downgrade():
+    pass
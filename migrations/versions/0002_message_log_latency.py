@@ -0,0 +1,19 @@
+"""Send-to-ack latency on message logs
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+import sqlalchemy as sa
+from migrations.helpers import add_missing_columns, drop_columns
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    add_missing_columns("message_logs", sa.Column("latency_ms", sa.Integer(), nullable=True))
+
+def downgrade():
+    drop_columns("message_logs", "latency_ms")
@@ -0,0 +1,27 @@
+"""Campaign messages on message logs
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from migrations.helpers import add_missing_columns, create_missing_index, drop_columns
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # No foreign key: campaigns may not exist yet (create_all makes it on startup)
+    add_missing_columns(
+        "message_logs",
+        sa.Column("campaign_id", sa.Integer(), nullable=True),
+        sa.Column("recipient", sa.String(255), nullable=True),
+    )
+    create_missing_index("ix_message_logs_campaign_id", "message_logs", ["campaign_id"])
+
+def downgrade():
+    op.drop_index("ix_message_logs_campaign_id", table_name="message_logs")
+    drop_columns("message_logs", "campaign_id", "recipient")
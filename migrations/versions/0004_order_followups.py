@@ -0,0 +1,27 @@
+"""Follow-up scheduling on orders
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from migrations.helpers import add_missing_columns, create_missing_index, drop_columns
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    add_missing_columns(
+        "orders",
+        sa.Column("followup_stage", sa.String(50), nullable=True),
+        sa.Column("followup_due_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("followup_attempts", sa.Integer(), nullable=True, server_default="0"),
+    )
+    create_missing_index("ix_orders_followup_due_at", "orders", ["followup_due_at"])
+
+def downgrade():
+    op.drop_index("ix_orders_followup_due_at", table_name="orders")
+    drop_columns("orders", "followup_stage", "followup_due_at", "followup_attempts")
@@ -0,0 +1,19 @@
+"""Per-user Shopify webhook secret
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+import sqlalchemy as sa
+from migrations.helpers import add_missing_columns, drop_columns
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    add_missing_columns("users", sa.Column("shopify_webhook_secret", sa.String(255), nullable=True))
+
+def downgrade():
+    drop_columns("users", "shopify_webhook_secret")
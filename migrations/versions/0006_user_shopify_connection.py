@@ -0,0 +1,23 @@
+"""Shopify Admin API connection on users, for the order sync
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+import sqlalchemy as sa
+from migrations.helpers import add_missing_columns, drop_columns
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    add_missing_columns(
+        "users",
+        sa.Column("shopify_shop_domain", sa.String(255), nullable=True),
+        sa.Column("shopify_access_token", sa.String(255), nullable=True),
+    )
+
+def downgrade():
+    drop_columns("users", "shopify_shop_domain", "shopify_access_token")
@@ -0,0 +1,29 @@
+"""
+Rebuilds the analytics aggregates (status rollup, daily series, confirmation
+latency) from the orders table. Run once after deploying them, and whenever
+counts drift.
+
+Usage: python rebuild_rollup.py [--user-id 42]
+"""
+from app.db.database import SessionLocal, engine, Base
+from app.db.models import ConfirmationLatencyStats, OrderDailyStats, OrderStatusRollup
+from app.services.analytics import rebuild_daily_stats, rebuild_rollup
+import argparse
+
+def main(user_id: int = None):
+    Base.metadata.create_all(bind=engine, tables=[
+        OrderStatusRollup.__table__, OrderDailyStats.__table__, ConfirmationLatencyStats.__table__
+    ])
+    db = SessionLocal()
+    try:
+        rebuild_rollup(db, user_id)
+        rebuild_daily_stats(db, user_id)
+        db.commit()
+        print(f"Analytics rebuilt for {'user ' + str(user_id) if user_id else 'all users'}.")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--user-id", type=int, default=None)
+    main(parser.parse_args().user_id)
@@ -127,6 +127,9 @@ function handleLogout() {
     localStorage.removeItem('auth_token');
     authToken = null;
     userId = null;
+    wsEpoch = null;
+    wsLastSeq = null;
+    if (ws) ws.close();
     showLogin();
 }
 
@@ -248,12 +251,19 @@ async function linkWhatsApp() {
 
 // WebSocket for Real-time Updates
 let ws;
+// Position in the server's event sequence, sent back on reconnect so only missed events are replayed
+let wsEpoch = null;
+let wsLastSeq = null;
 function connectWebSocket() {
     if (ws) return; // Already connected
 
     // Use secure WebSocket if on https
     const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    ws = new WebSocket(`${protocol}//${window.location.host}/ws/orders`);
+    let url = `${protocol}//${window.location.host}/ws/orders?token=${encodeURIComponent(authToken)}`;
+    if (wsEpoch !== null) {
+        url += `&last_seq=${wsLastSeq}&epoch=${encodeURIComponent(wsEpoch)}`;
+    }
+    ws = new WebSocket(url);
 
     ws.onopen = () => {
         console.log("Connected to WebSocket");
@@ -261,6 +271,25 @@ function connectWebSocket() {
 
     ws.onmessage = (event) => {
         const message = JSON.parse(event.data);
+        if (message.type === 'ping') {
+            ws.send('{"type":"pong"}'); // Otherwise the server reaps us as half-open
+            return;
+        }
+        if (message.type === 'hello' || message.type === 'resync') {
+            if (message.type === 'resync') loadDashboardData(); // Missed events are gone; reload
+            wsEpoch = message.epoch;
+            wsLastSeq = message.seq;
+            return;
+        }
+        if (message.epoch !== wsEpoch) {
+            // Numbering restarted on the server; we can't tell what we missed
+            if (wsEpoch !== null) loadDashboardData();
+            wsEpoch = message.epoch;
+        } else if (message.seq <= wsLastSeq) {
+            return; // Already applied
+        }
+        wsLastSeq = message.seq;
+
         if (message.type === 'new_order') {
             prependOrder(message.data);
         } else if (message.type === 'status_update') {
@@ -269,8 +298,9 @@ function connectWebSocket() {
     };
 
     ws.onclose = () => {
-        console.log("WebSocket disconnected. Reconnecting in 5s...");
         ws = null;
+        if (!authToken) return; // Logged out
+        console.log("WebSocket disconnected. Reconnecting in 5s...");
         setTimeout(connectWebSocket, 5000);
     };
 }
@@ -1,7 +1,36 @@
+import os
+import shutil
+import tempfile
 import pytest
+
+# Each session gets a fresh SQLite database unless told otherwise; it has to
+# be chosen before the app (and its engines) are imported
+_scratch = None
+if "DATABASE_URL" not in os.environ:
+    _scratch = tempfile.mkdtemp(prefix="shopify-whatsapp-tests-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch, 'test.db')}"
+
 from fastapi.testclient import TestClient
+from app.core.config import settings
+from app.db.database import Base, async_engine, engine
 from app.main import app
 
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    Base.metadata.create_all(bind=engine)
+    yield
+    if _scratch is not None:
+        Base.metadata.drop_all(bind=engine)
+        engine.dispose()
+        async_engine.sync_engine.dispose()
+        shutil.rmtree(_scratch, ignore_errors=True)
+
+@pytest.fixture(scope="session", autouse=True)
+def selenium_dirs(tmp_path_factory):
+    # Browser profiles and their lock files stay out of the working tree
+    root = tmp_path_factory.mktemp("chrome_data")
+    settings.SELENIUM_PROFILE_DIR = settings.SELENIUM_LOCK_DIR = str(root)
+
 @pytest.fixture
 def client():
     return TestClient(app)
@@ -0,0 +1,104 @@
+"""
+In-process stand-in for the Shopify Admin API: the REST orders list
+(since_id and updated_at_min filters, page_info cursors in the Link header,
+the X-Shopify-Shop-Api-Call-Limit bucket) and aliased GraphQL order
+mutations with extensions.cost.
+"""
+from datetime import datetime
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from urllib.parse import urlencode
+from app.core.config import settings
+from app.services import shopify as shopify_module
+from app.services.shopify import ShopifyThrottle
+import httpx
+
+def fake_throttle(monkeypatch):
+    """
+    Swaps in a fresh throttle on a fake clock that only moves when the
+    throttle sleeps. Returns it and the list of pauses it took.
+    """
+    pauses = []
+    clock = [1000.0]
+
+    async def sleep(seconds):
+        pauses.append(seconds)
+        clock[0] += seconds
+
+    throttle = ShopifyThrottle(settings.SHOPIFY_THROTTLE_HEADROOM, clock=lambda: clock[0], sleep=sleep)
+    monkeypatch.setattr(shopify_module, "shopify_throttle", throttle)
+    return throttle, pauses
+
+class ShopifyStub:
+    def __init__(self, orders=None, bucket_size: int = 40):
+        self.orders = {order["id"]: order for order in orders or []}
+        self.bucket_size = bucket_size
+        self.calls = []
+        self.mutations = []
+        self.throttle_next = 0 # GraphQL requests to answer with THROTTLED
+        self.app = FastAPI()
+        self.app.get("/admin/api/{version}/orders.json")(self.list_orders)
+        self.app.post("/admin/api/{version}/graphql.json")(self.graphql)
+
+    def client(self):
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=self.app))
+
+    def _call_limit(self):
+        return {"X-Shopify-Shop-Api-Call-Limit": f"{min(len(self.calls), self.bucket_size)}/{self.bucket_size}"}
+
+    def _page(self, request: Request, orders, offset: int, limit: int, updated_at_min: str):
+        page = orders[offset:offset + limit]
+        headers = self._call_limit()
+        if offset + limit < len(orders):
+            # Like Shopify, the next link carries only the cursor and the limit
+            next_url = request.url.replace(query=urlencode({"limit": limit, "page_info": f"{updated_at_min}|{offset + limit}"}))
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        return JSONResponse({"orders": page}, headers=headers)
+
+    async def list_orders(self, request: Request):
+        params = request.query_params
+        self.calls.append(dict(params))
+        limit = int(params.get("limit", 50))
+        orders = sorted(self.orders.values(), key=lambda order: order["id"])
+
+        if "page_info" in params:
+            # Cursor pages only accept limit; everything else is in the cursor
+            updated_at_min, offset = params["page_info"].split("|")
+            orders = [o for o in orders if datetime.fromisoformat(o["updated_at"]) >= datetime.fromisoformat(updated_at_min)]
+            return self._page(request, orders, int(offset), limit, updated_at_min)
+        if "updated_at_min" in params:
+            since = datetime.fromisoformat(params["updated_at_min"])
+            orders = [o for o in orders if datetime.fromisoformat(o["updated_at"]) >= since]
+            return self._page(request, orders, 0, limit, params["updated_at_min"])
+
+        since_id = int(params.get("since_id", 0))
+        orders = [o for o in orders if o["id"] > since_id]
+        # since_id pages carry no Link header; the caller advances the id
+        return JSONResponse({"orders": orders[:limit]}, headers=self._call_limit())
+
+    async def graphql(self, request: Request):
+        body = await request.json()
+        variables = body.get("variables", {})
+        order_ids = {name[2:]: int(gid.rsplit("/", 1)[1]) for name, gid in variables.items() if name.startswith("id")}
+        cost = 10 * len(order_ids)
+        throttle_status = {"maximumAvailable": 1000.0, "currentlyAvailable": 1000.0 - cost, "restoreRate": 50.0}
+        if self.throttle_next:
+            self.throttle_next -= 1
+            throttle_status["currentlyAvailable"] = 0.0
+            return JSONResponse({
+                "errors": [{"message": "Throttled", "extensions": {"code": "THROTTLED"}}],
+                "extensions": {"cost": {"requestedQueryCost": cost, "throttleStatus": throttle_status}},
+            })
+
+        self.mutations.append(body)
+        data = {}
+        for i, order_id in order_ids.items():
+            if order_id in self.orders:
+                self.orders[order_id]["cancelled_at"] = datetime.now().isoformat()
+                data[f"op{i}"] = {"job": {"id": f"gid://shopify/Job/{order_id}"}, "errors": []}
+            else:
+                data[f"op{i}"] = {"job": None, "errors": [{"field": ["orderId"], "message": "Order does not exist"}]}
+        return JSONResponse({
+            "data": data,
+            "extensions": {"cost": {"requestedQueryCost": cost, "actualQueryCost": cost, "throttleStatus": throttle_status}},
+        })
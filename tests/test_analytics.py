@@ -0,0 +1,167 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+from app.core.security import create_access_token
+from app.db.database import AsyncSessionLocal, SessionLocal
+from app.db.models import ConfirmationLatencyStats, MessageLog, Order, OrderDailyStats, OrderStatus, OrderStatusRollup, User
+from app.services.analytics import (
+    LATENCY_BOUNDS, aggregate_rows, latency_bucket, percentiles, rebuild_daily_stats, rebuild_rollup, record_transitions, set_order_status,
+    status_counts
+)
+
+def make_user(db):
+    user = User(email=f"rollup-{uuid.uuid4().hex}@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    return user
+
+def counts(user_id):
+    async def run():
+        async with AsyncSessionLocal() as db:
+            return await status_counts(db, user_id)
+    return asyncio.run(run())
+
+def test_transitions_move_counts_and_invalidate_the_cache():
+    db = SessionLocal()
+    try:
+        user = make_user(db)
+        orders = [Order(user_id=user.id, shopify_order_id=f"rollup-{uuid.uuid4().hex}", status=OrderStatus.PENDING) for _ in range(3)]
+        db.add_all(orders)
+        db.flush()
+        record_transitions(db, [(user.id, o.created_at, None, OrderStatus.PENDING) for o in orders])
+        db.commit()
+        assert counts(user.id) == {OrderStatus.PENDING: 3}
+
+        set_order_status(db, orders[0], OrderStatus.CONFIRMED)
+        set_order_status(db, orders[1], OrderStatus.CANCELLED)
+        assert counts(user.id) == {OrderStatus.PENDING: 3} # Cached until the change commits
+        db.commit()
+        assert counts(user.id) == {OrderStatus.PENDING: 1, OrderStatus.CONFIRMED: 1, OrderStatus.CANCELLED: 1}
+
+        set_order_status(db, orders[2], OrderStatus.CONFIRMED)
+        db.rollback()
+        assert counts(user.id) == {OrderStatus.PENDING: 1, OrderStatus.CONFIRMED: 1, OrderStatus.CANCELLED: 1}
+    finally:
+        db.close()
+
+def test_status_changes_lose_to_concurrent_ones():
+    db, other = SessionLocal(), SessionLocal()
+    try:
+        user = make_user(db)
+        order = Order(user_id=user.id, shopify_order_id=f"rollup-{uuid.uuid4().hex}", status=OrderStatus.PENDING)
+        db.add(order)
+        db.flush()
+        record_transitions(db, [(user.id, order.created_at, None, OrderStatus.PENDING)])
+        db.commit()
+        assert order.status == OrderStatus.PENDING # Loaded as pending
+
+        # Cancelled elsewhere before this session's confirmation lands
+        assert set_order_status(other, other.get(Order, order.id), OrderStatus.CANCELLED)
+        other.commit()
+
+        assert not set_order_status(db, order, OrderStatus.CONFIRMED)
+        db.commit()
+        assert order.status == OrderStatus.CANCELLED
+        assert counts(user.id) == {OrderStatus.PENDING: 0, OrderStatus.CANCELLED: 1} # Only the cancellation counted
+    finally:
+        other.close()
+        db.close()
+
+def test_rebuild_matches_the_orders_table():
+    db = SessionLocal()
+    try:
+        user = make_user(db)
+        for status in (OrderStatus.CONFIRMED, OrderStatus.CONFIRMED, OrderStatus.DELIVERED):
+            db.add(Order(user_id=user.id, shopify_order_id=f"rollup-{uuid.uuid4().hex}", status=status))
+        db.commit()
+        assert counts(user.id) == {} # Written without recording transitions
+
+        rebuild_rollup(db, user.id)
+        db.commit()
+        assert counts(user.id) == {OrderStatus.CONFIRMED: 2, OrderStatus.DELIVERED: 1}
+        assert db.query(OrderStatusRollup).filter(OrderStatusRollup.user_id == user.id).count() == 2 # All created today
+    finally:
+        db.close()
+
+def test_percentiles_are_read_from_the_histogram():
+    assert percentiles({}) == {"p50": None, "p90": None, "p99": None}
+    assert latency_bucket(0) == 0 and latency_bucket(10**9) == len(LATENCY_BOUNDS)
+
+    # 90 orders confirmed within ~2 minutes, 10 after about a day
+    histogram = {latency_bucket(100): 90, latency_bucket(86400): 10}
+    result = percentiles(histogram)
+    assert 60 <= result["p50"] <= 160
+    assert 60000 <= result["p99"] <= 130000
+    assert result["p50"] <= result["p90"] <= result["p99"]
+
+def test_daily_series_and_latency_endpoints(client):
+    db = SessionLocal()
+    try:
+        user = make_user(db)
+        created = datetime.now(timezone.utc) - timedelta(hours=2)
+        orders = [
+            Order(user_id=user.id, shopify_order_id=f"series-{uuid.uuid4().hex}", status=OrderStatus.PENDING, created_at=created)
+            for _ in range(3)
+        ]
+        db.add_all(orders)
+        db.flush()
+        record_transitions(db, [(user.id, o.created_at, None, OrderStatus.PENDING) for o in orders])
+        set_order_status(db, orders[0], OrderStatus.CONFIRMED)
+        set_order_status(db, orders[1], OrderStatus.CONFIRMED)
+        set_order_status(db, orders[2], OrderStatus.CANCELLED)
+        db.commit()
+        token = create_access_token(data={"sub": str(user.id)})
+    finally:
+        db.close()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.get("/api/v1/admin/analytics/daily?days=7", headers=headers)
+    assert response.status_code == 200
+    series = response.json()["series"]
+    assert len(series) == 7
+    assert sum(p["created"] for p in series) == 3
+    assert series[-1]["confirmed"] == 2 and series[-1]["cancelled"] == 1 and series[-1]["delivered"] == 0
+
+    latency = client.get("/api/v1/admin/analytics/confirmation-latency?days=7", headers=headers).json()
+    assert latency["count"] == 2
+    assert 3600 <= latency["p50"] <= 4 * 3600 # Confirmed ~2h after creation
+
+    assert client.get("/api/v1/admin/analytics/daily?days=0", headers=headers).status_code == 400
+
+def test_rebuild_dates_confirmations_by_the_confirmation_message():
+    db = SessionLocal()
+    try:
+        user = make_user(db)
+        created = datetime(2024, 3, 1, 10, 0, tzinfo=timezone.utc)
+        confirmed = Order(user_id=user.id, shopify_order_id=f"series-{uuid.uuid4().hex}", status=OrderStatus.CONFIRMED, created_at=created)
+        cancelled = Order(user_id=user.id, shopify_order_id=f"series-{uuid.uuid4().hex}", status=OrderStatus.CANCELLED, created_at=created)
+        db.add_all([confirmed, cancelled])
+        db.flush()
+        db.add(MessageLog(order_id=confirmed.id, message_type="selenium_text", status="sent", sent_at=created + timedelta(days=1, minutes=5)))
+        db.commit()
+
+        rebuild_daily_stats(db, user.id)
+        db.commit()
+
+        daily = {
+            (row.day.isoformat(), row.metric): row.count
+            for row in db.query(OrderDailyStats).filter(OrderDailyStats.user_id == user.id)
+        }
+        assert daily[("2024-03-01", "created")] == 2
+        assert daily[("2024-03-02", "confirmed")] == 1
+        latency = db.query(ConfirmationLatencyStats).filter(ConfirmationLatencyStats.user_id == user.id).one()
+        assert latency.bucket == latency_bucket(86400 + 300)
+    finally:
+        db.close()
+
+def test_backfilled_orders_are_charted_on_their_own_days():
+    created = datetime(2025, 1, 5, 9, 0, tzinfo=timezone.utc)
+    now = datetime(2026, 10, 17, 12, 0, tzinfo=timezone.utc)
+    changes = dict((model, rows) for model, _, rows in aggregate_rows([
+        (1, created, None, OrderStatus.CANCELLED), # Imported already cancelled
+        (1, created, None, OrderStatus.CANCELLED, created + timedelta(days=2)), # With Shopify's cancelled_at
+        (1, created, OrderStatus.PENDING, OrderStatus.CANCELLED), # Cancelled just now
+    ], now=now))
+
+    cancelled = {row["day"].isoformat(): row["count"] for row in changes[OrderDailyStats] if row["metric"] == "cancelled"}
+    assert cancelled == {"2025-01-05": 1, "2025-01-07": 1, "2026-10-17": 1}
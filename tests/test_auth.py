@@ -0,0 +1,42 @@
+import uuid
+import pytest
+from app.core.security import create_access_token
+from app.db.database import SessionLocal
+from app.db.models import Order, OrderStatus, User
+from app.services.analytics import rebuild_rollup
+
+def test_login_returns_a_token_for_valid_credentials(client):
+    # Password hashing uses argon2 (passlib backend)
+    pytest.importorskip("argon2")
+    email = f"auth-{uuid.uuid4().hex}@example.com"
+    assert client.post("/api/v1/auth/signup", json={"email": email, "password": "secret"}).status_code == 200
+
+    response = client.post("/api/v1/auth/login", data={"username": email, "password": "secret"})
+    assert response.status_code == 200
+    assert response.json()["token_type"] == "bearer"
+
+    response = client.post("/api/v1/auth/login", data={"username": email, "password": "wrong"})
+    assert response.status_code == 401
+
+def test_analytics_requires_and_uses_the_current_user(client):
+    assert client.get("/api/v1/admin/analytics").status_code == 401
+
+    db = SessionLocal()
+    try:
+        user = User(email=f"analytics-{uuid.uuid4().hex}@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        for status in (OrderStatus.CONFIRMED, OrderStatus.CANCELLED, OrderStatus.PENDING, OrderStatus.CONFIRMED):
+            db.add(Order(user_id=user.id, shopify_order_id=f"analytics-{uuid.uuid4().hex}", status=status))
+        db.commit()
+        rebuild_rollup(db, user.id) # Inserted behind the rollup's back
+        db.commit()
+        token = create_access_token(data={"sub": str(user.id)})
+    finally:
+        db.close()
+
+    response = client.get("/api/v1/admin/analytics", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert response.json()["total_orders"] == 4
+    assert response.json()["confirmed_rate"] == 50
+    assert response.json()["cancellation_rate"] == 25
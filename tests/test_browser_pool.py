@@ -0,0 +1,74 @@
+import threading
+import time
+import pytest
+from app.services.browser_pool import BrowserPool, BrowserPoolExhausted
+
+class FakeBot:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.alive = True
+        self.closed = False
+
+    def is_alive(self):
+        return self.alive
+
+    def close(self):
+        self.closed = True
+
+def make_pool(max_browsers=2, idle_timeout=60):
+    created = []
+
+    def factory(user_id):
+        bot = FakeBot(user_id)
+        created.append(bot)
+        return bot
+
+    return BrowserPool(max_browsers=max_browsers, idle_timeout=idle_timeout, browser_factory=factory), created
+
+def test_session_reuses_warm_browser():
+    pool, created = make_pool()
+    with pool.session(1) as first:
+        pass
+    with pool.session(1) as second:
+        pass
+    assert first is second
+    assert len(created) == 1
+
+def test_unhealthy_browser_is_replaced():
+    pool, created = make_pool()
+    with pool.session(1) as bot:
+        pass
+    bot.alive = False
+    with pool.session(1) as replacement:
+        pass
+    assert replacement is not bot
+    assert bot.closed
+
+def test_full_pool_evicts_least_recently_used_idle_browser():
+    pool, created = make_pool(max_browsers=2)
+    for user_id in (1, 2, 3):
+        with pool.session(user_id):
+            pass
+    assert created[0].closed
+    assert pool.stats()["live"] == 2
+
+def test_checkout_times_out_when_every_browser_is_busy():
+    pool, _ = make_pool(max_browsers=1)
+    pool.checkout(1)
+    with pytest.raises(BrowserPoolExhausted):
+        pool.checkout(2, timeout=0.05)
+
+def test_same_user_waits_for_its_session():
+    pool, created = make_pool()
+    bot = pool.checkout(1)
+    threading.Timer(0.05, pool.checkin, args=(1, bot)).start()
+    assert pool.checkout(1, timeout=2) is bot
+    assert len(created) == 1
+
+def test_idle_browsers_are_evicted():
+    pool, created = make_pool(idle_timeout=0.01)
+    with pool.session(1):
+        pass
+    time.sleep(0.02)
+    assert pool.evict_idle() == 1
+    assert created[0].closed
@@ -0,0 +1,86 @@
+import asyncio
+import uuid
+from app.core.security import create_access_token
+from app.db.database import SessionLocal
+from app.db.models import Campaign, CampaignStatus, MessageLog, User
+from app.services import campaigns as campaigns_module
+from app.services.campaigns import CampaignRunner
+from app.worker import tasks
+
+def make_campaign(tmp_path, phones, **kwargs):
+    upload = tmp_path / "recipients.csv"
+    upload.write_text("\n".join(["phone"] + phones))
+    db = SessionLocal()
+    try:
+        user = User(email=f"campaign-{uuid.uuid4().hex}@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        campaign = Campaign(user_id=user.id, template_name="promo", source="upload", upload_path=str(upload), **kwargs)
+        db.add(campaign)
+        db.commit()
+        return campaign.id
+    finally:
+        db.close()
+
+def fake_sender(monkeypatch):
+    sent = []
+
+    async def send_template_message(phone, template_name, language_code="en", components=None, merchant=None):
+        sent.append(phone)
+        return {"messages": [{"id": f"wamid.{phone}"}]}
+
+    monkeypatch.setattr(campaigns_module.whatsapp_service, "send_template_message", send_template_message)
+    return sent
+
+def test_campaign_sends_each_recipient_once_and_logs_results(tmp_path, monkeypatch):
+    sent = fake_sender(monkeypatch)
+    campaign_id = make_campaign(tmp_path, ["+1001", "+1002", "+1001", "+1003"])
+
+    summary = asyncio.run(CampaignRunner().run(campaign_id))
+
+    assert sorted(sent) == ["+1001", "+1002", "+1003"]
+    assert summary["sent"] == 3
+    db = SessionLocal()
+    try:
+        campaign = db.query(Campaign).get(campaign_id)
+        assert campaign.status == CampaignStatus.COMPLETED
+        assert campaign.sent == 3
+        assert campaign.checkpoint == 4
+        assert db.query(MessageLog).filter(MessageLog.campaign_id == campaign_id).count() == 3
+    finally:
+        db.close()
+
+def test_resumed_campaign_skips_recipients_already_done(tmp_path, monkeypatch):
+    sent = fake_sender(monkeypatch)
+    campaign_id = make_campaign(tmp_path, ["+2001", "+2002", "+2003", "+2004"], checkpoint=1, status=CampaignStatus.RUNNING)
+    db = SessionLocal()
+    try:
+        # +2001 is behind the checkpoint; +2003 was sent out of order before the crash
+        db.add(MessageLog(campaign_id=campaign_id, recipient="+2001", status="sent"))
+        db.add(MessageLog(campaign_id=campaign_id, recipient="+2003", status="sent"))
+        db.commit()
+    finally:
+        db.close()
+
+    asyncio.run(CampaignRunner().run(campaign_id))
+
+    assert sorted(sent) == ["+2002", "+2004"]
+
+def test_only_failed_campaigns_resume_and_only_once(tmp_path, monkeypatch, client):
+    queued = []
+    monkeypatch.setattr(tasks.run_campaign, "apply_async", lambda args: queued.append(args))
+    campaign_id = make_campaign(tmp_path, ["+3001"], status=CampaignStatus.FAILED)
+    db = SessionLocal()
+    try:
+        user_id = db.query(Campaign).get(campaign_id).user_id
+    finally:
+        db.close()
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': str(user_id)})}"}
+
+    response = client.post(f"/api/v1/admin/campaigns/{campaign_id}/resume", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["status"] == "pending"
+
+    # A second click while the first resume is queued (or running) starts nothing
+    assert client.post(f"/api/v1/admin/campaigns/{campaign_id}/resume", headers=headers).status_code == 409
+    assert queued == [[campaign_id]]
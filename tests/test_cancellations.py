@@ -0,0 +1,93 @@
+import uuid
+import httpx
+from app.db.database import SessionLocal
+from app.db.models import BackgroundJob, MessageLog, Order, OrderStatus
+from app.worker import cancellations as cancellations_module
+from app.worker.cancellations import CancellationPipeline
+
+def make_orders(count, status=OrderStatus.PENDING):
+    db = SessionLocal()
+    try:
+        orders = [
+            Order(shopify_order_id=f"cancel-{uuid.uuid4().hex}", customer_phone=f"+1666{i:04d}", status=status)
+            for i in range(count)
+        ]
+        db.add_all(orders)
+        db.commit()
+        return [o.id for o in orders]
+    finally:
+        db.close()
+
+def fake_services(monkeypatch, shopify_error=None):
+    calls = {"shopify": [], "notice": []}
+
+    async def cancel_orders(self, shopify_order_ids):
+        calls["shopify"].extend(shopify_order_ids)
+        if shopify_error:
+            raise shopify_error
+        return [{"job": {"id": f"gid://shopify/Job/{i}"}} for i in shopify_order_ids]
+
+    async def send_template_message(to_phone, template_name, **kwargs):
+        calls["notice"].append(to_phone)
+        return {"messages": [{"id": f"wamid.{to_phone}"}]}
+
+    monkeypatch.setattr(cancellations_module.ShopifyService, "cancel_orders", cancel_orders)
+    monkeypatch.setattr(cancellations_module.whatsapp_service, "send_template_message", send_template_message)
+    return calls
+
+def logs_for(order_ids):
+    db = SessionLocal()
+    try:
+        return sorted(
+            (log.order_id, log.message_type, log.status)
+            for log in db.query(MessageLog).filter(MessageLog.order_id.in_(order_ids))
+        )
+    finally:
+        db.close()
+
+def test_pending_orders_are_cancelled_and_outcomes_logged(monkeypatch):
+    calls = fake_services(monkeypatch)
+    order_ids = make_orders(3)
+    answered = make_orders(1, status=OrderStatus.CONFIRMED)
+
+    counts = CancellationPipeline(batch_size=50, concurrency=2).cancel(order_ids + answered)
+
+    assert counts["cancelled"] == 3
+    assert len(calls["shopify"]) == 3 and len(calls["notice"]) == 3
+    db = SessionLocal()
+    try:
+        statuses = {o.id: o.status for o in db.query(Order).filter(Order.id.in_(order_ids + answered))}
+    finally:
+        db.close()
+    assert all(statuses[i] == OrderStatus.CANCELLED for i in order_ids)
+    assert statuses[answered[0]] == OrderStatus.CONFIRMED
+    assert logs_for(order_ids) == sorted(
+        [(i, "cancellation", "sent") for i in order_ids] + [(i, "shopify_cancel", "sent") for i in order_ids]
+    )
+
+def test_orders_are_only_cancelled_once(monkeypatch):
+    calls = fake_services(monkeypatch)
+    order_ids = make_orders(2)
+    pipeline = CancellationPipeline(batch_size=50, concurrency=2)
+
+    pipeline.cancel(order_ids)
+    counts = pipeline.cancel(order_ids)
+
+    assert counts.get("cancelled", 0) == 0
+    assert len(calls["shopify"]) == 2
+
+def test_transient_shopify_failure_falls_back_to_retry_task(monkeypatch):
+    monkeypatch.setattr(cancellations_module.settings, "TASK_BACKEND", "local")
+    fake_services(monkeypatch, shopify_error=httpx.ConnectError("down"))
+    order_ids = make_orders(1)
+
+    counts = CancellationPipeline(batch_size=50, concurrency=2).cancel(order_ids)
+
+    assert counts["shopify_cancel_retrying"] == 1
+    assert counts["cancellation_sent"] == 1
+    db = SessionLocal()
+    try:
+        queued = [job.task_name for job in db.query(BackgroundJob).all() if job.args == order_ids]
+    finally:
+        db.close()
+    assert queued == ["app.worker.tasks.cancel_shopify_order"]
@@ -0,0 +1,47 @@
+import asyncio
+import httpx
+from app.services.http_client import HTTPClientManager
+
+def test_client_is_reused_within_a_loop():
+    manager = HTTPClientManager()
+
+    async def scenario():
+        first = manager.get_client()
+        second = manager.get_client()
+        await manager.shutdown()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first is second
+    assert first.is_closed
+
+def test_each_loop_gets_its_own_client():
+    manager = HTTPClientManager()
+
+    async def get():
+        return manager.get_client()
+
+    loop_a, loop_b = asyncio.new_event_loop(), asyncio.new_event_loop()
+    try:
+        assert loop_a.run_until_complete(get()) is not loop_b.run_until_complete(get())
+        assert manager.stats()["clients"] == 2
+        manager.close_all()
+        assert manager.stats()["clients"] == 0
+    finally:
+        loop_a.close()
+        loop_b.close()
+
+def test_request_counters():
+    manager = HTTPClientManager()
+
+    async def scenario():
+        client = manager.get_client()
+        client._transport = httpx.MockTransport(lambda request: httpx.Response(200, json={"ok": True}))
+        response = await manager.request("GET", "https://graph.facebook.com/test")
+        await manager.shutdown()
+        return response
+
+    assert asyncio.run(scenario()).json() == {"ok": True}
+    stats = manager.stats()
+    assert stats["requests_total"] == 1
+    assert stats["in_flight"] == 0
@@ -0,0 +1,103 @@
+import json
+import os
+import uuid
+from sqlalchemy.exc import OperationalError
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.db.models import Order
+from app.services.ingest import JournalFlusher, WebhookJournal
+from tests.test_webhooks import make_user, post_order
+
+def make_flusher(tmp_path, monkeypatch):
+    confirmations = []
+    monkeypatch.setattr(JournalFlusher, "_after_insert", lambda self, orders: confirmations.extend(i for i, _ in orders))
+    journal = WebhookJournal(str(tmp_path / "journal"), segment_max_bytes=1024 * 1024)
+    return journal, JournalFlusher(journal, batch_size=2, interval=0.1), confirmations
+
+def orders_for(shopify_ids):
+    db = SessionLocal()
+    try:
+        return db.query(Order).filter(Order.shopify_order_id.in_(shopify_ids)).count()
+    finally:
+        db.close()
+
+def body(order_id):
+    return json.dumps({"id": order_id, "order_number": 1, "customer": {"phone": "+15550200"}}).encode()
+
+def test_journaled_orders_are_inserted_once_and_segments_removed(tmp_path, monkeypatch):
+    journal, flusher, confirmations = make_flusher(tmp_path, monkeypatch)
+    user_id = make_user()
+    ids = [uuid.uuid4().int % 10**12 for _ in range(3)]
+    for order_id in ids + ids[:1]:  # One redelivery
+        journal.append(user_id, body(order_id))
+
+    assert flusher.flush_all() == 3
+    assert len(confirmations) == 3
+    assert orders_for([str(i) for i in ids]) == 3
+    assert journal.segments() == []
+
+def test_leftover_segments_are_replayed_and_torn_tail_ignored(tmp_path, monkeypatch):
+    journal, flusher, confirmations = make_flusher(tmp_path, monkeypatch)
+    user_id = make_user()
+    order_id = uuid.uuid4().int % 10**12
+    journal.append(user_id, body(order_id))
+    journal.seal()
+    # Simulate a crash in the middle of the next append
+    with open(journal.segments()[0], "ab") as f:
+        f.write(b'{"user_id": 1, "bo')
+
+    # A fresh process replays whatever is on disk
+    replay = JournalFlusher(WebhookJournal(journal.directory, segment_max_bytes=1024), batch_size=10, interval=0.1)
+    assert replay.flush_all() == 1
+    assert orders_for([str(order_id)]) == 1
+
+def test_orders_for_unknown_users_are_dropped(tmp_path, monkeypatch):
+    journal, flusher, confirmations = make_flusher(tmp_path, monkeypatch)
+    order_id = uuid.uuid4().int % 10**12
+    journal.append(10**9, body(order_id))
+
+    assert flusher.flush_all() == 0
+    assert flusher.dropped == 1
+    assert orders_for([str(order_id)]) == 0
+
+def test_journal_mode_acknowledges_before_inserting(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "WEBHOOK_INGEST_MODE", "journal")
+    journal = WebhookJournal(str(tmp_path / "journal"), segment_max_bytes=1024 * 1024)
+    monkeypatch.setattr("app.api.v1.endpoints.webhooks.order_journal", journal)
+    payload = {"id": uuid.uuid4().int % 10**12, "order_number": 7}
+
+    response = post_order(client, make_user(), payload, webhook_id=uuid.uuid4().hex)
+
+    assert response.json() == {"status": "accepted"}
+    assert orders_for([str(payload["id"])]) == 0
+    journal.seal()
+    assert len(journal.segments()) == 1
+
+def test_poison_records_are_quarantined_and_later_segments_still_flushed(tmp_path, monkeypatch):
+    journal, flusher, confirmations = make_flusher(tmp_path, monkeypatch)
+    user_id = make_user()
+    first, second = (uuid.uuid4().int % 10**12 for _ in range(2))
+    journal.append(user_id, body(first))
+    journal.seal()
+    poisoned = journal.segments()[0]
+    with open(poisoned, "ab") as f: # No user_id: fails on its own, every time
+        f.write(json.dumps({"webhook_id": "poison", "body": body(1).decode()}).encode() + b"\n")
+    journal.append(user_id, body(second)) # A later segment
+
+    assert flusher.flush_all() == 2
+    assert journal.segments() == []
+    assert flusher.stats()["quarantined"] == 1
+    with open(os.path.join(journal.directory, "quarantine", os.path.basename(poisoned))) as f:
+        assert [json.loads(line)["webhook_id"] for line in f] == ["poison"]
+
+def test_segments_wait_while_the_database_is_unavailable(tmp_path, monkeypatch):
+    journal, flusher, confirmations = make_flusher(tmp_path, monkeypatch)
+    journal.append(make_user(), body(uuid.uuid4().int % 10**12))
+
+    def unavailable(self, records):
+        raise OperationalError("INSERT", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(JournalFlusher, "_flush_batch", unavailable)
+    assert flusher.flush_all() == 0
+    assert len(journal.segments()) == 1
+    assert flusher.stats()["quarantined"] == 0
@@ -0,0 +1,119 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from app.db.database import SessionLocal
+from app.db.models import BackgroundJob
+from app.worker import celery_app as celery_module
+from app.worker.celery_app import celery_app
+from app.worker.local_runner import LocalJobRunner, local_runner
+
+calls = []
+
+@celery_app.task(bind=True)
+def record_call(self, value):
+    calls.append((value, self.request.retries))
+    if value == "flaky" and self.request.retries == 0:
+        raise self.retry(countdown=0)
+    return value
+
+@pytest.fixture(autouse=True)
+def empty_job_table():
+    # Other tests leave jobs behind (e.g. Shopify/WhatsApp retries); running
+    # them here would make these assertions order-dependent and call out
+    db = SessionLocal()
+    try:
+        db.query(BackgroundJob).delete()
+        db.commit()
+    finally:
+        db.close()
+
+def job_rows(task_name):
+    db = SessionLocal()
+    try:
+        return [(j.status, j.retries) for j in db.query(BackgroundJob).filter(BackgroundJob.task_name == task_name).order_by(BackgroundJob.id)]
+    finally:
+        db.close()
+
+def test_apply_async_is_queued_and_run_later(monkeypatch):
+    monkeypatch.setattr(celery_module.settings, "TASK_BACKEND", "local")
+    calls.clear()
+
+    result = record_call.apply_async(args=["hello"])
+    assert calls == []  # Nothing ran inside the caller
+
+    local_runner.run_due_jobs()
+    assert calls == [("hello", 0)]
+    assert result.id is not None
+
+def test_apply_async_keeps_the_retry_count(monkeypatch):
+    monkeypatch.setattr(celery_module.settings, "TASK_BACKEND", "local")
+    calls.clear()
+
+    # How sends finished on the worker loop re-enqueue themselves
+    record_call.apply_async(args=["again"], retries=2)
+    local_runner.run_due_jobs()
+    assert calls == [("again", 2)]
+
+def test_countdown_is_respected(monkeypatch):
+    monkeypatch.setattr(celery_module.settings, "TASK_BACKEND", "local")
+    calls.clear()
+
+    record_call.apply_async(args=["later"], countdown=3600)
+    local_runner.run_due_jobs()
+    assert ("later", 0) not in calls
+
+def test_retry_requeues_the_job(monkeypatch):
+    monkeypatch.setattr(celery_module.settings, "TASK_BACKEND", "local")
+    calls.clear()
+
+    record_call.apply_async(args=["flaky"])
+    local_runner.run_due_jobs()
+    local_runner.run_due_jobs()
+
+    assert [c for c in calls if c[0] == "flaky"] == [("flaky", 0), ("flaky", 1)]
+    statuses = [row for row in job_rows(record_call.name)]
+    assert ("retried", 0) in statuses
+    assert ("done", 1) in statuses
+
+@celery_app.task
+def periodic_call():
+    calls.append(("periodic", 0))
+
+def test_beat_schedule_is_queued_once_per_interval(monkeypatch):
+    monkeypatch.setattr(celery_app.conf, "beat_schedule", {
+        "periodic": {"task": periodic_call.name, "schedule": 3600},
+    })
+    local_runner._periodic_due.pop("periodic", None)
+    calls.clear()
+
+    local_runner.enqueue_periodic()
+    local_runner.enqueue_periodic()
+
+    assert job_rows(periodic_call.name).count(("queued", 0)) == 1
+    local_runner.run_due_jobs()
+    assert calls == [("periodic", 0)]
+
+def test_leases_of_running_jobs_are_renewed():
+    runner = LocalJobRunner(max_workers=1, poll_interval=1.0, lease_seconds=60)
+    other = LocalJobRunner(max_workers=1, poll_interval=1.0, lease_seconds=60)
+    job_id = runner.enqueue(record_call.name, ["slow"]).id
+    assert [job[0] for job in runner._claim(1)] == [job_id]
+    runner._running.add(job_id) # As run_due_jobs does before executing it
+
+    # The job outlived its lease (a long campaign)
+    db = SessionLocal()
+    try:
+        db.execute(update(BackgroundJob).where(BackgroundJob.id == job_id).values(locked_until=datetime.utcnow() - timedelta(seconds=1)))
+        db.commit()
+    finally:
+        db.close()
+    assert runner._claim(1) == [] # Never reclaims its own in-flight job
+
+    assert runner.renew_leases() == 1
+    assert other._claim(1) == [] # Nor does another process once renewed
+
+    db = SessionLocal()
+    try:
+        assert db.get(BackgroundJob, job_id).locked_until > datetime.utcnow() + timedelta(seconds=50)
+    finally:
+        db.close()
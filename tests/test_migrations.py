@@ -0,0 +1,53 @@
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, inspect, text
+from app.db.database import Base
+
+# Tables as the first release created them
+BASELINE = [
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, email VARCHAR(255), hashed_password VARCHAR(255), is_active BOOLEAN)",
+    "CREATE TABLE orders (id INTEGER PRIMARY KEY, user_id INTEGER, shopify_order_id VARCHAR(255), status VARCHAR(9), "
+    "created_at DATETIME, updated_at DATETIME)",
+    "CREATE TABLE message_logs (id INTEGER PRIMARY KEY, order_id INTEGER, message_type VARCHAR(50), status VARCHAR(50), "
+    "whatsapp_message_id VARCHAR(255), content VARCHAR(1000), sent_at DATETIME)",
+]
+
+# Columns later releases added to those tables
+ADDED = {
+    "message_logs": {"latency_ms", "campaign_id", "recipient"},
+    "orders": {"followup_stage", "followup_due_at", "followup_attempts"},
+    "users": {"shopify_webhook_secret", "shopify_shop_domain", "shopify_access_token"},
+}
+
+def alembic_config(url):
+    config = Config("alembic.ini")
+    config.set_main_option("sqlalchemy.url", url)
+    config.attributes["configure_logger"] = False
+    return config
+
+def columns(engine, table):
+    return {column["name"] for column in inspect(engine).get_columns(table)}
+
+def test_upgrade_adds_the_new_columns_to_an_old_database(tmp_path):
+    url = f"sqlite:///{tmp_path / 'old.db'}"
+    engine = create_engine(url)
+    with engine.begin() as connection:
+        for statement in BASELINE:
+            connection.execute(text(statement))
+
+    command.upgrade(alembic_config(url), "head")
+    for table, added in ADDED.items():
+        assert added <= columns(engine, table)
+
+    command.downgrade(alembic_config(url), "0001")
+    for table, added in ADDED.items():
+        assert not added & columns(engine, table)
+
+def test_upgrade_is_a_no_op_on_a_current_database(tmp_path):
+    url = f"sqlite:///{tmp_path / 'new.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+
+    command.upgrade(alembic_config(url), "head")
+    for table, added in ADDED.items():
+        assert added <= columns(engine, table)
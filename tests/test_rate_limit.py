@@ -0,0 +1,56 @@
+import asyncio
+import time
+import httpx
+import pytest
+from app.services import whatsapp as whatsapp_module
+from app.services.rate_limit import LocalRateLimitBackend, RateLimiter, RateLimitTimeout, parse_retry_after
+from app.services.whatsapp import WhatsAppService
+
+def test_bucket_allows_burst_then_waits():
+    limiter = RateLimiter(LocalRateLimitBackend())
+
+    async def scenario():
+        started = time.monotonic()
+        for _ in range(4):
+            await limiter.acquire("123", rate=20, max_wait=5)
+        return time.monotonic() - started
+
+    # Burst of 1s worth (20 tokens) is available immediately
+    assert asyncio.run(scenario()) < 0.05
+
+def test_acquire_gives_up_after_max_wait():
+    limiter = RateLimiter(LocalRateLimitBackend())
+
+    async def scenario():
+        await limiter.backend.block("123", 10)
+        await limiter.acquire("123", rate=1, max_wait=0.1)
+
+    with pytest.raises(RateLimitTimeout):
+        asyncio.run(scenario())
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+def test_429_pauses_the_number_and_retries(monkeypatch):
+    responses = [
+        httpx.Response(429, headers={"Retry-After": "0.05"}, request=httpx.Request("POST", "https://graph.facebook.com")),
+        httpx.Response(200, json={"messages": [{"id": "wamid.1"}]}, request=httpx.Request("POST", "https://graph.facebook.com")),
+    ]
+    calls = []
+
+    async def fake_request(method, url, **kwargs):
+        calls.append(time.monotonic())
+        return responses.pop(0)
+
+    limiter = RateLimiter(LocalRateLimitBackend())
+    monkeypatch.setattr(whatsapp_module.http_clients, "request", fake_request)
+    monkeypatch.setattr(whatsapp_module, "rate_limiter", limiter)
+
+    result = asyncio.run(WhatsAppService().send_template_message("+15550001", "hello_world"))
+
+    assert result["messages"][0]["id"] == "wamid.1"
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.04
+    assert limiter.stats()["throttled"] == 1
@@ -0,0 +1,62 @@
+import asyncio
+import httpx
+import pytest
+from app.services import resilience as resilience_module
+from app.services.resilience import CircuitBreaker, CircuitOpenError, Resilience, is_retryable
+
+def status_error(code):
+    request = httpx.Request("POST", "https://graph.facebook.com")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(code, request=request))
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(resilience_module.settings, "OUTBOUND_BACKOFF_BASE", 0.001)
+    monkeypatch.setattr(resilience_module.settings, "OUTBOUND_BACKOFF_CAP", 0.001)
+
+def test_error_classification():
+    assert is_retryable(status_error(503))
+    assert is_retryable(status_error(429))
+    assert is_retryable(httpx.ConnectTimeout("timeout"))
+    assert not is_retryable(status_error(400))
+    assert not is_retryable(ValueError("bad"))
+
+def test_transient_failures_are_retried():
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise status_error(502)
+        return "ok"
+
+    assert asyncio.run(Resilience().call("shop.myshopify.com", flaky, retries=2)) == "ok"
+    assert len(calls) == 3
+
+def test_permanent_failures_are_not_retried():
+    calls = []
+
+    async def bad_request():
+        calls.append(1)
+        raise status_error(422)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(Resilience().call("shop.myshopify.com", bad_request, retries=3))
+    assert len(calls) == 1
+
+def test_circuit_opens_then_lets_one_probe_through():
+    breaker = CircuitBreaker("graph.facebook.com", failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    import time
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.counters["to_open"] == 1
@@ -0,0 +1,138 @@
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+import httpx
+from app.db.database import SessionLocal
+from app.db.models import MessageLog, Order, OrderStatus
+from app.core.config import settings
+from app.services.events import event_bus
+from app.worker import scheduler as scheduler_module
+from app.worker import tasks
+from app.worker.scheduler import FollowupSweeper, REMINDER, CANCEL
+
+def make_order(stage, status=OrderStatus.PENDING):
+    db = SessionLocal()
+    try:
+        order = Order(
+            shopify_order_id=f"followup-{uuid.uuid4().hex}",
+            order_number="1001",
+            customer_phone="+15550001",
+            customer_name="Ada",
+            status=status,
+            followup_stage=stage,
+            followup_due_at=datetime.now(timezone.utc) - timedelta(seconds=1),
+        )
+        db.add(order)
+        db.commit()
+        return order.id
+    finally:
+        db.close()
+
+def load(order_id):
+    db = SessionLocal()
+    try:
+        order = db.query(Order).get(order_id)
+        db.expunge(order)
+        return order
+    finally:
+        db.close()
+
+def fake_sender(monkeypatch):
+    sent = []
+
+    async def send_interactive_message(to_phone, body_text, buttons, merchant=None):
+        sent.append(to_phone)
+        return {"messages": [{"id": "wamid.reminder"}]}
+
+    monkeypatch.setattr(scheduler_module.whatsapp_service, "send_interactive_message", send_interactive_message)
+    return sent
+
+def test_due_reminder_is_sent_and_cancel_is_scheduled(monkeypatch):
+    sent = fake_sender(monkeypatch)
+    order_id = make_order(REMINDER)
+
+    counts = FollowupSweeper(batch_size=50, max_batches=10, lease_seconds=60).sweep()
+
+    assert counts["reminded"] >= 1
+    assert "+15550001" in sent
+    order = load(order_id)
+    assert order.followup_stage == CANCEL
+    db = SessionLocal()
+    try:
+        assert db.query(MessageLog).filter(MessageLog.order_id == order_id, MessageLog.message_type == "reminder").count() == 1
+    finally:
+        db.close()
+
+def test_due_cancel_goes_through_the_bulk_pipeline(monkeypatch):
+    fake_sender(monkeypatch)
+    cancelled = []
+    monkeypatch.setattr(scheduler_module.cancellation_pipeline, "cancel_matching", lambda *criteria, max_batches=1: {})
+    monkeypatch.setattr(scheduler_module.cancellation_pipeline, "cancel", lambda ids: cancelled.extend(ids) or {"cancelled": len(ids)})
+    order_id = make_order(CANCEL)
+
+    FollowupSweeper(batch_size=50, max_batches=10, lease_seconds=60).sweep()
+
+    assert order_id in cancelled
+
+def test_answered_orders_are_dropped_without_sending(monkeypatch):
+    sent = fake_sender(monkeypatch)
+    order_id = make_order(REMINDER, status=OrderStatus.CONFIRMED)
+    sent.clear()
+
+    FollowupSweeper(batch_size=50, max_batches=10, lease_seconds=60).sweep()
+
+    order = load(order_id)
+    assert order.followup_stage is None
+    assert order.status == OrderStatus.CONFIRMED
+    assert sent == []
+
+def test_official_confirmation_leaves_the_order_pending_and_follows_up(monkeypatch):
+    sent = fake_sender(monkeypatch) # Same client the task sends through
+    monkeypatch.setattr(settings, "WHATSAPP_PROVIDER", "official")
+    monkeypatch.setattr(settings, "WORKER_ASYNC_TASKS", False)
+    order_id = make_order(None)
+    events = []
+    monkeypatch.setattr(event_bus, "publish", lambda user_id, event: events.append(event))
+
+    assert tasks.send_order_confirmation.apply(args=[order_id]).get() == "Message Sent (Official)"
+    # Asking isn't a status change
+    assert [(e["type"], e["whatsapp_message_id"]) for e in events] == [("confirmation_sent", "wamid.reminder")]
+    order = load(order_id)
+    assert order.status == OrderStatus.PENDING # Until the customer answers
+    assert order.followup_stage == REMINDER
+    # A redelivered task doesn't ask twice
+    assert tasks.send_order_confirmation.apply(args=[order_id]).get() == "Skipped"
+    assert len(sent) == 1
+
+    db = SessionLocal()
+    try:
+        db.query(Order).get(order_id).followup_due_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+        db.commit()
+    finally:
+        db.close()
+    FollowupSweeper(batch_size=50, max_batches=10, lease_seconds=60).sweep()
+
+    assert len(sent) == 2 # The reminder
+    assert load(order_id).followup_stage == CANCEL
+
+def test_async_official_send_failures_are_retried(monkeypatch):
+    monkeypatch.setattr(settings, "WHATSAPP_PROVIDER", "official")
+    monkeypatch.setattr(settings, "WORKER_ASYNC_TASKS", True)
+    order_id = make_order(None)
+
+    async def send_interactive_message(to_phone, body_text, buttons, merchant=None):
+        raise httpx.ConnectError("Graph API unreachable")
+
+    monkeypatch.setattr(tasks.whatsapp_service, "send_interactive_message", send_interactive_message)
+    retried, done = [], threading.Event()
+
+    def apply_async(args, countdown=None, retries=0):
+        retried.append((args, retries))
+        done.set()
+
+    monkeypatch.setattr(tasks.send_order_confirmation, "apply_async", apply_async)
+
+    assert tasks.send_order_confirmation.apply(args=[order_id], retries=2).get() == "Queued (Official)"
+    assert done.wait(5) # Re-enqueued from the worker loop once the send failed
+    assert retried == [([order_id], 3)]
+    assert load(order_id).followup_stage is None # Asked again by the retry, not followed up yet
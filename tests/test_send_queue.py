@@ -0,0 +1,155 @@
+import threading
+import uuid
+import pytest
+from contextlib import contextmanager
+from celery.exceptions import Retry
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.db.models import MessageLog, Order, OrderStatus
+from app.services import send_queue as send_queue_module
+from app.services.send_queue import AccountSendQueue
+from app.services.whatsapp_browser import SendResult
+from app.worker import tasks
+
+class RecordingBot:
+    def __init__(self):
+        self.sent = []
+        self.gate = threading.Event()
+
+    def send(self, phone, message):
+        self.gate.wait(timeout=2)
+        self.sent.append((phone, message))
+        return SendResult("sent", {"total_ms": 1})
+
+    def check(self, phone, message):
+        return SendResult("sent" if (phone, message) in self.sent else "failed", {"total_ms": 1})
+
+class FakePool:
+    def __init__(self):
+        self.bots = {}
+        self.checkouts = 0
+
+    @contextmanager
+    def session(self, user_id, timeout=None):
+        self.checkouts += 1
+        yield self.bots.setdefault(user_id, RecordingBot())
+
+def test_messages_for_one_account_are_sent_in_order_on_one_checkout():
+    pool = FakePool()
+    sender = AccountSendQueue(pool, batch_size=10, idle_timeout=0.1)
+    bot = pool.bots[1] = RecordingBot()
+
+    futures = [sender.submit(1, f"+100{i}", f"msg {i}") for i in range(5)]
+    bot.gate.set()
+
+    assert all(f.result(timeout=2).ok for f in futures)
+    assert [m for _, m in bot.sent] == [f"msg {i}" for i in range(5)]
+    assert pool.checkouts <= 2
+    assert sender.stats()[1]["sent"] == 5
+    assert sender.depth(1) == 0
+
+def test_batch_size_returns_browser_between_batches():
+    pool = FakePool()
+    sender = AccountSendQueue(pool, batch_size=2, idle_timeout=0.1)
+    bot = pool.bots[1] = RecordingBot()
+
+    futures = [sender.submit(1, "+1", f"msg {i}") for i in range(4)]
+    bot.gate.set()
+
+    for f in futures:
+        f.result(timeout=2)
+    assert pool.checkouts >= 2
+
+def test_send_errors_are_reported_on_the_future():
+    class BrokenPool:
+        @contextmanager
+        def session(self, user_id, timeout=None):
+            raise RuntimeError("no browser")
+            yield
+
+    sender = AccountSendQueue(BrokenPool(), batch_size=5, idle_timeout=0.1)
+    future = sender.submit(2, "+1", "hello")
+    try:
+        future.result(timeout=2)
+        assert False, "expected failure"
+    except RuntimeError as e:
+        assert "no browser" in str(e)
+    assert sender.stats()[2]["failed"] == 1
+
+def test_checks_run_on_the_account_browser_without_counting_as_sends():
+    pool = FakePool()
+    sender = AccountSendQueue(pool, batch_size=10, idle_timeout=0.1)
+    bot = pool.bots[3] = RecordingBot()
+    bot.gate.set()
+
+    assert sender.send(3, "+1", "hello", timeout=2).ok
+    assert sender.check(3, "+1", "hello", timeout=2).status == "sent"
+    assert sender.check(3, "+1", "other", timeout=2).status == "failed"
+    assert bot.sent == [("+1", "hello")]
+    assert sender.stats()[3]["sent"] == 1
+
+def make_order():
+    db = SessionLocal()
+    try:
+        order = Order(
+            shopify_order_id=f"selenium-{uuid.uuid4().hex}",
+            order_number="2001",
+            customer_phone="+15550002",
+            customer_name="Ada",
+            status=OrderStatus.PENDING,
+        )
+        db.add(order)
+        db.commit()
+        return order.id
+    finally:
+        db.close()
+
+def order_state(order_id):
+    db = SessionLocal()
+    try:
+        statuses = [log.status for log in db.query(MessageLog).filter(MessageLog.order_id == order_id).order_by(MessageLog.id)]
+        return db.query(Order).get(order_id).status, statuses
+    finally:
+        db.close()
+
+def test_timed_out_confirmation_is_verified_before_anything_is_resent(monkeypatch):
+    monkeypatch.setattr(settings, "WHATSAPP_PROVIDER", "selenium")
+    queued = []
+    monkeypatch.setattr(tasks.verify_selenium_confirmation, "apply_async", lambda args, countdown=None, retries=0: queued.append(("verify", args)))
+    monkeypatch.setattr(tasks.send_order_confirmation, "apply_async", lambda args, countdown=None, retries=0: queued.append(("send", args)))
+    monkeypatch.setattr(send_queue_module.send_queue, "send", lambda *args, **kwargs: SendResult("timeout", {"total_ms": 20000}, "msg-time"))
+
+    # No tick in time: nothing is resent yet, a check is scheduled
+    sent_first, gone_missing = make_order(), make_order()
+    for order_id in (sent_first, gone_missing):
+        assert tasks.send_order_confirmation.apply(args=[order_id]).get() == "Selenium Timeout: verifying later"
+    assert queued == [("verify", [sent_first]), ("verify", [gone_missing])]
+    assert order_state(sent_first) == (OrderStatus.PENDING, ["timeout"])
+
+    # The tick showed up later: confirmed without a second message
+    monkeypatch.setattr(send_queue_module.send_queue, "check", lambda *args, **kwargs: SendResult("sent", {}, "msg-check"))
+    assert tasks.verify_selenium_confirmation.apply(args=[sent_first]).get() == "Verified (Selenium)"
+    assert order_state(sent_first) == (OrderStatus.CONFIRMED, ["timeout", "sent"])
+
+    # It never reached the chat: resent
+    monkeypatch.setattr(send_queue_module.send_queue, "check", lambda *args, **kwargs: SendResult("failed", {}, error="Message not found in the chat"))
+    assert tasks.verify_selenium_confirmation.apply(args=[gone_missing]).get() == "Resending (Selenium)"
+    assert queued[-1] == ("send", [gone_missing])
+    assert order_state(gone_missing)[0] == OrderStatus.PENDING
+
+def test_failed_confirmation_is_retried(monkeypatch):
+    monkeypatch.setattr(settings, "WHATSAPP_PROVIDER", "selenium")
+    monkeypatch.setattr(send_queue_module.send_queue, "send", lambda *args, **kwargs: SendResult("failed", {}, error="Chrome crashed"))
+    retries = []
+
+    def retry(exc=None, countdown=None, max_retries=None, **options):
+        retries.append(str(exc))
+        return Retry(exc=exc, when=countdown)
+
+    monkeypatch.setattr(tasks.send_order_confirmation, "retry", retry)
+    order_id = make_order()
+
+    with pytest.raises(Retry):
+        tasks.send_order_confirmation.apply(args=[order_id])
+    assert retries == ["Chrome crashed"]
+    assert order_state(order_id) == (OrderStatus.PENDING, ["failed"])
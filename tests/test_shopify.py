@@ -0,0 +1,57 @@
+import asyncio
+from app.core.config import settings
+from app.services.shopify import ShopifyService, ShopifyThrottle, ShopifyUserError, build_order_mutations, shopify_throttle
+from tests.shopify_stub import ShopifyStub, fake_throttle
+
+def test_throttle_waits_for_room_and_follows_reported_levels():
+    throttle = ShopifyThrottle(headroom=1.0)
+    for _ in range(4):
+        assert throttle.reserve("shop:rest", 1, capacity=4, leak_rate=2) == 0
+    assert throttle.reserve("shop:rest", 1, capacity=4, leak_rate=2) > 0
+
+    # The shop says the bucket drained (e.g. other apps' calls leaked out)
+    throttle.observe("shop:rest", 0, capacity=4, leak_rate=2)
+    assert throttle.reserve("shop:rest", 1, capacity=4, leak_rate=2) == 0
+
+    throttle.penalize("shop:rest", retry_after=5, capacity=4, leak_rate=2)
+    assert throttle.reserve("shop:rest", 1, capacity=4, leak_rate=2) >= 5
+
+def test_mutations_are_aliased_with_variables():
+    query, variables = build_order_mutations([("cancel", 1, None), ("note", 2, "called"), ("tag", 3, ["cod"])])
+
+    assert query.startswith("mutation($id0: ID!, $id1: ID!, $value1: String, $id2: ID!, $value2: [String!]!)")
+    assert "op0: orderCancel(orderId: $id0" in query and "op2: tagsAdd(id: $id2, tags: $value2)" in query
+    assert variables == {
+        "id0": "gid://shopify/Order/1", "id1": "gid://shopify/Order/2", "value1": "called",
+        "id2": "gid://shopify/Order/3", "value2": ["cod"],
+    }
+
+def test_bulk_cancel_batches_mutations_and_reports_each_order(monkeypatch):
+    monkeypatch.setattr(settings, "SHOPIFY_GRAPHQL_BATCH_SIZE", 2)
+    stub = ShopifyStub([{"id": i, "updated_at": "2024-01-01T00:00:00"} for i in (1, 2, 3)])
+
+    async def run():
+        async with stub.client() as client:
+            return await ShopifyService("bulk.myshopify.com", "shpat_test", client=client).cancel_orders([1, 2, 3, 99])
+
+    results = asyncio.run(run())
+
+    assert len(stub.mutations) == 2 # 4 cancels, 2 per request
+    assert [r["job"]["id"] for r in results[:3]] == [f"gid://shopify/Job/{i}" for i in (1, 2, 3)]
+    assert isinstance(results[3], ShopifyUserError)
+    assert shopify_throttle.stats()["levels"]["bulk.myshopify.com:graphql"] <= 20
+
+def test_throttled_graphql_request_is_retried(monkeypatch):
+    stub = ShopifyStub([{"id": 1, "updated_at": "2024-01-01T00:00:00"}])
+    stub.throttle_next = 1
+    throttle, pauses = fake_throttle(monkeypatch)
+
+    async def run():
+        async with stub.client() as client:
+            return await ShopifyService("throttled.myshopify.com", "shpat_test", client=client).cancel_orders([1])
+
+    results = asyncio.run(run())
+
+    assert results[0]["job"]["id"] == "gid://shopify/Job/1"
+    assert len(stub.mutations) == 1
+    assert pauses and throttle.waits == len(pauses) # Waited on its own clock until the points were restored
@@ -0,0 +1,163 @@
+import asyncio
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.db.models import Order, OrderStatus, ShopifySyncState, User
+from app.services.shopify_sync import ShopifySync
+from app.worker import tasks
+from tests.shopify_stub import ShopifyStub, fake_throttle
+
+def make_user():
+    db = SessionLocal()
+    try:
+        user = User(
+            email=f"sync-{uuid.uuid4().hex}@example.com",
+            hashed_password="x",
+            shopify_shop_domain="stub-shop.myshopify.com",
+            shopify_access_token="shpat_test"
+        )
+        db.add(user)
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+def remote_order(order_id, age=timedelta(days=30), **fields):
+    created = (datetime.now(timezone.utc) - age).isoformat()
+    order = {
+        "id": order_id,
+        "order_number": order_id % 100000,
+        "customer": {"first_name": "Ada", "last_name": "Lovelace", "phone": "+15550001"},
+        "total_price": "10.00",
+        "currency": "USD",
+        "financial_status": "paid",
+        "fulfillment_status": None,
+        "created_at": created,
+        "updated_at": created,
+        "cancelled_at": None,
+    }
+    order.update(fields)
+    return order
+
+def local_orders(user_id):
+    db = SessionLocal()
+    try:
+        orders = db.query(Order).filter(Order.user_id == user_id).all()
+        db.expunge_all()
+        return {int(order.shopify_order_id): order for order in orders}
+    finally:
+        db.close()
+
+def sync_state(user_id):
+    db = SessionLocal()
+    try:
+        state = db.get(ShopifySyncState, user_id)
+        db.expunge(state)
+        return state
+    finally:
+        db.close()
+
+def run_sync(stub, user_id, monkeypatch, page_size=2, batch_size=3):
+    confirmations = []
+    monkeypatch.setattr(tasks.send_order_confirmation, "apply_async", lambda args, countdown=None: confirmations.append(args[0]))
+
+    async def run():
+        async with stub.client() as client:
+            return await ShopifySync(page_size=page_size, batch_size=batch_size, client=client).run(user_id)
+
+    return asyncio.run(run()), confirmations
+
+def test_backfill_imports_every_page_and_saves_the_cursor(monkeypatch):
+    user_id = make_user()
+    base = random.randint(1, 10**9) * 1000
+    ids = [base + i for i in range(1, 8)]
+    stub = ShopifyStub([remote_order(i) for i in ids])
+
+    summary, confirmations = run_sync(stub, user_id, monkeypatch)
+
+    assert summary["imported"] == 7
+    assert set(local_orders(user_id)) == set(ids)
+    assert confirmations == [] # Historical orders are not re-confirmed
+    assert [int(call["since_id"]) for call in stub.calls] == [0, ids[1], ids[3], ids[5]]
+    state = sync_state(user_id)
+    assert state.since_id == ids[-1]
+    assert state.status == "idle"
+    assert state.updated_at_min is not None
+
+def test_incremental_run_adds_new_orders_and_reconciles_changes(monkeypatch):
+    user_id = make_user()
+    base = random.randint(1, 10**9) * 1000
+    stub = ShopifyStub([remote_order(base + i) for i in range(1, 4)])
+    run_sync(stub, user_id, monkeypatch)
+
+    now = datetime.now(timezone.utc).isoformat()
+    stub.orders[base + 1].update(fulfillment_status="fulfilled", updated_at=now)
+    stub.orders[base + 2].update(cancelled_at=now, updated_at=now)
+    stub.orders[base + 4] = remote_order(base + 4, age=timedelta(minutes=5)) # Missed webhook
+    stub.calls.clear()
+
+    summary, confirmations = run_sync(stub, user_id, monkeypatch)
+
+    orders = local_orders(user_id)
+    assert int(stub.calls[0]["since_id"]) == base + 3
+    assert any("updated_at_min" in call for call in stub.calls)
+    assert orders[base + 1].fulfillment_status == "fulfilled"
+    assert orders[base + 2].status == OrderStatus.CANCELLED
+    assert orders[base + 3].status == OrderStatus.PENDING
+    assert confirmations == [orders[base + 4].id]
+    assert summary["imported"] == 1
+
+def test_updated_orders_follow_the_link_header(monkeypatch):
+    user_id = make_user()
+    base = random.randint(1, 10**9) * 1000
+    stub = ShopifyStub([remote_order(base + i) for i in range(1, 6)])
+    run_sync(stub, user_id, monkeypatch)
+
+    now = datetime.now(timezone.utc).isoformat()
+    for i in range(1, 6):
+        stub.orders[base + i].update(financial_status="refunded", updated_at=now)
+    stub.calls.clear()
+    run_sync(stub, user_id, monkeypatch)
+
+    assert sum("page_info" in call for call in stub.calls) == 2 # 5 orders, 2 per page
+    assert all(order.financial_status == "refunded" for order in local_orders(user_id).values())
+
+def test_sync_pauses_when_the_call_bucket_is_nearly_full(monkeypatch):
+    user_id = make_user()
+    base = random.randint(1, 10**9) * 1000
+    stub = ShopifyStub([remote_order(base + i) for i in range(1, 6)], bucket_size=3)
+    throttle, pauses = fake_throttle(monkeypatch)
+    run_sync(stub, user_id, monkeypatch)
+
+    assert pauses and all(seconds > 0 for seconds in pauses)
+    assert len(local_orders(user_id)) == 5
+    assert throttle.waits == len(pauses)
+
+def test_a_running_sync_is_not_started_twice_unless_it_went_stale(monkeypatch):
+    user_id = make_user()
+    base = random.randint(1, 10**9) * 1000
+    stub = ShopifyStub([remote_order(base + 1)])
+    db = SessionLocal()
+    try:
+        db.add(ShopifySyncState(user_id=user_id, since_id=0, status="running", started_at=datetime.now(timezone.utc)))
+        db.commit()
+    finally:
+        db.close()
+
+    summary, _ = run_sync(stub, user_id, monkeypatch)
+    assert summary == {"status": "running"}
+    assert stub.calls == [] # Left to the run holding the claim
+
+    # That run died without finishing
+    db = SessionLocal()
+    try:
+        db.get(ShopifySyncState, user_id).started_at = datetime.now(timezone.utc) - timedelta(seconds=settings.SHOPIFY_SYNC_STALE_AFTER + 60)
+        db.commit()
+    finally:
+        db.close()
+
+    summary, _ = run_sync(stub, user_id, monkeypatch)
+    assert summary["imported"] == 1
+    assert sync_state(user_id).status == "idle"
@@ -0,0 +1,156 @@
+import base64
+import hashlib
+import hmac
+import json
+import uuid
+from app.api.v1.endpoints import webhooks as webhooks_module
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.db.models import Order, User
+from app.db.upsert import insert_ignore
+from app.services.events import event_bus
+
+def make_user():
+    db = SessionLocal()
+    try:
+        user = User(email=f"webhook-{uuid.uuid4().hex}@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+def post_order(client, user_id, payload, webhook_id=None, secret=None):
+    body = json.dumps(payload).encode()
+    secret = secret or settings.SHOPIFY_WEBHOOK_SECRET
+    signature = base64.b64encode(hmac.new(secret.encode(), body, hashlib.sha256).digest()).decode()
+    headers = {"X-Shopify-Hmac-Sha256": signature, "Content-Type": "application/json"}
+    if webhook_id:
+        headers["X-Shopify-Webhook-Id"] = webhook_id
+    return client.post(f"/api/v1/webhooks/{user_id}/orders/create", content=body, headers=headers)
+
+def order_count(shopify_order_id):
+    db = SessionLocal()
+    try:
+        return db.query(Order).filter(Order.shopify_order_id == shopify_order_id).count()
+    finally:
+        db.close()
+
+def test_order_is_created_once_per_shopify_id(client, monkeypatch):
+    monkeypatch.setattr(settings, "TASK_BACKEND", "local")
+    user_id = make_user()
+    payload = {"id": uuid.uuid4().int % 10**12, "order_number": 1001, "customer": {"phone": "+15550100", "first_name": "Ada"}}
+
+    first = post_order(client, user_id, payload, webhook_id=uuid.uuid4().hex)
+    # A second delivery of the same order under a different webhook id
+    second = post_order(client, user_id, payload, webhook_id=uuid.uuid4().hex)
+
+    assert first.json()["status"] == "success"
+    assert second.json() == {"status": "skipped", "reason": "duplicate"}
+    assert order_count(str(payload["id"])) == 1
+
+def test_retried_webhook_id_is_answered_without_the_database(client, monkeypatch):
+    monkeypatch.setattr(settings, "TASK_BACKEND", "local")
+    user_id = make_user()
+    webhook_id = uuid.uuid4().hex
+    payload = {"id": uuid.uuid4().int % 10**12, "order_number": 1002}
+    assert post_order(client, user_id, payload, webhook_id=webhook_id).json()["status"] == "success"
+
+    def no_database(*args, **kwargs):
+        raise AssertionError("database touched for a retried webhook")
+
+    monkeypatch.setattr(webhooks_module, "async_insert_ignore", no_database)
+    monkeypatch.setattr(webhooks_module.webhook_users, "_load", no_database)
+    assert post_order(client, user_id, payload, webhook_id=webhook_id).json() == {"status": "skipped", "reason": "duplicate"}
+
+def test_unknown_user_is_rejected(client):
+    assert post_order(client, 10**9, {"id": 1}).status_code == 404
+
+def test_insert_ignore_returns_none_for_duplicates():
+    db = SessionLocal()
+    try:
+        values = {"shopify_order_id": f"upsert-{uuid.uuid4().hex}", "order_number": "1"}
+        order_id = insert_ignore(db, Order, values, "shopify_order_id")
+        assert order_id is not None
+        assert insert_ignore(db, Order, values, "shopify_order_id") is None
+        db.commit()
+    finally:
+        db.close()
+
+def test_ttl_cache_expires_and_evicts():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)  # Evicts the least recently used entry
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    cache.set("d", 4, ttl=0)
+    assert "d" not in cache
+
+def test_invalid_order_payload_is_rejected(client):
+    response = post_order(client, make_user(), {"order_number": 1})  # No id
+    assert response.status_code == 400
+
+def whatsapp_reply(button_id):
+    return json.dumps({"entry": [{"changes": [{"value": {"messages": [{
+        "from": "15550100",
+        "type": "interactive",
+        "interactive": {"type": "button_reply", "button_reply": {"id": button_id, "title": "Cancel"}}
+    }]}}]}]}).encode()
+
+def test_whatsapp_button_reply_updates_the_order(client, monkeypatch):
+    monkeypatch.setattr(settings, "WHATSAPP_APP_SECRET", "app-secret")
+    db = SessionLocal()
+    try:
+        order = Order(shopify_order_id=f"wa-{uuid.uuid4().hex}")
+        db.add(order)
+        db.commit()
+        order_id = order.id
+    finally:
+        db.close()
+    body = whatsapp_reply(f"cancel_{order_id}")
+    events = []
+    monkeypatch.setattr(event_bus, "publish", lambda user_id, event: events.append(event))
+
+    unsigned = client.post("/api/v1/webhooks/whatsapp", content=body)
+    assert unsigned.status_code == 401
+
+    signature = "sha256=" + hmac.new(b"app-secret", body, hashlib.sha256).hexdigest()
+    response = client.post("/api/v1/webhooks/whatsapp", content=body, headers={"X-Hub-Signature-256": signature})
+    assert response.json() == {"status": "received"}
+    db = SessionLocal()
+    try:
+        assert db.query(Order).get(order_id).status.value == "cancelled"
+    finally:
+        db.close()
+    assert [(e["type"], e["status"]) for e in events] == [("status_update", "cancelled")]
+
+def test_per_user_secret_and_cache_invalidation(client, monkeypatch):
+    monkeypatch.setattr(settings, "TASK_BACKEND", "local")
+    user_id = make_user()
+    payload = {"id": uuid.uuid4().int % 10**12, "order_number": 1003}
+    # Cached with the global secret on first use
+    assert post_order(client, user_id, {"id": 1}, secret="wrong").status_code == 401
+
+    db = SessionLocal()
+    try:
+        db.query(User).get(user_id).shopify_webhook_secret = "tenant-secret"
+        db.commit()  # Drops the cached entry
+    finally:
+        db.close()
+
+    assert post_order(client, user_id, payload).status_code == 401
+    assert post_order(client, user_id, payload, secret="tenant-secret").json()["status"] == "success"
+
+def test_inactive_user_is_refused(client):
+    db = SessionLocal()
+    try:
+        user = User(email=f"inactive-{uuid.uuid4().hex}@example.com", hashed_password="x", is_active=False)
+        db.add(user)
+        db.commit()
+        user_id = user.id
+    finally:
+        db.close()
+    assert post_order(client, user_id, {"id": 1}).status_code == 403
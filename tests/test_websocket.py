@@ -0,0 +1,217 @@
+import asyncio
+import json
+import uuid
+import pytest
+from starlette.websockets import WebSocketDisconnect
+from app.core.security import create_access_token
+from app.db.database import SessionLocal
+from app.db.models import User
+from app.services.events import EventBus, LocalEventBackend
+from app.services.websocket import ConnectionManager, DISCONNECT, DROP_OLDEST, manager
+
+class FakeSocket:
+    def __init__(self, fail=False, stalled=False):
+        self.sent = []
+        self.fail = fail
+        self.unblock = asyncio.Event() if stalled else None
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, payload):
+        if self.fail:
+            raise RuntimeError("connection reset")
+        if self.unblock is not None:
+            await self.unblock.wait()
+        self.sent.append(payload)
+
+    async def close(self, code=1000):
+        self.closed = True
+
+def make_user():
+    db = SessionLocal()
+    try:
+        user = User(email=f"ws-{uuid.uuid4().hex}@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+def events(socket):
+    """What the socket received, minus the handshake message."""
+    return [
+        {k: v for k, v in message.items() if k != "epoch"}
+        for message in map(json.loads, socket.sent) if message["type"] not in ("hello", "resync", "ping")
+    ]
+
+def new_manager(queue_size=10, policy=DROP_OLDEST, replay_size=5, max_connections=100, max_per_user=10):
+    return ConnectionManager(
+        queue_size=queue_size, policy=policy, replay_size=replay_size, replay_ttl=60, replay_users=100,
+        max_connections=max_connections, max_per_user=max_per_user, ping_interval=25, pong_timeout=10
+    )
+
+async def settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+def test_events_only_reach_the_owners_sockets():
+    async def run():
+        registry = new_manager()
+        tab_one, tab_two, other_merchant, dead = FakeSocket(), FakeSocket(), FakeSocket(), FakeSocket(fail=True)
+        for socket, user_id in ((tab_one, 1), (tab_two, 1), (dead, 1), (other_merchant, 2)):
+            await registry.connect(socket, user_id)
+        await registry.send_to_user(1, {"type": "new_order"})
+        await settle()
+
+        assert events(tab_one) == events(tab_two) == [{"seq": 1, "type": "new_order"}]
+        assert events(other_merchant) == []
+        assert dead.closed
+        assert registry.stats()["connections"] == 3 # The failed socket was dropped
+
+        registry.disconnect(other_merchant, 2)
+        registry.disconnect(other_merchant, 2) # Already gone: no-op
+        assert registry.stats()["users"] == 1
+
+    asyncio.run(run())
+
+def test_slow_consumer_drops_oldest_without_blocking_others():
+    async def run():
+        registry = new_manager(queue_size=2)
+        slow, fast = FakeSocket(stalled=True), FakeSocket()
+        await registry.connect(slow, 1)
+        await registry.connect(fast, 1)
+
+        for i in range(5):
+            await asyncio.wait_for(registry.send_to_user(1, {"type": "status_update", "n": i}), 0.1) # Never waits on the stalled client
+        await settle()
+        assert len(events(fast)) == 5
+
+        slow.unblock.set()
+        await settle()
+        # The hello was in flight; of the events only the newest two were kept
+        assert [e["n"] for e in events(slow)] == [3, 4]
+        assert registry.stats()["dropped"] == 3
+
+    asyncio.run(run())
+
+def test_slow_consumer_is_disconnected_under_disconnect_policy():
+    async def run():
+        registry = new_manager(queue_size=1, policy=DISCONNECT)
+        slow = FakeSocket(stalled=True)
+        await registry.connect(slow, 1)
+        for i in range(3):
+            await registry.send_to_user(1, {"type": "status_update", "n": i})
+        await settle()
+
+        assert slow.closed
+        assert registry.stats()["slow_disconnects"] == 1
+        assert 1 not in registry.connections
+
+    asyncio.run(run())
+
+def test_websocket_requires_a_valid_token(client):
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/ws/orders"):
+            pass
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/ws/orders?token=not-a-jwt"):
+            pass
+
+def test_websocket_is_registered_under_its_user(client):
+    user_id = make_user()
+    token = create_access_token({"sub": str(user_id)})
+
+    with client.websocket_connect(f"/ws/orders?token={token}"):
+        assert user_id in manager.connections
+
+def test_events_published_from_worker_threads_reach_the_api_loop():
+    bus = EventBus(LocalEventBackend())
+    user_id = 10**9 + uuid.uuid4().int % 10**6
+
+    async def run():
+        await bus.start()
+        socket = FakeSocket()
+        await manager.connect(socket, user_id)
+        try:
+            # As a task running on the local runner or the journal flusher would
+            await asyncio.to_thread(bus.publish, user_id, {"type": "status_update", "status": "confirmed"})
+            await settle()
+            assert events(socket) == [{"seq": 1, "type": "status_update", "status": "confirmed"}]
+        finally:
+            manager.disconnect(socket, user_id)
+            await bus.stop()
+
+    asyncio.run(run())
+    assert bus.stats()["published"] == 1
+
+def test_reconnecting_dashboard_gets_only_missed_events():
+    async def run():
+        registry = new_manager(replay_size=5)
+        first = FakeSocket()
+        await registry.connect(first, 1)
+        await registry.send_to_user(1, {"type": "new_order", "n": 1})
+        await settle()
+        epoch = json.loads(first.sent[-1])["epoch"]
+        registry.disconnect(first, 1)
+
+        for n in (2, 3): # While the laptop was asleep
+            await registry.send_to_user(1, {"type": "new_order", "n": n})
+        resumed = FakeSocket()
+        await registry.connect(resumed, 1, last_seq=1, epoch=epoch)
+        await settle()
+        assert [e["n"] for e in events(resumed)] == [2, 3]
+
+        # Too far behind: the gap was evicted, so resync instead of replaying
+        for n in range(4, 12):
+            await registry.send_to_user(1, {"type": "new_order", "n": n})
+        behind = FakeSocket()
+        await registry.connect(behind, 1, last_seq=3, epoch=epoch)
+        await settle()
+        assert json.loads(behind.sent[0]) == {"type": "resync", "seq": 11, "epoch": epoch}
+
+        # Another process (or a restart) numbers events differently
+        stranger = FakeSocket()
+        await registry.connect(stranger, 1, last_seq=11, epoch="other")
+        await settle()
+        assert json.loads(stranger.sent[0])["type"] == "resync"
+        assert registry.stats()["replayed"] == 2
+
+    asyncio.run(run())
+
+def test_heartbeats_ping_live_sockets_and_reap_silent_ones():
+    async def run():
+        registry = new_manager()
+        live, asleep = FakeSocket(), FakeSocket()
+        await registry.connect(live, 1)
+        await registry.connect(asleep, 1)
+        now = asyncio.get_running_loop().time()
+        registry.connections[1][live].last_ping = now - 30 # Due for a ping
+        registry.connections[1][asleep].last_seen = now - 40 # Missed a ping and its pong window
+
+        registry.check_heartbeats()
+        await settle()
+
+        assert json.loads(live.sent[-1]) == {"type": "ping"}
+        assert asleep.closed
+        registry.touch(live, 1)
+        assert list(registry.connections[1]) == [live]
+        assert registry.stats()["reaped"] == 1
+
+    asyncio.run(run())
+
+def test_connection_caps_reject_new_sockets():
+    async def run():
+        registry = new_manager(max_connections=3, max_per_user=2)
+        assert await registry.connect(FakeSocket(), 1)
+        assert await registry.connect(FakeSocket(), 1)
+        third_tab = FakeSocket()
+        assert not await registry.connect(third_tab, 1)
+        assert third_tab.closed
+        assert await registry.connect(FakeSocket(), 2)
+        assert not await registry.connect(FakeSocket(), 3) # Process-wide cap
+        assert registry.stats()["rejected"] == 2
+        assert registry.stats()["connections"] == 3
+
+    asyncio.run(run())
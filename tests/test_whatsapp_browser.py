@@ -0,0 +1,82 @@
+import os
+from app.core.config import settings
+from app.services.whatsapp_browser import SeleniumWhatsApp, COUNT_OUTGOING_SCRIPT, FIND_OUTGOING_STATE_SCRIPT, LAST_OUTGOING_STATE_SCRIPT
+
+class FakeButton:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def is_displayed(self):
+        return True
+
+    def is_enabled(self):
+        return True
+
+    def click(self):
+        self.driver.clicked = True
+
+class FakeDriver:
+    """Mimics WhatsApp Web: the new bubble shows a clock, then a tick."""
+
+    def __init__(self, states, found=None):
+        self.states = list(states)
+        self.found = found # Icon of the message check() looks for
+        self.clicked = False
+        self.page_loads = 0
+
+    def execute_script(self, script, *args):
+        if script == COUNT_OUTGOING_SCRIPT:
+            return 3
+        if script == LAST_OUTGOING_STATE_SCRIPT:
+            if not self.clicked:
+                return None
+            return self.states.pop(0) if len(self.states) > 1 else self.states[0]
+        if script == FIND_OUTGOING_STATE_SCRIPT:
+            return self.found
+        return None
+
+    def find_element(self, by, value):
+        return FakeButton(self)
+
+    def get(self, url):
+        self.page_loads += 1
+
+def make_bot(states, found=None):
+    bot = SeleniumWhatsApp(user_id=1)
+    bot.driver = FakeDriver(states, found)
+    return bot
+
+def test_send_returns_as_soon_as_message_is_ticked():
+    bot = make_bot(["msg-time", "msg-time", "msg-check"])
+    result = bot.send("+15550001", "hello", ack_timeout=2)
+    assert result.status == "sent"
+    assert result.state == "msg-check"
+    assert result.latency_ms < 2000
+    assert bot.driver.page_loads == 0
+
+def test_send_reports_timeout_when_message_stays_pending():
+    bot = make_bot(["msg-time"])
+    result = bot.send("+15550001", "hello", ack_timeout=0.3)
+    assert result.status == "timeout"
+    assert not result.ok
+
+def test_send_reports_failed_bubble():
+    bot = make_bot(["msg-error"])
+    result = bot.send("+15550001", "hello", ack_timeout=2)
+    assert result.status == "failed"
+
+def test_check_finds_an_earlier_send_by_its_tick():
+    assert make_bot([], found="msg-dblcheck").check("+15550001", "hello").status == "sent"
+    assert make_bot([], found="msg-time").check("+15550001", "hello").status == "timeout" # Still pending
+    missing = make_bot([], found=None).check("+15550001", "hello")
+    assert missing.status == "failed" # Never reached the chat; safe to resend
+    assert missing.error == "Message not found in the chat"
+
+def test_profile_lock_lives_in_the_lock_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SELENIUM_LOCK_DIR", str(tmp_path))
+    bot = SeleniumWhatsApp(user_id=7)
+    bot._acquire_profile_lock(timeout=1)
+    try:
+        assert os.path.exists(tmp_path / "7.lock")
+    finally:
+        bot._release_profile_lock()
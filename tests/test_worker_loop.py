@@ -0,0 +1,42 @@
+import asyncio
+import threading
+import time
+from app.worker.loop import WorkerLoop
+
+def test_tasks_share_one_persistent_loop():
+    worker = WorkerLoop(max_in_flight=10)
+
+    async def current_loop():
+        return asyncio.get_running_loop()
+
+    try:
+        first = worker.run(current_loop(), timeout=2)
+        second = worker.run(current_loop(), timeout=2)
+        assert first is second
+        assert not first.is_closed()
+    finally:
+        worker.stop()
+
+def test_submit_bounds_concurrency():
+    worker = WorkerLoop(max_in_flight=2)
+    peak = 0
+    release = threading.Event()
+
+    async def job():
+        nonlocal peak
+        peak = max(peak, worker.in_flight)
+        while not release.is_set():
+            await asyncio.sleep(0.01)
+
+    try:
+        futures = [worker.submit(job()) for _ in range(5)]
+        deadline = time.monotonic() + 2
+        while worker.in_flight < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        release.set()
+        for f in futures:
+            f.result(timeout=2)
+        assert peak == 2
+    finally:
+        worker.stop()